@@ -0,0 +1,47 @@
+"""Build the offline IP geolocation database read by GeoIPDatabase
+
+Input is a CSV of IPv4 ranges with a header row naming at least
+start, end, latitude, longitude and country columns (for example a
+DB-IP or IP2Location "lite" city export renamed to those headers).
+Addresses may be dotted quads or integers; IPv6 rows are skipped.
+
+Usage:
+    python build_geoip.py ranges.csv geoip.bin
+    GEOIP_DATABASE=geoip.bin uvicorn --factory server:create_app
+"""
+import argparse
+import csv
+import ipaddress
+import sys
+
+from vpn.geo import write_geoip_database
+
+
+def parse_address(value):
+    value = value.strip()
+    address = ipaddress.ip_address(int(value) if value.isdigit() else value)
+    return int(address) if address.version == 4 else None
+
+
+def read_ranges(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            start, end = parse_address(row["start"]), parse_address(row["end"])
+            if start is None or end is None:
+                continue
+            yield start, end, float(row["latitude"]), float(row["longitude"]), row["country"].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the GeoIP range database from a CSV export")
+    parser.add_argument("source", help="CSV with start,end,latitude,longitude,country columns")
+    parser.add_argument("output", help="database file to write (GEOIP_DATABASE)")
+    args = parser.parse_args()
+
+    count = write_geoip_database(args.output, read_ranges(args.source))
+    print(f"Wrote {count} IPv4 ranges to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Review and repair duplicates that keep a unique index from being built
+
+Startup logs an error and leaves such an index unbuilt instead of
+rewriting data. This lists, per collection, the users that would be
+merged into the earliest one sharing their email and the active
+connections that would be closed, keeping each user's newest. Nothing
+changes without --apply, which repairs them and then builds the indexes.
+Exits 1 while duplicates or unbuilt indexes remain.
+
+Usage:
+    python repair_duplicates.py
+    python repair_duplicates.py --apply
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from vpn.db import Settings, mongo
+from vpn.indexes import DUPLICATE_REPAIRS, ensure_indexes
+
+
+async def repair(apply):
+    mongo.connect(Settings())
+    try:
+        found = 0
+        for collection_name, repair_collection in DUPLICATE_REPAIRS.items():
+            for group in await repair_collection(apply=apply):
+                found += 1
+                print(json.dumps({"collection": collection_name, **group}))
+        if apply:
+            blocked = await ensure_indexes()
+            if blocked:
+                print(f"Still blocked: {', '.join(blocked)}", file=sys.stderr)
+                return 1
+        return 0 if apply or not found else 1
+    finally:
+        mongo.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List duplicate users and active connections, and optionally repair them")
+    parser.add_argument("--apply", action="store_true", help="merge and close the duplicates, then build the indexes")
+    args = parser.parse_args()
+
+    return asyncio.run(repair(args.apply))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
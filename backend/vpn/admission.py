@@ -0,0 +1,132 @@
+"""Atomic connect/disconnect admission against server capacity"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from vpn.repositories import (
+    ServerRepository, ConnectionRepository, servers_repo, connections_repo, stats_repo, rollups_repo
+)
+from vpn.catalog import server_recommender
+from vpn.events import publish_connection_change
+
+logger = logging.getLogger(__name__)
+
+# Connection admission
+async def record_bookkeeping(*writes) -> None:
+    """Apply derived counters; failures are left for the reconcilers to correct"""
+    for result in await asyncio.gather(*writes, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error("Connection bookkeeping failed: %r", result)
+
+class ConnectionAdmission:
+    """Admits and releases VPN connections while keeping server counters exact"""
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, servers: ServerRepository, connections: ConnectionRepository):
+        self.servers = servers
+        self.connections = connections
+
+    async def connect(self, user_id: str, server_id: str) -> Dict[str, Any]:
+        server = await self.servers.reserve_slot(server_id)
+        if not server:
+            existing = await self.servers.get(server_id)
+            if not existing:
+                raise HTTPException(status_code=404, detail="Server not found")
+            if existing["status"] != "online":
+                raise HTTPException(status_code=400, detail="Server is not available")
+            # Reconnecting to a full server can reuse the slot the user already holds there
+            if await self._close_on(user_id, server_id):
+                server = await self.servers.reserve_slot(server_id)
+            if not server:
+                raise HTTPException(status_code=503, detail="Server is at full capacity")
+
+        admitted = None
+        try:
+            for _ in range(self.MAX_ATTEMPTS):
+                # Implicitly disconnect from any existing connection
+                await self._close_all(user_id)
+                connected_at = datetime.utcnow()
+                connection_data = {
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "server_id": server_id,
+                    "connected_at": connected_at,
+                    "last_heartbeat": connected_at,
+                    "status": "active"
+                }
+                try:
+                    await self.connections.create(connection_data)
+                except DuplicateKeyError:
+                    # A concurrent connect for this user won the race; close it and retry
+                    continue
+                admitted = connection_data
+                break
+        finally:
+            if admitted is None:
+                await self.servers.release_slot(server_id)
+        if admitted is None:
+            raise HTTPException(status_code=409, detail="Concurrent connection attempt, please retry")
+
+        server_recommender.adjust(server_id, 1)
+        publish_connection_change(user_id, "connected", admitted)
+        await record_bookkeeping(
+            stats_repo.record_connect(admitted["connected_at"]),
+            self._record_rollup(server_id, admitted["connected_at"], {"connects": 1}, server["current_connections"])
+        )
+        return {"connection": admitted, "server": server}
+
+    async def disconnect(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._close_one(user_id)
+
+    async def _close_one(self, user_id: str) -> Optional[Dict[str, Any]]:
+        closed = await self.connections.close_active(user_id, datetime.utcnow())
+        if closed:
+            level = await self.servers.release_slot(closed["server_id"])
+            server_recommender.adjust(closed["server_id"], -1)
+            publish_connection_change(user_id, "disconnected", closed)
+            await record_bookkeeping(
+                stats_repo.increment(active_connections=-1),
+                self._record_rollup(
+                    closed["server_id"],
+                    closed["disconnected_at"],
+                    {"disconnects": 1, "total_duration": closed.get("duration") or 0},
+                    level
+                )
+            )
+        return closed
+
+    async def _record_rollup(
+        self,
+        server_id: str,
+        when: datetime,
+        increments: Dict[str, int],
+        level: Optional[int]
+    ) -> None:
+        """Record a rollup event, raising the bucket peak to the server's slot counter
+
+        The level is what reserve_slot or release_slot saw, so the live peak
+        costs no extra query. That counter also holds unaccounted (seeded)
+        slots; backfill_rollups replaces peaks with the exact count of open
+        connection rows.
+        """
+        await rollups_repo.record(server_id, when, increments, peak_concurrent=level)
+
+    async def _close_on(self, user_id: str, server_id: str) -> bool:
+        """Close the user's active connection if it is on this server"""
+        active = await self.connections.get_active(user_id)
+        if not active or active["server_id"] != server_id:
+            return False
+        return await self._close_one(user_id) is not None
+
+    async def _close_all(self, user_id: str) -> None:
+        while await self._close_one(user_id):
+            pass
+
+connection_admission = ConnectionAdmission(servers_repo, connections_repo)
@@ -0,0 +1,584 @@
+"""HTTP and WebSocket routes"""
+
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+
+from vpn.config import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EVENT_KEEPALIVE_SECONDS, HEARTBEAT_INTERVAL_SECONDS,
+    STATS_WINDOW_DAYS, ROLLUP_DEFAULT_RANGE
+)
+from vpn.metrics import metrics
+from vpn.models import User, Server, AuthResponse
+from vpn.pagination import encode_cursor, decode_cursor, as_naive_utc, stream_ndjson
+from vpn.repositories import (
+    ConnectionRepository, StatsRepository, users_repo, sessions_repo, servers_repo,
+    connections_repo, stats_repo, rollups_repo
+)
+from vpn.auth import session_cache, auth_provider, resolve_session_user, get_current_user, get_admin_user
+from vpn.catalog import (
+    server_catalog, etag_matches, not_modified, cached_json, server_recommender, attach_server_info
+)
+from vpn.geo import geoip, server_locator
+from vpn.events import event_bus, publish_server_change
+from vpn.indexes import explain_hot_queries
+from vpn.admission import connection_admission
+from vpn.throttle import connect_throttle, login_throttle
+from vpn.heartbeats import heartbeat_monitor
+from vpn.usage import usage_ingestor, verify_node_key
+from vpn.bulk import upload_format, iter_upload_file, iter_upload_rows, validate_server_update, ServerBulkWriter
+from vpn.stats import reconcile_stats, backfill_rollups
+from vpn.archive import connection_archiver
+from vpn.health import health_prober
+from vpn.export import EXPORT_ENCODERS, stream_connection_export
+
+router = APIRouter()
+
+# API Routes
+
+@router.get("/")
+async def root():
+    return {"message": "VPN Service Management API", "status": "running"}
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Per-route latency and Mongo command metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.post("/api/auth/profile", response_model=AuthResponse)
+async def auth_profile(request: Request, response: Response, x_session_id: str = Header(...)):
+    """Authenticate user with Emergent auth and create session"""
+    # Keyed by client IP: the session ID is chosen by the client, so a new one per try would dodge the limit
+    async with login_throttle.admit(request.client.host if request.client else ""):
+        try:
+            # Call Emergent auth API
+            auth_data = await auth_provider.get_session_data(x_session_id)
+        
+            # Create or get user
+            user_data = {
+                "id": auth_data["id"],
+                "email": auth_data["email"],
+                "name": auth_data["name"],
+                "picture": auth_data.get("picture"),
+                "role": "user",
+                "created_at": datetime.utcnow(),
+                "last_login": datetime.utcnow()
+            }
+        
+            # Check if user exists
+            existing_user = await users_repo.get_by_email(auth_data["email"])
+            if existing_user:
+                # Update last login
+                await users_repo.touch_last_login(auth_data["email"], datetime.utcnow())
+                user_data = existing_user
+                user_data["last_login"] = datetime.utcnow()
+            else:
+                # Create new user
+                existing_user = await users_repo.create(user_data)
+                if existing_user:
+                    user_data = existing_user
+                else:
+                    await stats_repo.increment(total_users=1)
+        
+            # Create session
+            session_token = auth_data["session_token"]
+            session_data = {
+                "session_token": session_token,
+                "user_id": user_data["id"],
+                "created_at": datetime.utcnow(),
+                "expires_at": datetime.utcnow() + timedelta(days=7)
+            }
+        
+            # Remove existing sessions for this user
+            await sessions_repo.replace_for_user(user_data["id"], session_data)
+            await session_cache.invalidate_user(user_data["id"])
+        
+            # Set cookie
+            response.set_cookie(
+                key="session_token",
+                value=session_token,
+                max_age=7 * 24 * 60 * 60,  # 7 days
+                httponly=True,
+                secure=True,
+                samesite="none",
+                path="/"
+            )
+        
+            return AuthResponse(
+                user=User(**user_data),
+                session_token=session_token
+            )
+    
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Authentication failed: {str(e)}")
+
+@router.get("/api/auth/me", response_model=User)
+async def get_me(current_user: User = Depends(get_current_user)):
+    """Get current user profile"""
+    return current_user
+
+@router.post("/api/auth/logout")
+async def logout(response: Response, current_user: User = Depends(get_current_user)):
+    """Logout user and clear session"""
+    await sessions_repo.delete_for_user(current_user.id)
+    await session_cache.invalidate_user(current_user.id)
+    response.delete_cookie(key="session_token", path="/")
+    return {"message": "Logged out successfully"}
+
+@router.get("/api/servers", response_model=List[Server])
+async def get_servers(request: Request, current_user: User = Depends(get_current_user)):
+    """Get all available VPN servers"""
+    catalog = await server_catalog.snapshot()
+    if etag_matches(request, catalog.etag):
+        return not_modified(catalog.etag)
+    return cached_json(catalog.body, catalog.etag)
+
+@router.get("/api/servers/countries")
+async def get_countries(request: Request, current_user: User = Depends(get_current_user)):
+    """Get list of available countries"""
+    catalog = await server_catalog.snapshot()
+    if etag_matches(request, catalog.countries_etag):
+        return not_modified(catalog.countries_etag)
+    return cached_json(catalog.countries_body, catalog.countries_etag)
+
+@router.get("/api/servers/recommend", response_model=Server)
+async def recommend_server(country: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Get the least loaded online server, optionally within one country"""
+    server = await server_recommender.recommend(country)
+    if not server:
+        raise HTTPException(status_code=404, detail="No available server")
+    return ORJSONResponse(server.model_dump())
+
+@router.get("/api/servers/nearest")
+async def nearest_servers(
+    request: Request,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    limit: int = Query(5, ge=1, le=50),
+    country: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Get the online servers closest to lat/lon, or to the caller's IP address when omitted"""
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="Pass both lat and lon, or neither")
+    if lat is None:
+        location = geoip.lookup(request.client.host if request.client else None)
+        if location is None:
+            raise HTTPException(status_code=404, detail="Could not locate the caller; pass lat and lon")
+        origin = {**location._asdict(), "source": "ip"}
+        lat, lon = location.latitude, location.longitude
+    else:
+        origin = {"latitude": lat, "longitude": lon, "country": None, "source": "query"}
+    ranked = await server_locator.nearest(lat, lon, limit, country)
+    return ORJSONResponse({
+        "origin": origin,
+        "servers": [{**server.model_dump(), "distance_km": round(km, 1)} for server, km in ranked]
+    })
+
+@router.post("/api/servers/{server_id}/connect")
+async def connect_to_server(server_id: str, current_user: User = Depends(get_current_user)):
+    """Connect to a VPN server"""
+    async with connect_throttle.admit(current_user.id):
+        admitted = await connection_admission.connect(current_user.id, server_id)
+    
+    return {
+        "message": f"Connected to {admitted['server']['name']}",
+        "connection_id": admitted["connection"]["id"]
+    }
+
+@router.post("/api/connections/disconnect")
+async def disconnect(current_user: User = Depends(get_current_user)):
+    """Disconnect from current VPN server"""
+    closed = await connection_admission.disconnect(current_user.id)
+    
+    if not closed:
+        raise HTTPException(status_code=400, detail="No active connection found")
+    
+    return {"message": "Disconnected successfully"}
+
+@router.get("/api/connections/history")
+async def get_connection_history(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    server_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Get user's connection history, newest first, one keyset page at a time"""
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    query = ConnectionRepository.history_filter(current_user.id, start, end, server_id)
+    after_key = decode_cursor(after) if after else None
+    
+    # The summary covers the whole filtered history, so only the first page computes it
+    if after_key:
+        connections = await connection_archiver.history(query, limit, after_key, start)
+        summary = None
+    else:
+        connections, summary = await asyncio.gather(
+            connection_archiver.history(query, limit, None, start),
+            connection_archiver.history_summary(query, start)
+        )
+    
+    next_cursor = None
+    if len(connections) > limit:
+        connections = connections[:limit]
+        next_cursor = encode_cursor(connections[-1]["connected_at"], connections[-1]["id"])
+    
+    # Add server info to connections
+    await attach_server_info(connections)
+    
+    return ORJSONResponse({"connections": connections, "next_cursor": next_cursor, "summary": summary})
+
+@router.post("/api/connections/heartbeat")
+async def connection_heartbeat(current_user: User = Depends(get_current_user)):
+    """Keep the current connection alive; pings are coalesced and written in bulk"""
+    heartbeat_monitor.beat(current_user.id)
+    return {"status": "ok", "interval_seconds": HEARTBEAT_INTERVAL_SECONDS}
+
+@router.get("/api/connections/current")
+async def get_current_connection(current_user: User = Depends(get_current_user)):
+    """Get current active connection"""
+    connection = await connections_repo.get_active(current_user.id)
+    
+    if not connection:
+        return {"connection": None}
+    
+    await attach_server_info([connection], default="Unknown")
+    
+    return ORJSONResponse({"connection": connection})
+
+@router.get("/api/events")
+async def stream_events(request: Request, current_user: User = Depends(get_current_user)):
+    """Push catalog deltas and the user's connection changes as Server-Sent Events"""
+    queue = event_bus.subscribe(current_user.id)
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield event.sse
+        finally:
+            event_bus.unsubscribe(current_user.id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/api/ws")
+async def events_websocket(websocket: WebSocket):
+    """Same event feed as /api/events over a WebSocket"""
+    token = websocket.cookies.get("session_token") or websocket.query_params.get("token")
+    try:
+        user = await resolve_session_user(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    queue = event_bus.subscribe(user.id)
+    
+    async def forward():
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.send_text('{"type": "keepalive"}')
+                continue
+            await websocket.send_text(event.json)
+    
+    # Watch for the client's close so idle sockets unsubscribe at once and never send into a closed one
+    sender = asyncio.create_task(forward())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_bus.unsubscribe(user.id, queue)
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+
+@router.post("/api/usage", status_code=202)
+async def ingest_usage(request: Request, node: None = Depends(verify_node_key)):
+    """Accept a batch of traffic samples from a VPN node"""
+    try:
+        body = json.loads(await request.body())
+        samples = body["samples"]
+        if not isinstance(samples, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=422, detail='Expected {"samples": [...]}')
+    
+    accepted = usage_ingestor.ingest(samples)
+    return {"accepted": accepted}
+
+# Admin routes
+@router.get("/api/admin/users")
+async def get_all_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get users a page at a time, or stream them all as NDJSON (admin only)"""
+    after_key = decode_cursor(after) if after else None
+    if format == "ndjson":
+        return StreamingResponse(stream_ndjson(users_repo.stream(after_key)), media_type="application/x-ndjson")
+    
+    users = await users_repo.page(after_key, limit)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1]["created_at"], users[-1]["id"])
+    return ORJSONResponse({"users": users, "next_cursor": next_cursor})
+
+@router.get("/api/admin/servers", response_model=List[Server])
+async def get_all_servers_admin(request: Request, admin_user: User = Depends(get_admin_user)):
+    """Get all servers with admin details"""
+    catalog = await server_catalog.snapshot()
+    if etag_matches(request, catalog.etag):
+        return not_modified(catalog.etag)
+    return cached_json(catalog.body, catalog.etag)
+
+@router.post("/api/admin/servers")
+async def create_server(server_data: dict, admin_user: User = Depends(get_admin_user)):
+    """Create new VPN server"""
+    server = {
+        "id": str(uuid.uuid4()),
+        "name": server_data["name"],
+        "country": server_data["country"],
+        "city": server_data["city"],
+        "ip_address": server_data["ip_address"],
+        "latitude": server_data.get("latitude"),
+        "longitude": server_data.get("longitude"),
+        "status": server_data.get("status", "offline"),
+        "status_source": "admin",
+        "load": 0,
+        "max_connections": server_data.get("max_connections", 1000),
+        "probe_port": server_data.get("probe_port"),
+        "current_connections": 0,
+        "created_at": datetime.utcnow()
+    }
+    try:
+        await servers_repo.create(server)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await stats_repo.increment(total_servers=1, online_servers=int(server["status"] == "online"))
+    await server_catalog.bump()
+    publish_server_change("created", server["id"], server)
+    return {"message": "Server created successfully", "server_id": server["id"]}
+
+@router.post("/api/admin/servers/bulk")
+async def bulk_servers(
+    request: Request,
+    ordered: bool = True,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    admin_user: User = Depends(get_admin_user)
+):
+    """Create, update or delete servers from a streamed JSON array, NDJSON or CSV body or upload (admin only)"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing file upload")
+        rows = iter_upload_rows(iter_upload_file(upload), upload_format(upload.content_type or "", upload.filename or ""))
+    else:
+        rows = iter_upload_rows(request.stream(), upload_format(content_type))
+    writer = ServerBulkWriter(servers_repo, ordered)
+
+    if format == "ndjson":
+        async def stream_results():
+            async for result in writer.run(rows):
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"summary": writer.summary, "aborted": writer.aborted}) + "\n"
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    results = [result async for result in writer.run(rows)]
+    return {"ordered": ordered, "aborted": writer.aborted, "summary": writer.summary, "results": results}
+
+@router.put("/api/admin/servers/{server_id}")
+async def update_server(server_id: str, server_data: dict, admin_user: User = Depends(get_admin_user)):
+    """Update VPN server"""
+    try:
+        server_data = validate_server_update(server_data)
+        previous = await servers_repo.update(server_id, server_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not previous:
+        raise HTTPException(status_code=404, detail="Server not found")
+    
+    if "status" in server_data:
+        was_online = previous.get("status") == "online"
+        is_online = server_data["status"] == "online"
+        if was_online != is_online:
+            await stats_repo.increment(online_servers=1 if is_online else -1)
+    await server_catalog.bump()
+    publish_server_change("updated", server_id, server_data)
+    return {"message": "Server updated successfully"}
+
+@router.delete("/api/admin/servers/{server_id}")
+async def delete_server(server_id: str, admin_user: User = Depends(get_admin_user)):
+    """Delete VPN server"""
+    deleted = await servers_repo.delete(server_id)
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Server not found")
+    
+    await stats_repo.increment(total_servers=-1, online_servers=-int(deleted.get("status") == "online"))
+    await server_catalog.bump()
+    publish_server_change("deleted", server_id)
+    return {"message": "Server deleted successfully"}
+
+@router.get("/api/admin/stats")
+async def get_admin_stats(admin_user: User = Depends(get_admin_user)):
+    """Get admin dashboard statistics"""
+    totals = await stats_repo.get_totals()
+    
+    # Get connection stats for last 7 days
+    today = datetime.utcnow()
+    days = [StatsRepository.day_key(today - timedelta(days=offset)) for offset in range(STATS_WINDOW_DAYS)]
+    recent_connections = await stats_repo.sum_days(days)
+    
+    return {
+        "total_users": totals.get("total_users", 0),
+        "total_servers": totals.get("total_servers", 0),
+        "online_servers": totals.get("online_servers", 0),
+        "active_connections": totals.get("active_connections", 0),
+        "recent_connections": recent_connections
+    }
+
+@router.post("/api/admin/stats/reconcile")
+async def reconcile_admin_stats(admin_user: User = Depends(get_admin_user)):
+    """Recompute dashboard counters from the source collections"""
+    await reconcile_stats()
+    return {"message": "Statistics reconciled successfully"}
+
+@router.get("/api/admin/stats/timeseries")
+async def get_stats_timeseries(
+    granularity: str = Query("hour", pattern="^(hour|day)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    server_id: Optional[str] = None,
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get per-server connection rollups for a time range (admin only)"""
+    end = as_naive_utc(end) or datetime.utcnow()
+    start = as_naive_utc(start) or end - ROLLUP_DEFAULT_RANGE[granularity]
+    buckets = await rollups_repo.series(granularity, start, end, server_id)
+    return ORJSONResponse({"granularity": granularity, "from": start, "to": end, "buckets": buckets})
+
+@router.post("/api/admin/stats/timeseries/backfill")
+async def backfill_stats_timeseries(
+    days: int = Query(30, ge=1, le=366),
+    admin_user: User = Depends(get_admin_user)
+):
+    """Rebuild rollups from connection history (admin only)"""
+    counts = await backfill_rollups(datetime.utcnow() - timedelta(days=days))
+    return {"message": "Rollups rebuilt successfully", "buckets": counts}
+
+@router.put("/api/admin/users/{user_id}/role")
+async def update_user_role(user_id: str, role_data: dict, admin_user: User = Depends(get_admin_user)):
+    """Update user role"""
+    if role_data["role"] not in ["user", "admin"]:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    
+    matched = await users_repo.set_role(user_id, role_data["role"])
+    
+    if matched == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    await session_cache.invalidate_user(user_id)
+    return {"message": "User role updated successfully"}
+
+@router.get("/api/admin/indexes")
+async def get_index_report(admin_user: User = Depends(get_admin_user)):
+    """Report the query plan of every hot query (admin only)"""
+    queries = await explain_hot_queries()
+    return {"all_indexed": all(query["indexed"] for query in queries), "queries": queries}
+
+@router.get("/api/admin/usage/ingestion")
+async def get_usage_ingestion_stats(admin_user: User = Depends(get_admin_user)):
+    """Get usage ingestion buffer counters (admin only)"""
+    return usage_ingestor.stats()
+
+@router.get("/api/admin/connections/heartbeats")
+async def get_heartbeat_stats(admin_user: User = Depends(get_admin_user)):
+    """Get heartbeat coalescing and stale connection reaper counters (admin only)"""
+    return heartbeat_monitor.stats()
+
+@router.post("/api/admin/connections/reap")
+async def reap_stale_connections(admin_user: User = Depends(get_admin_user)):
+    """Close connections with no recent heartbeat now (admin only)"""
+    return {"reaped": await heartbeat_monitor.reap()}
+
+@router.get("/api/admin/connections/export")
+async def export_connections(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    server_id: Optional[str] = None,
+    admin_user: User = Depends(get_admin_user)
+):
+    """Stream connections with server name and country as CSV, NDJSON or Parquet (admin only)"""
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    encoder = EXPORT_ENCODERS[format]()
+    query = ConnectionRepository.export_filter(start, end, server_id)
+    return StreamingResponse(
+        stream_connection_export(encoder, query, start),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="connections.{encoder.extension}"'}
+    )
+
+@router.get("/api/admin/connections/archive")
+async def get_archive_stats(admin_user: User = Depends(get_admin_user)):
+    """Get connection archive counters (admin only)"""
+    return connection_archiver.stats()
+
+@router.post("/api/admin/connections/archive")
+async def archive_connections(admin_user: User = Depends(get_admin_user)):
+    """Move disconnected connections past ARCHIVE_AFTER_DAYS to the archive now (admin only)"""
+    return {"archived": await connection_archiver.archive_old()}
+
+@router.get("/api/admin/servers/health")
+async def get_health_probe_stats(admin_user: User = Depends(get_admin_user)):
+    """Get server health prober counters (admin only)"""
+    return health_prober.stats()
+
+@router.post("/api/admin/servers/health/probe")
+async def probe_servers(admin_user: User = Depends(get_admin_user)):
+    """Probe every online and offline server now and update status, latency and load (admin only)"""
+    return await health_prober.sweep()
+
+@router.get("/api/admin/admission")
+async def get_admission_stats(admin_user: User = Depends(get_admin_user)):
+    """Get connect and login admission control counters (admin only)"""
+    return {"connect": connect_throttle.stats(), "login": login_throttle.stats()}
+
+@router.get("/api/admin/geoip")
+async def get_geoip_stats(admin_user: User = Depends(get_admin_user)):
+    """Get IP geolocation database and /24 cache counters (admin only)"""
+    return geoip.stats()
+
+@router.get("/api/admin/cache/sessions")
+async def get_session_cache_stats(admin_user: User = Depends(get_admin_user)):
+    """Get session cache counters (admin only)"""
+    return session_cache.stats()
@@ -0,0 +1,156 @@
+"""Hot/cold tiering of connection history"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from vpn.config import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_SECONDS, ARCHIVE_BATCH_SIZE, ARCHIVE_PARQUET_DIR,
+    ARCHIVE_CLAIM_TIMEOUT, ARCHIVE_PARQUET_COLUMNS
+)
+from vpn.repositories import ConnectionRepository, connections_repo, archived_connections_repo
+
+logger = logging.getLogger(__name__)
+
+# Connection archive
+def write_archive_parquet(connections: List[Dict[str, Any]], directory: str, archive_id: str) -> int:
+    """Write one zstd-compressed Parquet file per connected_at month and return how many were written"""
+    import pandas as pd
+
+    frame = pd.DataFrame(connections, columns=ARCHIVE_PARQUET_COLUMNS)
+    for column in ("connected_at", "disconnected_at", "last_usage_at", "last_heartbeat"):
+        frame[column] = pd.to_datetime(frame[column])
+    files = 0
+    for month, part in frame.groupby(frame["connected_at"].dt.strftime("%Y-%m")):
+        partition = os.path.join(directory, f"month={month}")
+        os.makedirs(partition, exist_ok=True)
+        part.to_parquet(os.path.join(partition, f"{archive_id}.parquet"), compression="zstd", index=False)
+        files += 1
+    return files
+
+class ConnectionArchiver:
+    """Moves old disconnected connections out of the hot collection and reads history through to them
+
+    Each batch is claimed with an archive_id, copied to the archive
+    collection (and to month-partitioned Parquet files when
+    ARCHIVE_PARQUET_DIR is set) and only then deleted from the hot
+    collection, so a failure part-way leaves every row readable.
+    Archived rows disconnected, and so connected, before the hot window
+    start, which lets newer history pages skip the archive entirely. A
+    row's archived_at equals the archive_claimed_at of its hot copy, so
+    readers can tell which archive rows may still have one.
+    """
+
+    def __init__(self, connections: ConnectionRepository, archive: ConnectionRepository):
+        self.connections = connections
+        self.archive = archive
+        self.enabled = ARCHIVE_AFTER_DAYS > 0
+        self._lock = asyncio.Lock()
+        self.archived = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.parquet_files = 0
+        self.last_run_at: Optional[datetime] = None
+
+    def hot_window_start(self) -> datetime:
+        return datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+    def reaches_archive(self, start: Optional[datetime]) -> bool:
+        return self.enabled and (start is None or start < self.hot_window_start())
+
+    async def history(
+        self,
+        query: Dict[str, Any],
+        limit: int,
+        after: Optional[tuple],
+        start: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """One keyset page of history across the hot and archive collections, newest first"""
+        connections = await self.connections.history(query, limit, after)
+        if not self.reaches_archive(start):
+            return connections
+        if len(connections) > limit and connections[-1]["connected_at"] >= self.hot_window_start():
+            return connections
+        seen = {connection["id"] for connection in connections}
+        connections += [
+            connection for connection in await self.archive.history(query, limit, after)
+            if connection["id"] not in seen
+        ]
+        connections.sort(key=lambda connection: (connection["connected_at"], connection["id"]), reverse=True)
+        return connections[:limit + 1]
+
+    async def history_summary(self, query: Dict[str, Any], start: Optional[datetime]) -> Dict[str, Any]:
+        if not self.reaches_archive(start):
+            return ConnectionRepository.summarize(await self.connections.history_totals(query))
+        return ConnectionRepository.summarize(*await asyncio.gather(
+            self.connections.history_totals(query),
+            self.archive.history_totals(query)
+        ))
+
+    async def archive_old(self) -> int:
+        """Archive disconnected connections older than ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE at a time"""
+        if not self.enabled:
+            return 0
+        async with self._lock:
+            now = datetime.utcnow()
+            cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+            reclaim_before = now - ARCHIVE_CLAIM_TIMEOUT
+            total = 0
+            while True:
+                candidates = await self.connections.archivable_ids(cutoff, reclaim_before, ARCHIVE_BATCH_SIZE)
+                if not candidates:
+                    break
+                archive_id = str(uuid.uuid4())
+                claimed_at = datetime.utcnow()
+                claimed = await self.connections.claim_for_archive(
+                    candidates, cutoff, reclaim_before, archive_id, claimed_at
+                )
+                if claimed:
+                    try:
+                        await self._store(claimed, archive_id, claimed_at)
+                    except Exception:
+                        self.failed_batches += 1
+                        logger.exception("Archiving %d connections failed; they stay in the hot collection", len(claimed))
+                        break
+                    await self.connections.delete_archived(candidates, archive_id)
+                    self.batches += 1
+                    total += len(claimed)
+                if len(candidates) < ARCHIVE_BATCH_SIZE:
+                    break
+            self.archived += total
+            self.last_run_at = now
+            return total
+
+    async def _store(self, connections: List[Dict[str, Any]], archive_id: str, when: datetime) -> None:
+        if ARCHIVE_PARQUET_DIR:
+            self.parquet_files += await asyncio.to_thread(
+                write_archive_parquet, connections, ARCHIVE_PARQUET_DIR, archive_id
+            )
+        for connection in connections:
+            connection["archived_at"] = when
+        await self.archive.insert_archived(connections)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+            try:
+                await self.archive_old()
+            except Exception:
+                logger.exception("Connection archiving failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "archive_after_days": ARCHIVE_AFTER_DAYS,
+            "parquet_dir": ARCHIVE_PARQUET_DIR,
+            "archived_connections": self.archived,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "parquet_files": self.parquet_files,
+            "last_run_at": self.last_run_at
+        }
+
+connection_archiver = ConnectionArchiver(connections_repo, archived_connections_repo)
@@ -0,0 +1,346 @@
+"""Session cache, external auth provider client and request authentication"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import Cookie, Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+import httpx
+
+from vpn.config import (
+    SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS, SESSION_CACHE_VERSION_CHECK_SECONDS,
+    SESSION_INVALIDATION_HISTORY, AUTH_PROVIDER_URL, AUTH_PROVIDER_TIMEOUT_SECONDS,
+    AUTH_PROVIDER_MAX_CONCURRENCY, AUTH_PROVIDER_FAILURE_THRESHOLD, AUTH_PROVIDER_RESET_SECONDS,
+    AUTH_PROVIDER_CACHE_TTL_SECONDS, AUTH_PROVIDER_CACHE_SIZE
+)
+from vpn.models import User
+from vpn.repositories import MetaRepository, users_repo, sessions_repo, meta_repo
+
+# Security
+security = HTTPBearer(auto_error=False)
+
+# Session cache
+class SessionCache:
+    """In-process LRU cache of resolved users keyed by session token
+
+    Invalidations bump a shared version document that also keeps the last
+    SESSION_INVALIDATION_HISTORY invalidated user ids. Every worker checks
+    it at most every SESSION_CACHE_VERSION_CHECK_SECONDS and drops those
+    users' sessions, or its whole cache when it has fallen further behind,
+    so a logout or role change reaches all workers within that interval.
+
+    A miss reads the session and user before caching them, and an
+    invalidation can land in between; callers take `generation()` before
+    reading and hand it to `set()`, which then refuses to cache a user
+    dropped since.
+    """
+
+    VERSION_KEY = "session_cache"
+
+    def __init__(
+        self,
+        meta: MetaRepository,
+        max_size: int = SESSION_CACHE_SIZE,
+        ttl_seconds: int = SESSION_CACHE_TTL_SECONDS
+    ):
+        self.meta = meta
+        self.max_size = max_size
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, set] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._generation = 0
+        # user id -> generation of its latest invalidation, for the last SESSION_INVALIDATION_HISTORY users
+        self._dropped_at: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten_through = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.remote_invalidations = 0
+
+    def get(self, token: str) -> Optional[User]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at = entry
+        if expires_at < datetime.utcnow():
+            self._remove(token)
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def generation(self) -> int:
+        """Take before reading what will be cached, and pass to set()"""
+        return self._generation
+
+    def set(self, token: str, user: User, session_expires_at: datetime, generation: Optional[int] = None) -> None:
+        if self.max_size <= 0:
+            return
+        if generation is not None and self._invalidated_since(user.id, generation):
+            return
+        expires_at = min(session_expires_at, datetime.utcnow() + self.ttl)
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (user, expires_at)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Drop the user's cached sessions here and, within a version check, in every other worker"""
+        self._drop_user(user_id)
+        await self.meta.bump_version_with(self.VERSION_KEY, user_id, SESSION_INVALIDATION_HISTORY)
+
+    async def sync(self) -> None:
+        """Apply invalidations made by other workers since the last check"""
+        if time.monotonic() - self._checked_at < SESSION_CACHE_VERSION_CHECK_SECONDS:
+            return
+        async with self._lock:
+            if time.monotonic() - self._checked_at < SESSION_CACHE_VERSION_CHECK_SECONDS:
+                return
+            version, user_ids = await self.meta.get_version_items(self.VERSION_KEY)
+            self._checked_at = time.monotonic()
+            behind = version - self._version if self._version is not None else None
+            if behind is None or behind > len(user_ids) or behind < 0:
+                self._drop_all()
+            elif behind:
+                for user_id in user_ids[len(user_ids) - behind:]:
+                    self._drop_user(user_id)
+                self.remote_invalidations += behind
+            self._version = version
+
+    def clear(self) -> None:
+        self._drop_all()
+        self._version = None
+        self._checked_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": int(self.ttl.total_seconds()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "remote_invalidations": self.remote_invalidations,
+            "version": self._version,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+    def _drop_user(self, user_id: str) -> None:
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(token)
+        self._generation += 1
+        self._dropped_at.pop(user_id, None)
+        self._dropped_at[user_id] = self._generation
+        while len(self._dropped_at) > SESSION_INVALIDATION_HISTORY:
+            _, generation = self._dropped_at.popitem(last=False)
+            self._forgotten_through = generation
+
+    def _drop_all(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+        self._generation += 1
+        self._dropped_at.clear()
+        self._forgotten_through = self._generation
+
+    def _invalidated_since(self, user_id: str, generation: int) -> bool:
+        # Past the remembered history, assume the user was among those dropped
+        return self._forgotten_through > generation or self._dropped_at.get(user_id, 0) > generation
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+session_cache = SessionCache(meta_repo)
+
+# External auth provider
+class CircuitBreaker:
+    """Stops calling a failing dependency until a cool-down has passed"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_flight:
+            # Let a single trial request through to probe the dependency
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """Give up a trial that ended without a verdict, such as a cancelled request"""
+        self._trial_in_flight = False
+
+class AuthProviderClient:
+    """Pooled, bounded and circuit-broken client for the Emergent session-data endpoint"""
+
+    def __init__(
+        self,
+        url: str = AUTH_PROVIDER_URL,
+        timeout: float = AUTH_PROVIDER_TIMEOUT_SECONDS,
+        max_concurrency: int = AUTH_PROVIDER_MAX_CONCURRENCY
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(AUTH_PROVIDER_FAILURE_THRESHOLD, AUTH_PROVIDER_RESET_SECONDS)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_session_data(self, session_id: str) -> Dict[str, Any]:
+        # Header values arrive latin-1 decoded; httpx can only send ASCII ones back out
+        if not session_id.isascii() or not session_id.isprintable():
+            raise HTTPException(status_code=401, detail="Invalid session")
+
+        cached = self._cache.get(session_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        # Fail fast while the breaker is open instead of queueing for a slot
+        if self.breaker.state == "open":
+            raise HTTPException(status_code=503, detail="Authentication provider unavailable")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Authentication provider busy")
+
+        try:
+            if not self.breaker.allow():
+                raise HTTPException(status_code=503, detail="Authentication provider unavailable")
+            try:
+                await self.start()
+                auth_response = await self._client.get(self.url, headers={"X-Session-ID": session_id})
+            except httpx.HTTPError:
+                self.breaker.record_failure()
+                raise HTTPException(status_code=503, detail="Authentication provider unavailable")
+            except BaseException:
+                # Otherwise a cancelled half-open trial would keep the breaker shut for good
+                self.breaker.release_trial()
+                raise
+        finally:
+            self._semaphore.release()
+
+        if auth_response.status_code >= 500:
+            self.breaker.record_failure()
+            raise HTTPException(status_code=503, detail="Authentication provider unavailable")
+        self.breaker.record_success()
+        if auth_response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid session")
+
+        auth_data = auth_response.json()
+        self._cache[session_id] = (auth_data, time.monotonic() + AUTH_PROVIDER_CACHE_TTL_SECONDS)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > AUTH_PROVIDER_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return auth_data
+
+auth_provider = AuthProviderClient()
+
+# Authentication functions
+async def resolve_session_user(token: Optional[str]) -> User:
+    """Resolve a session token to its user, via the session cache"""
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    await session_cache.sync()
+    cached_user = session_cache.get(token)
+    if cached_user:
+        return cached_user
+    
+    generation = session_cache.generation()
+    # Find session in database
+    session = await sessions_repo.get(token)
+    if not session or session["expires_at"] < datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+    
+    # Get user
+    user = await users_repo.get_by_id(session["user_id"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    resolved_user = User(**user)
+    session_cache.set(token, resolved_user, session["expires_at"], generation)
+    return resolved_user
+
+async def get_current_user(
+    session_token: Optional[str] = Cookie(None),
+    authorization: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> User:
+    """Get current authenticated user from session token"""
+    token = None
+    
+    # Try to get token from cookie first, then from Authorization header
+    if session_token:
+        token = session_token
+    elif authorization:
+        token = authorization.credentials
+    
+    return await resolve_session_user(token)
+
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """Ensure current user is an admin"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
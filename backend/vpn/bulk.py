@@ -0,0 +1,295 @@
+"""Bulk server provisioning from JSON, NDJSON and CSV uploads"""
+
+import codecs
+import csv
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+from pymongo import DeleteOne, InsertOne, UpdateOne
+
+from vpn.config import BULK_WRITE_BATCH_SIZE, BULK_UPLOAD_CHUNK_BYTES, BULK_MAX_ITEM_BYTES
+from vpn.models import Server, validate_coordinates
+from vpn.repositories import ServerRepository, stats_repo
+from vpn.catalog import server_catalog
+from vpn.events import event_bus
+
+# Bulk server provisioning
+SERVER_UPDATE_FIELDS = ("name", "country", "city", "ip_address", "latitude", "longitude", "status", "status_source",
+                        "load", "max_connections", "probe_port")
+SERVER_FIELD_ADAPTERS = {name: TypeAdapter(Server.model_fields[name].annotation) for name in SERVER_UPDATE_FIELDS}
+
+def upload_format(content_type: str, filename: str = "") -> str:
+    """Map a body or file content type (or file extension) to json, ndjson or csv"""
+    content_type, filename = content_type.lower(), filename.lower()
+    if "csv" in content_type or filename.endswith(".csv"):
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if "json" in content_type or filename.endswith(".json"):
+        return "json"
+    raise HTTPException(status_code=415, detail="Upload a JSON array, NDJSON or CSV of servers")
+
+async def iter_upload_file(upload):
+    while chunk := await upload.read(BULK_UPLOAD_CHUNK_BYTES):
+        yield chunk
+
+async def iter_text_lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+async def iter_json_array(chunks, max_item_bytes: int = BULK_MAX_ITEM_BYTES):
+    """Yield the items of a JSON array body without holding the whole array
+
+    An item that still doesn't parse once max_item_bytes are buffered from
+    its start is malformed (or too large), so the stream fails there rather
+    than reading the rest of the upload into memory.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8-sig")()
+    chunks = chunks.__aiter__()
+    buffer, started, exhausted, count = "", False, False, 0
+    while True:
+        buffer = buffer.lstrip(" \t\r\n," if started else " \t\r\n")
+        if buffer and not started:
+            if buffer[0] != "[":
+                raise ValueError("Expected a JSON array")
+            buffer, started = buffer[1:], True
+            continue
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise ValueError("Malformed JSON array")
+                if len(buffer) > max_item_bytes:
+                    raise ValueError(f"Item {count} is malformed or larger than {max_item_bytes} bytes")
+            else:
+                yield item
+                count += 1
+                buffer = buffer[end:]
+                continue
+        if exhausted:
+            raise ValueError("Unexpected end of JSON array")
+        try:
+            buffer += text.decode(await chunks.__anext__())
+        except StopAsyncIteration:
+            buffer += text.decode(b"", final=True)
+            exhausted = True
+
+async def iter_upload_rows(chunks, kind: str):
+    """Parse a streamed upload into row objects; raises ValueError when the stream itself is malformed"""
+    if kind == "json":
+        async for item in iter_json_array(chunks):
+            yield item
+        return
+    header = None
+    async for line in iter_text_lines(chunks):
+        if not line.strip():
+            continue
+        if kind == "ndjson":
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield ValueError(f"Invalid JSON: {exc.msg}")
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        # Empty cells fall back to the model defaults
+        yield {name: value.strip() for name, value in zip(header, values) if value.strip()}
+
+def validation_message(exc: ValidationError, field: Optional[str] = None) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in ((field,) if field else ()) + tuple(error['loc']))}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+def validate_server_update(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce the fields of a server update, raising ValueError for unknown or invalid ones"""
+    unknown = sorted(set(row) - set(SERVER_UPDATE_FIELDS))
+    if unknown:
+        raise ValueError(f"Cannot update fields: {', '.join(unknown)}")
+    if not row:
+        raise ValueError("No fields to update")
+    fields = {}
+    for name, value in row.items():
+        try:
+            fields[name] = SERVER_FIELD_ADAPTERS[name].validate_python(value)
+        except ValidationError as exc:
+            raise ValueError(validation_message(exc, name))
+    return fields
+
+class BulkItem(NamedTuple):
+    index: int
+    op: str
+    server_id: Optional[str]
+    write: Any
+    status: Optional[str]
+
+def prepare_server_operation(index: int, row: Any, now: datetime) -> BulkItem:
+    """Validate one bulk row against the Server model and build its write"""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("Expected an object")
+    row = dict(row)
+    op = row.pop("op", None) or "create"
+    if op == "create":
+        try:
+            server = Server(**{
+                "status": "offline",
+                **row,
+                "id": row.get("id") or str(uuid.uuid4()),
+                "current_connections": 0,
+                "created_at": now
+            })
+        except ValidationError as exc:
+            raise ValueError(validation_message(exc))
+        return BulkItem(index, op, server.id, InsertOne(validate_coordinates(server.model_dump())), server.status)
+
+    server_id = row.pop("id", None)
+    if not server_id:
+        raise ValueError(f"id is required to {op} a server")
+    if op == "delete":
+        return BulkItem(index, op, server_id, DeleteOne({"id": server_id}), None)
+    if op != "update":
+        raise ValueError(f"Unknown op '{op}'; expected create, update or delete")
+
+    fields = validate_server_update(row)
+    if "status" in fields:
+        fields.setdefault("status_source", "admin")
+    return BulkItem(index, op, server_id, UpdateOne({"id": server_id}, {"$set": validate_coordinates(fields)}),
+                    fields.get("status"))
+
+class ServerBulkWriter:
+    """Apply streamed server rows in bulk_write batches, yielding one result per row"""
+
+    RESULT_STATUS = {"create": "created", "update": "updated", "delete": "deleted"}
+
+    def __init__(self, servers: ServerRepository, ordered: bool):
+        self.servers = servers
+        self.ordered = ordered
+        self.summary = {"created": 0, "updated": 0, "deleted": 0, "not_found": 0, "invalid": 0, "failed": 0,
+                        "skipped": 0}
+        self.aborted = False
+
+    def _result(self, index: int, op: Optional[str], server_id: Optional[str], status: str,
+                error: Optional[str] = None) -> Dict[str, Any]:
+        if status in self.summary:
+            self.summary[status] += 1
+        result = {"index": index, "op": op, "id": server_id, "status": status}
+        if error:
+            result["error"] = error
+        return result
+
+    async def run(self, rows):
+        batch: List[BulkItem] = []
+        index = -1
+        now = datetime.utcnow()
+        try:
+            try:
+                async for row in rows:
+                    index += 1
+                    try:
+                        batch.append(prepare_server_operation(index, row, now))
+                    except ValueError as exc:
+                        op = (row.get("op") or "create") if isinstance(row, dict) else None
+                        server_id = row.get("id") if isinstance(row, dict) else None
+                        # Keep results in input order: settle earlier rows before reporting this one
+                        for result in await self._flush(batch):
+                            yield result
+                        batch = []
+                        if self.aborted:
+                            return
+                        yield self._result(index, op, server_id, "invalid", str(exc))
+                        if self.ordered:
+                            self.aborted = True
+                            return
+                        continue
+                    if len(batch) >= BULK_WRITE_BATCH_SIZE:
+                        for result in await self._flush(batch):
+                            yield result
+                        batch = []
+                        if self.aborted:
+                            return
+            except ValueError as exc:
+                # The stream itself is malformed, so nothing after this point can be read
+                for result in await self._flush(batch):
+                    yield result
+                if not self.aborted:
+                    self.aborted = True
+                    yield self._result(index + 1, None, None, "invalid", str(exc))
+                return
+            for result in await self._flush(batch):
+                yield result
+        finally:
+            if any(self.summary[status] for status in self.RESULT_STATUS.values()):
+                await server_catalog.bump()
+                event_bus.publish("server", {"action": "bulk", **self.summary})
+
+    async def _flush(self, batch: List[BulkItem]) -> List[Dict[str, Any]]:
+        if not batch or self.aborted:
+            return []
+        existing = [item.server_id for item in batch if item.op != "create"]
+        known = await self.servers.statuses(existing) if existing else {}
+
+        # Replay the batch against the looked-up statuses so earlier rows in it are visible to later ones
+        missing: List[BulkItem] = []
+        pending: List[BulkItem] = []
+        deltas: List[tuple] = []
+        for item in batch:
+            if item.op == "create":
+                known[item.server_id] = item.status
+                deltas.append((1, int(item.status == "online")))
+            elif item.server_id not in known:
+                missing.append(item)
+                continue
+            elif item.op == "delete":
+                deltas.append((-1, -int(known.pop(item.server_id) == "online")))
+            else:
+                previous = known[item.server_id]
+                if item.status is not None:
+                    known[item.server_id] = item.status
+                    deltas.append((0, int(item.status == "online") - int(previous == "online")))
+                else:
+                    deltas.append((0, 0))
+            pending.append(item)
+
+        errors = await self.servers.bulk_write([item.write for item in pending], self.ordered) if pending else {}
+        first_error = min(errors) if errors and self.ordered else None
+        # An ordered bulk_write stops at its first error; rows after it were never applied
+        stopped_at = pending[first_error].index if first_error is not None else None
+        results: Dict[int, Dict[str, Any]] = {}
+        for item in missing:
+            status = "skipped" if stopped_at is not None and item.index > stopped_at else "not_found"
+            results[item.index] = self._result(item.index, item.op, item.server_id, status)
+        total_servers = online_servers = 0
+        for position, item in enumerate(pending):
+            if position in errors:
+                results[item.index] = self._result(item.index, item.op, item.server_id, "failed", errors[position])
+            elif first_error is not None and position > first_error:
+                results[item.index] = self._result(item.index, item.op, item.server_id, "skipped")
+            else:
+                results[item.index] = self._result(item.index, item.op, item.server_id, self.RESULT_STATUS[item.op])
+                total_servers += deltas[position][0]
+                online_servers += deltas[position][1]
+        if first_error is not None:
+            self.aborted = True
+        if total_servers or online_servers:
+            await stats_repo.increment(total_servers=total_servers, online_servers=online_servers)
+        return [results[index] for index in sorted(results)]
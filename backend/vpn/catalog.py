@@ -0,0 +1,209 @@
+"""In-process server catalog, HTTP caching helpers and server recommendation"""
+
+import asyncio
+import hashlib
+import heapq
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request, Response
+import orjson
+from pydantic import ValidationError
+
+from vpn.config import CATALOG_VERSION_CHECK_SECONDS, CATALOG_MAX_AGE_SECONDS
+from vpn.models import Server, SERVER_LIST_ADAPTER
+from vpn.repositories import ServerRepository, MetaRepository, servers_repo, meta_repo
+
+logger = logging.getLogger(__name__)
+
+# Server catalog
+class CatalogSnapshot:
+    """Immutable view of the server catalog at one version"""
+
+    def __init__(self, version: int, servers: List[Server]):
+        self.version = version
+        self.servers = servers
+        self.by_id = {server.id: server for server in servers}
+        self.countries = sorted({server.country for server in servers})
+        self.loaded_at = time.monotonic()
+        # Serialized once per version and served as-is on every request
+        self.body = SERVER_LIST_ADAPTER.dump_json(servers)
+        self.countries_body = orjson.dumps({"countries": self.countries})
+        digest = hashlib.sha1(self.body).hexdigest()[:16]
+        self.etag = f'"{version}-{digest}"'
+        self.countries_etag = f'"{version}-{digest}-countries"'
+
+class ServerCatalog:
+    """In-process server catalog that reloads when the shared version document changes"""
+
+    VERSION_KEY = "server_catalog"
+
+    def __init__(self, servers: ServerRepository, meta: MetaRepository):
+        self.servers = servers
+        self.meta = meta
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def snapshot(self) -> CatalogSnapshot:
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot and now - self._checked_at < CATALOG_VERSION_CHECK_SECONDS \
+                and now - snapshot.loaded_at < CATALOG_MAX_AGE_SECONDS:
+            return snapshot
+        async with self._lock:
+            snapshot = self._snapshot
+            now = time.monotonic()
+            if snapshot and now - self._checked_at < CATALOG_VERSION_CHECK_SECONDS \
+                    and now - snapshot.loaded_at < CATALOG_MAX_AGE_SECONDS:
+                return snapshot
+            version = await self.meta.get_version(self.VERSION_KEY)
+            self._checked_at = time.monotonic()
+            if snapshot is None or snapshot.version != version \
+                    or self._checked_at - snapshot.loaded_at >= CATALOG_MAX_AGE_SECONDS:
+                servers = self._validate(await self.servers.list_all())
+                self._snapshot = CatalogSnapshot(version, servers)
+            return self._snapshot
+
+    @staticmethod
+    def _validate(documents: List[Dict[str, Any]]) -> List[Server]:
+        """Build the servers, leaving out (and logging) documents that no longer fit the model"""
+        try:
+            return SERVER_LIST_ADAPTER.validate_python(documents)
+        except ValidationError:
+            pass
+        servers = []
+        for document in documents:
+            try:
+                servers.append(Server.model_validate(document))
+            except ValidationError as exc:
+                logger.error("Leaving server %s out of the catalog: %s", document.get("id"), exc)
+        return servers
+
+    async def bump(self) -> int:
+        """Record a catalog write so every worker reloads on its next read"""
+        version = await self.meta.bump_version(self.VERSION_KEY)
+        self._snapshot = None
+        return version
+
+server_catalog = ServerCatalog(servers_repo, meta_repo)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check an If-None-Match header against an entity tag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+def cached_json(body: bytes, etag: str) -> Response:
+    """Serve a pre-serialized JSON body with its entity tag"""
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
+
+# Server recommendation
+class ServerRecommender:
+    """Per-country min-heaps of online servers ranked by load and occupancy
+
+    Heaps are rebuilt when the catalog snapshot changes and updated in
+    O(log n) on every connect/disconnect in between. Superseded heap entries
+    are discarded lazily when they reach the top.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._servers: Dict[str, Server] = {}
+        self._scores: Dict[str, float] = {}
+        self._heaps: Dict[Optional[str], list] = {}
+
+    @staticmethod
+    def score(server: Server) -> Optional[float]:
+        """Lower is better; None when the server cannot take a connection"""
+        if server.status != "online" or server.current_connections >= server.max_connections:
+            return None
+        occupancy = server.current_connections / server.max_connections if server.max_connections else 1.0
+        return 0.5 * (server.load / 100) + 0.5 * occupancy
+
+    def rebuild(self, snapshot: CatalogSnapshot) -> None:
+        self._snapshot = snapshot
+        self._servers = dict(snapshot.by_id)
+        self._scores = {}
+        self._heaps = {}
+        for server in self._servers.values():
+            score = self.score(server)
+            if score is None:
+                continue
+            self._scores[server.id] = score
+            self._heaps.setdefault(None, []).append((score, server.id))
+            self._heaps.setdefault(server.country, []).append((score, server.id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+    def adjust(self, server_id: str, delta: int) -> None:
+        server = self._servers.get(server_id)
+        if server is None:
+            return
+        server = server.model_copy(update={"current_connections": max(0, server.current_connections + delta)})
+        self._servers[server_id] = server
+        score = self.score(server)
+        if score is None:
+            self._scores.pop(server_id, None)
+            return
+        self._scores[server_id] = score
+        for key in (None, server.country):
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, (score, server_id))
+            if len(heap) > 4 * len(self._servers) + 64:
+                self._compact(key)
+
+    async def recommend(self, country: Optional[str] = None) -> Optional[Server]:
+        snapshot = await server_catalog.snapshot()
+        if snapshot is not self._snapshot:
+            self.rebuild(snapshot)
+        heap = self._heaps.get(country)
+        while heap:
+            score, server_id = heap[0]
+            if self._scores.get(server_id) == score:
+                return self._servers[server_id]
+            heapq.heappop(heap)
+        return None
+
+    def _compact(self, key: Optional[str]) -> None:
+        heap = [
+            (score, server_id) for server_id, score in self._scores.items()
+            if key is None or self._servers[server_id].country == key
+        ]
+        heapq.heapify(heap)
+        self._heaps[key] = heap
+
+server_recommender = ServerRecommender()
+
+async def attach_server_info(connections: List[Dict[str, Any]], default: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Add server_name/server_country to connections with a single batched lookup"""
+    catalog = await server_catalog.snapshot()
+    servers = {}
+    missing = []
+    for server_id in {connection["server_id"] for connection in connections}:
+        server = catalog.by_id.get(server_id)
+        if server:
+            servers[server_id] = {"name": server.name, "country": server.country}
+        else:
+            missing.append(server_id)
+    if missing:
+        servers.update(await servers_repo.get_metadata(missing))
+    for connection in connections:
+        server = servers.get(connection["server_id"])
+        if server:
+            connection["server_name"] = server["name"]
+            connection["server_country"] = server["country"]
+        elif default is not None:
+            connection["server_name"] = default
+            connection["server_country"] = default
+    return connections
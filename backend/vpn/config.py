@@ -0,0 +1,121 @@
+"""Environment configuration shared by every module"""
+
+import os
+from datetime import timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# MongoDB connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'vpn_service')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+MONGO_OPERATION_TIMEOUT_MS = int(os.environ.get('MONGO_OPERATION_TIMEOUT_MS', '3000'))
+
+# Startup
+SEED_SAMPLE_DATA = os.environ.get('SEED_SAMPLE_DATA', 'true').lower() in ('1', 'true', 'yes')
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', '5'))
+
+# Session cache
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+SESSION_CACHE_TTL_SECONDS = int(os.environ.get('SESSION_CACHE_TTL_SECONDS', '60'))
+# How often each worker checks for invalidations made by other workers, and how many it can replay
+SESSION_CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('SESSION_CACHE_VERSION_CHECK_SECONDS', '1'))
+SESSION_INVALIDATION_HISTORY = int(os.environ.get('SESSION_INVALIDATION_HISTORY', '1000'))
+
+# External auth provider
+AUTH_PROVIDER_URL = os.environ.get(
+    'AUTH_PROVIDER_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data'
+)
+AUTH_PROVIDER_TIMEOUT_SECONDS = float(os.environ.get('AUTH_PROVIDER_TIMEOUT_SECONDS', '5'))
+AUTH_PROVIDER_MAX_CONCURRENCY = int(os.environ.get('AUTH_PROVIDER_MAX_CONCURRENCY', '50'))
+AUTH_PROVIDER_FAILURE_THRESHOLD = int(os.environ.get('AUTH_PROVIDER_FAILURE_THRESHOLD', '5'))
+AUTH_PROVIDER_RESET_SECONDS = float(os.environ.get('AUTH_PROVIDER_RESET_SECONDS', '30'))
+AUTH_PROVIDER_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_PROVIDER_CACHE_TTL_SECONDS', '60'))
+AUTH_PROVIDER_CACHE_SIZE = int(os.environ.get('AUTH_PROVIDER_CACHE_SIZE', '10000'))
+
+# Server catalog
+CATALOG_VERSION_CHECK_SECONDS = float(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', '1'))
+CATALOG_MAX_AGE_SECONDS = float(os.environ.get('CATALOG_MAX_AGE_SECONDS', '10'))
+
+# Geolocation
+GEOIP_DATABASE = os.environ.get('GEOIP_DATABASE')
+GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', '65536'))
+EARTH_RADIUS_KM = 6371.0088
+
+# Pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '5000'))
+
+# Push events
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '100'))
+EVENT_KEEPALIVE_SECONDS = float(os.environ.get('EVENT_KEEPALIVE_SECONDS', '15'))
+
+# Usage ingestion
+NODE_API_KEY = os.environ.get('NODE_API_KEY')
+USAGE_FLUSH_SAMPLES = int(os.environ.get('USAGE_FLUSH_SAMPLES', '20000'))
+USAGE_FLUSH_SECONDS = float(os.environ.get('USAGE_FLUSH_SECONDS', '1'))
+USAGE_BUFFER_MAX_SAMPLES = int(os.environ.get('USAGE_BUFFER_MAX_SAMPLES', '200000'))
+USAGE_MAX_CLOCK_SKEW_SECONDS = float(os.environ.get('USAGE_MAX_CLOCK_SKEW_SECONDS', '86400'))
+
+# Heartbeats and stale connection reaping
+HEARTBEAT_INTERVAL_SECONDS = int(os.environ.get('HEARTBEAT_INTERVAL_SECONDS', '30'))
+HEARTBEAT_FLUSH_SECONDS = float(os.environ.get('HEARTBEAT_FLUSH_SECONDS', '10'))
+HEARTBEAT_TIMEOUT_SECONDS = int(os.environ.get('HEARTBEAT_TIMEOUT_SECONDS', '120'))
+REAPER_INTERVAL_SECONDS = float(os.environ.get('REAPER_INTERVAL_SECONDS', '30'))
+REAPER_BATCH_SIZE = int(os.environ.get('REAPER_BATCH_SIZE', '500'))
+
+# Bulk server provisioning
+BULK_WRITE_BATCH_SIZE = int(os.environ.get('BULK_WRITE_BATCH_SIZE', '1000'))
+BULK_UPLOAD_CHUNK_BYTES = 64 * 1024
+BULK_MAX_ITEM_BYTES = int(os.environ.get('BULK_MAX_ITEM_BYTES', str(64 * 1024)))
+
+# Connection archive (hot/cold tiering of connection history; 0 days disables it)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+ARCHIVE_PARQUET_DIR = os.environ.get('ARCHIVE_PARQUET_DIR')
+ARCHIVE_CLAIM_TIMEOUT = timedelta(hours=1)
+EXPORT_COLUMNS = [
+    "id", "user_id", "server_id", "server_name", "server_country", "connected_at", "disconnected_at",
+    "duration", "status", "close_reason", "bytes_in", "bytes_out", "data_transferred"
+]
+ARCHIVE_PARQUET_COLUMNS = [
+    "id", "user_id", "server_id", "connected_at", "disconnected_at", "duration", "close_reason",
+    "bytes_in", "bytes_out", "data_transferred", "last_usage_at", "last_heartbeat"
+]
+
+# Server health probing (an interval of 0 disables the prober)
+HEALTH_PROBE_INTERVAL_SECONDS = float(os.environ.get('HEALTH_PROBE_INTERVAL_SECONDS', '0'))
+HEALTH_PROBE_JITTER = float(os.environ.get('HEALTH_PROBE_JITTER', '0.2'))
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_PROBE_TIMEOUT_SECONDS', '2'))
+HEALTH_PROBE_CONCURRENCY = int(os.environ.get('HEALTH_PROBE_CONCURRENCY', '500'))
+HEALTH_PROBE_PORT = int(os.environ.get('HEALTH_PROBE_PORT', '443'))
+HEALTH_PROBE_FAILURES = int(os.environ.get('HEALTH_PROBE_FAILURES', '2'))
+
+# Admission control for connect and login storms (a rate of 0 disables a limit)
+CONNECT_USER_RATE = float(os.environ.get('CONNECT_USER_RATE', '1'))
+CONNECT_USER_BURST = int(os.environ.get('CONNECT_USER_BURST', '5'))
+CONNECT_GLOBAL_RATE = float(os.environ.get('CONNECT_GLOBAL_RATE', '200'))
+CONNECT_GLOBAL_BURST = int(os.environ.get('CONNECT_GLOBAL_BURST', '400'))
+CONNECT_MAX_IN_FLIGHT = int(os.environ.get('CONNECT_MAX_IN_FLIGHT', '100'))
+# Login buckets are per client IP, which several users can share behind a NAT
+LOGIN_CLIENT_RATE = float(os.environ.get('LOGIN_CLIENT_RATE', '1'))
+LOGIN_CLIENT_BURST = int(os.environ.get('LOGIN_CLIENT_BURST', '10'))
+LOGIN_GLOBAL_RATE = float(os.environ.get('LOGIN_GLOBAL_RATE', '100'))
+LOGIN_GLOBAL_BURST = int(os.environ.get('LOGIN_GLOBAL_BURST', '200'))
+LOGIN_MAX_IN_FLIGHT = int(os.environ.get('LOGIN_MAX_IN_FLIGHT', '50'))
+THROTTLE_MAX_KEYS = int(os.environ.get('THROTTLE_MAX_KEYS', '100000'))
+
+# Admin statistics
+STATS_WINDOW_DAYS = 7
+STATS_RECONCILE_SECONDS = int(os.environ.get('STATS_RECONCILE_SECONDS', '300'))
+ROLLUP_GRANULARITIES = {"hour": "h", "day": "D"}
+ROLLUP_DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
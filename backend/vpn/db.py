@@ -0,0 +1,68 @@
+"""MongoDB client lifecycle"""
+
+from typing import Any, Dict, NamedTuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from vpn.config import (
+    MONGO_URL, MONGO_DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS, SEED_SAMPLE_DATA, STARTUP_BUDGET_SECONDS
+)
+from vpn.metrics import MongoCommandMetrics
+
+# Application settings
+class Settings(NamedTuple):
+    """Per-process settings for create_app; defaults come from the environment"""
+    mongo_url: str = MONGO_URL
+    mongo_db_name: str = MONGO_DB_NAME
+    mongo_max_pool_size: int = MONGO_MAX_POOL_SIZE
+    mongo_min_pool_size: int = MONGO_MIN_POOL_SIZE
+    mongo_connect_timeout_ms: int = MONGO_CONNECT_TIMEOUT_MS
+    mongo_socket_timeout_ms: int = MONGO_SOCKET_TIMEOUT_MS
+    mongo_wait_queue_timeout_ms: int = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    seed_sample_data: bool = SEED_SAMPLE_DATA
+    startup_budget_seconds: float = STARTUP_BUDGET_SECONDS
+
+class MongoConnection:
+    """Motor client opened in the app lifespan, so importing the module starts no pool or monitor threads"""
+
+    def __init__(self):
+        self.client = None
+        self._db = None
+        self._collections: Dict[str, Any] = {}
+
+    def connect(self, settings: Settings) -> None:
+        # Pool sizing is per worker process
+        self.client = AsyncIOMotorClient(
+            settings.mongo_url,
+            maxPoolSize=settings.mongo_max_pool_size,
+            minPoolSize=settings.mongo_min_pool_size,
+            connectTimeoutMS=settings.mongo_connect_timeout_ms,
+            serverSelectionTimeoutMS=settings.mongo_connect_timeout_ms,
+            socketTimeoutMS=settings.mongo_socket_timeout_ms,
+            waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+            event_listeners=[MongoCommandMetrics()],
+        )
+        self._db = self.client[settings.mongo_db_name]
+        self._collections = {}
+
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self._db = None
+        self._collections = {}
+
+    @property
+    def db(self):
+        if self._db is None:
+            raise RuntimeError("MongoDB is not connected; it is opened in the app lifespan")
+        return self._db
+
+    def collection(self, name: str):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = self.db[name]
+        return collection
+
+mongo = MongoConnection()
@@ -0,0 +1,75 @@
+"""In-process push event bus"""
+
+import asyncio
+import json
+from typing import Any, Dict, NamedTuple, Optional
+
+from vpn.config import EVENT_QUEUE_SIZE
+from vpn.models import json_default
+
+# Push events
+class Event(NamedTuple):
+    """A published event, serialized once for every subscriber"""
+    sse: str
+    json: str
+
+class EventBus:
+    """In-process pub/sub that fans events out to push-channel subscribers"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.sequence = 0
+        self._subscribers: set = set()
+        self._by_user: Dict[str, set] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        self._by_user.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        queues = self._by_user.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._by_user[user_id]
+
+    def publish(self, event_type: str, data: Dict[str, Any], user_id: Optional[str] = None) -> None:
+        """Deliver to every subscriber, or only to user_id's subscribers when given"""
+        targets = self._subscribers if user_id is None else self._by_user.get(user_id)
+        if not targets:
+            return
+        self.sequence += 1
+        event = self._encode(self.sequence, event_type, data)
+        for queue in targets:
+            if queue.full():
+                # Slow consumer: drop its backlog and tell it to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._encode(self.sequence, "resync", {}))
+            else:
+                queue.put_nowait(event)
+
+    @staticmethod
+    def _encode(sequence: int, event_type: str, data: Dict[str, Any]) -> Event:
+        payload = json.dumps(data, default=json_default)
+        return Event(
+            sse=f"id: {sequence}\nevent: {event_type}\ndata: {payload}\n\n",
+            json=f'{{"id": {sequence}, "type": "{event_type}", "data": {payload}}}'
+        )
+
+event_bus = EventBus()
+
+def publish_server_change(action: str, server_id: str, server: Optional[Dict[str, Any]] = None) -> None:
+    event_bus.publish("server", {"action": action, "id": server_id, "server": server})
+
+def publish_connection_change(user_id: str, action: str, connection: Dict[str, Any]) -> None:
+    delta = 1 if action == "connected" else -1
+    event_bus.publish("server_connections", {"server_id": connection["server_id"], "delta": delta})
+    event_bus.publish("connection", {"action": action, "connection": connection}, user_id=user_id)
@@ -0,0 +1,142 @@
+"""Streaming connection exports as CSV, NDJSON or Parquet"""
+
+import asyncio
+import csv
+import io
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+import orjson
+
+from vpn.config import EXPORT_BATCH_SIZE, EXPORT_COLUMNS
+from vpn.models import json_default
+from vpn.repositories import connections_repo, archived_connections_repo
+from vpn.catalog import attach_server_info
+from vpn.archive import connection_archiver
+
+# Connection export
+class CsvExportEncoder:
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self):
+        self._header = True
+
+    def encode(self, connections: List[Dict[str, Any]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_COLUMNS, extrasaction="ignore")
+        if self._header:
+            writer.writeheader()
+            self._header = False
+        for connection in connections:
+            writer.writerow({
+                column: value.isoformat() if isinstance(value, datetime) else value
+                for column, value in connection.items()
+            })
+        return buffer.getvalue().encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+class NdjsonExportEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def encode(self, connections: List[Dict[str, Any]]) -> bytes:
+        return b"".join(orjson.dumps(connection, default=json_default) + b"\n" for connection in connections)
+
+    def finish(self) -> bytes:
+        return b""
+
+class ParquetExportEncoder:
+    """Writes each batch as one Parquet row group and hands back the bytes produced so far"""
+
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    class _Sink(io.RawIOBase):
+        def __init__(self):
+            self.chunks: List[bytes] = []
+            self.position = 0
+
+        def writable(self) -> bool:
+            return True
+
+        def write(self, data) -> int:
+            self.chunks.append(bytes(data))
+            self.position += len(data)
+            return len(data)
+
+        def tell(self) -> int:
+            return self.position
+
+        def drain(self) -> bytes:
+            data, self.chunks = b"".join(self.chunks), []
+            return data
+
+    def __init__(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise HTTPException(status_code=503, detail="Parquet export needs pyarrow installed")
+        self._pa = pa
+        self.schema = pa.schema([
+            ("id", pa.string()), ("user_id", pa.string()), ("server_id", pa.string()),
+            ("server_name", pa.string()), ("server_country", pa.string()),
+            ("connected_at", pa.timestamp("ms")), ("disconnected_at", pa.timestamp("ms")),
+            ("duration", pa.int64()), ("status", pa.string()), ("close_reason", pa.string()),
+            ("bytes_in", pa.int64()), ("bytes_out", pa.int64()), ("data_transferred", pa.int64())
+        ])
+        self._sink = self._Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    def encode(self, connections: List[Dict[str, Any]]) -> bytes:
+        self._writer.write_table(self._pa.Table.from_pylist(connections, schema=self.schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+EXPORT_ENCODERS = {"csv": CsvExportEncoder, "ndjson": NdjsonExportEncoder, "parquet": ParquetExportEncoder}
+
+async def stream_connection_export(encoder, query: Dict[str, Any], start: Optional[datetime]):
+    """Yield encoded export chunks, holding at most one EXPORT_BATCH_SIZE batch in memory
+
+    Archived connections come first, then the hot collection, each in
+    connected_at order. A batch being archived has rows in both; only
+    archive rows stamped since the oldest claim still in the hot
+    collection can have a hot copy, so just their ids are remembered and
+    skipped in the hot pass. Encoding runs on a worker thread so large
+    exports don't stall other requests, and the ASGI server's flow control
+    stops the cursor from reading ahead of a slow client.
+    """
+    passes = [(connections_repo, ())]
+    archived_ids: Set[str] = set()
+    if connection_archiver.reaches_archive(start):
+        started = datetime.utcnow()
+        oldest_claim = await connections_repo.oldest_archive_claim(connection_archiver.hot_window_start())
+        recent = min(oldest_claim or started, started)
+        passes.insert(0, (archived_connections_repo, ("archived_at",)))
+    for repository, extra_fields in passes:
+        batch: List[Dict[str, Any]] = []
+        async for connection in repository.export(query, extra_fields=extra_fields):
+            if extra_fields:
+                archived_at = connection.pop("archived_at", None)
+                if archived_at is not None and archived_at >= recent:
+                    archived_ids.add(connection["id"])
+            elif connection["id"] in archived_ids:
+                continue
+            batch.append(connection)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                await attach_server_info(batch, default="")
+                yield await asyncio.to_thread(encoder.encode, batch)
+                batch = []
+        if batch:
+            await attach_server_info(batch, default="")
+            yield await asyncio.to_thread(encoder.encode, batch)
+    tail = await asyncio.to_thread(encoder.finish)
+    if tail:
+        yield tail
@@ -0,0 +1,219 @@
+"""Offline IP geolocation and nearest-server ranking"""
+
+import bisect
+import math
+import mmap
+import socket
+import struct
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from vpn.config import GEOIP_CACHE_SIZE, EARTH_RADIUS_KM
+from vpn.models import Server
+from vpn.catalog import CatalogSnapshot, server_catalog
+
+# Geolocation
+class GeoLocation(NamedTuple):
+    latitude: float
+    longitude: float
+    country: str
+
+class GeoIPDatabase:
+    """Offline IPv4 geolocation from a memory-mapped range file, cached per /24 prefix
+
+    The file holds a 16-byte header (magic, range count) followed by
+    column arrays for the sorted, non-overlapping ranges: start and end
+    addresses as uint32, latitude and longitude as float32 and a two-letter
+    country code, all little-endian. Columns are read in place through
+    memoryviews, so a lookup is one bisect over the mapped start addresses
+    and nothing is loaded into the heap. Write files with
+    write_geoip_database (see build_geoip.py).
+
+    Only prefixes that lie wholly inside one range, or one gap between
+    ranges, are cached; lookups in a /24 split by a range boundary always
+    search the file.
+    """
+
+    MAGIC = b"VPNGEO\x00\x01"
+    HEADER = struct.Struct("<8sI4x")
+    _MISSING = object()
+
+    def __init__(self, cache_size: int = GEOIP_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.path: Optional[str] = None
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+        self._cache: "OrderedDict[int, Optional[GeoLocation]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.split_prefixes = 0
+
+    def open(self, path: str) -> None:
+        if sys.byteorder != "little":
+            raise RuntimeError("GeoIP database columns are read in place and need a little-endian host")
+        self.close()
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = self.HEADER.unpack_from(self._map)
+        if magic != self.MAGIC or len(self._map) != self.HEADER.size + count * 18:
+            self.close()
+            raise ValueError(f"{path} is not a GeoIP range database")
+        view = memoryview(self._map)
+        offset = self.HEADER.size
+        columns = []
+        for width, code in ((4, "I"), (4, "I"), (4, "f"), (4, "f"), (2, None)):
+            column = view[offset:offset + count * width]
+            columns.append(column.cast(code) if code else column)
+            offset += count * width
+        self._starts, self._ends, self._latitudes, self._longitudes, self._countries = columns
+        self._views = [view, *columns]
+        self.path = path
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._cache.clear()
+        self.path = None
+
+    def _search(self, address: int) -> tuple:
+        """(location, first, last): the answer and the address span it holds for"""
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index < 0 or address > self._ends[index]:
+            # A miss holds across the gap between the neighbouring ranges
+            first = self._ends[index] + 1 if index >= 0 else 0
+            last = self._starts[index + 1] - 1 if index + 1 < len(self._starts) else 0xFFFFFFFF
+            return None, first, last
+        country = bytes(self._countries[index * 2:index * 2 + 2]).decode("ascii")
+        # float32 columns carry ~7 significant digits; four decimals is about 11m
+        location = GeoLocation(round(self._latitudes[index], 4), round(self._longitudes[index], 4), country)
+        return location, self._starts[index], self._ends[index]
+
+    def lookup(self, host: Optional[str]) -> Optional[GeoLocation]:
+        """Locate an IPv4 address; None when no database is open or the address is unknown"""
+        if self._map is None or not host:
+            return None
+        try:
+            address = int.from_bytes(socket.inet_pton(socket.AF_INET, host), "big")
+        except OSError:
+            return None
+        # One entry serves a whole /24, but only when the answer holds for all of it
+        prefix = address >> 8
+        location = self._cache.get(prefix, self._MISSING)
+        if location is not self._MISSING:
+            self.hits += 1
+            self._cache.move_to_end(prefix)
+            return location
+        self.misses += 1
+        location, first, last = self._search(address)
+        if first <= prefix << 8 and last >= prefix << 8 | 0xFF:
+            self._cache[prefix] = location
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self.split_prefixes += 1
+        return location
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "database": self.path,
+            "ranges": len(self._starts) if self._map is not None else 0,
+            "cached_prefixes": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "split_prefix_lookups": self.split_prefixes
+        }
+
+def write_geoip_database(path: str, ranges) -> int:
+    """Write (start, end, latitude, longitude, country) IPv4 ranges in the GeoIPDatabase format"""
+    ranges = sorted(ranges)
+    for previous, current in zip(ranges, ranges[1:]):
+        if current[0] <= previous[1]:
+            raise ValueError(f"Overlapping ranges starting at {previous[0]} and {current[0]}")
+    count = len(ranges)
+    with open(path, "wb") as f:
+        f.write(GeoIPDatabase.HEADER.pack(GeoIPDatabase.MAGIC, count))
+        f.write(struct.pack(f"<{count}I", *(r[0] for r in ranges)))
+        f.write(struct.pack(f"<{count}I", *(r[1] for r in ranges)))
+        f.write(struct.pack(f"<{count}f", *(r[2] for r in ranges)))
+        f.write(struct.pack(f"<{count}f", *(r[3] for r in ranges)))
+        f.write(b"".join((r[4] or "").upper().encode("ascii")[:2].ljust(2) for r in ranges))
+    return count
+
+class ServerLocator:
+    """Ranks online catalog servers by great-circle distance from a point
+
+    Server coordinates become unit vectors once per catalog snapshot, so a
+    query is one matrix-vector product and a partial sort however many
+    lookups arrive in between.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._servers: List[Server] = []
+        self._vectors = None
+        self._by_country: Dict[str, tuple] = {}
+
+    @staticmethod
+    def unit_vector(latitude: float, longitude: float) -> tuple:
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+    def rebuild(self, snapshot: CatalogSnapshot) -> None:
+        import numpy as np
+
+        self._snapshot = snapshot
+        self._servers = [
+            server for server in snapshot.servers
+            if server.status == "online" and server.latitude is not None and server.longitude is not None
+        ]
+        self._vectors = np.array(
+            [self.unit_vector(server.latitude, server.longitude) for server in self._servers], dtype=float
+        ).reshape(-1, 3)
+        countries: Dict[str, list] = {}
+        for index, server in enumerate(self._servers):
+            countries.setdefault(server.country, []).append(index)
+        self._by_country = {
+            country: (indexes, self._vectors[indexes]) for country, indexes in countries.items()
+        }
+
+    async def nearest(
+        self, latitude: float, longitude: float, limit: int, country: Optional[str] = None
+    ) -> List[tuple]:
+        return self.rank(await server_catalog.snapshot(), latitude, longitude, limit, country)
+
+    def rank(
+        self, snapshot: CatalogSnapshot, latitude: float, longitude: float, limit: int, country: Optional[str] = None
+    ) -> List[tuple]:
+        """Up to limit (server, distance_km) pairs from the snapshot, closest first"""
+        import numpy as np
+
+        if snapshot is not self._snapshot:
+            self.rebuild(snapshot)
+        if country is None:
+            indexes, vectors = None, self._vectors
+        elif country in self._by_country:
+            indexes, vectors = self._by_country[country]
+        else:
+            return []
+        if not len(vectors):
+            return []
+        similarity = vectors.dot(self.unit_vector(latitude, longitude))
+        count = min(limit, len(similarity))
+        top = np.argpartition(-similarity, count - 1)[:count] if count < len(similarity) else np.arange(count)
+        ranked = []
+        for i in sorted(top.tolist(), key=lambda i: -similarity[i]):
+            server = self._servers[indexes[i] if indexes is not None else i]
+            ranked.append((server, EARTH_RADIUS_KM * math.acos(max(-1.0, min(1.0, float(similarity[i]))))))
+        return ranked
+
+geoip = GeoIPDatabase()
+server_locator = ServerLocator()
@@ -0,0 +1,175 @@
+"""Concurrent TCP health probing of VPN servers"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from vpn.config import (
+    HEALTH_PROBE_INTERVAL_SECONDS, HEALTH_PROBE_JITTER, HEALTH_PROBE_TIMEOUT_SECONDS,
+    HEALTH_PROBE_CONCURRENCY, HEALTH_PROBE_PORT, HEALTH_PROBE_FAILURES
+)
+from vpn.repositories import ServerRepository, MetaRepository, servers_repo, stats_repo, meta_repo
+from vpn.catalog import server_catalog
+from vpn.events import publish_server_change
+
+logger = logging.getLogger(__name__)
+
+# Server health probing
+class HealthProber:
+    """Probes every online/offline server with a TCP connect and writes status, latency and load back
+
+    A sweep opens at most HEALTH_PROBE_CONCURRENCY connections at a time, in
+    a fresh random order, each bounded by HEALTH_PROBE_TIMEOUT_SECONDS. A
+    server goes offline after HEALTH_PROBE_FAILURES failed probes in a row and
+    back online on its first success, but only if the prober took it
+    offline: an admin's offline (the default for new servers) and
+    maintenance stay under admin control.
+    Load is the share of connection slots taken, since a connect probe can't
+    see the node's CPU. Sweep starts are jittered and, with several workers,
+    a lease in the meta collection lets only one of them sweep.
+    """
+
+    LEASE_KEY = "health_prober"
+
+    def __init__(self, servers: ServerRepository, meta: MetaRepository):
+        self.servers = servers
+        self.meta = meta
+        self.enabled = HEALTH_PROBE_INTERVAL_SECONDS > 0
+        self.owner = str(uuid.uuid4())
+        self._lock = asyncio.Lock()
+        self.sweeps = 0
+        self.failed_sweeps = 0
+        self.skipped_sweeps = 0
+        self.probed = 0
+        self.unreachable = 0
+        self.status_changes = 0
+        self.last_sweep_seconds: Optional[float] = None
+        self.last_sweep_at: Optional[datetime] = None
+
+    @staticmethod
+    async def probe(host: str, port: int) -> Optional[float]:
+        """TCP connect time to host:port in milliseconds, or None if it failed or timed out"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            transport, _ = await asyncio.wait_for(
+                loop.create_connection(asyncio.Protocol, host, port),
+                HEALTH_PROBE_TIMEOUT_SECONDS
+            )
+        except (OSError, ValueError, asyncio.TimeoutError):
+            return None
+        latency = (time.perf_counter() - started) * 1000
+        # Reset rather than close so thousands of probes don't leave sockets in TIME_WAIT
+        transport.abort()
+        return round(latency, 1)
+
+    async def probe_all(self, targets: List[tuple]) -> List[Optional[float]]:
+        """Probe (host, port) targets with bounded parallelism; results are in target order"""
+        results: List[Optional[float]] = [None] * len(targets)
+        order = list(range(len(targets)))
+        random.shuffle(order)
+        pending = iter(order)
+
+        async def worker():
+            for index in pending:
+                results[index] = await self.probe(*targets[index])
+
+        await asyncio.gather(*(worker() for _ in range(min(HEALTH_PROBE_CONCURRENCY, len(targets)))))
+        return results
+
+    @staticmethod
+    def plan(server: Dict[str, Any], latency: Optional[float], now: datetime) -> Dict[str, Any]:
+        """Fields to write back for one server given its probe result"""
+        max_connections = server.get("max_connections") or 0
+        occupancy = server.get("current_connections", 0) / max_connections if max_connections else 1.0
+        fields = {"latency_ms": latency, "last_probed_at": now, "load": min(100, round(occupancy * 100))}
+        if latency is not None:
+            fields["probe_failures"] = 0
+            if server["status"] == "offline" and server.get("status_source") == "probe":
+                fields.update(status="online", status_source="probe")
+        else:
+            failures = server.get("probe_failures", 0) + 1
+            fields["probe_failures"] = failures
+            if failures >= HEALTH_PROBE_FAILURES and server["status"] == "online":
+                fields.update(status="offline", status_source="probe")
+        return fields
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Probe every server once and apply the results in one bulk write"""
+        async with self._lock:
+            started = time.perf_counter()
+            servers = await self.servers.probe_targets()
+            latencies = await self.probe_all([
+                (server["ip_address"], server.get("probe_port") or HEALTH_PROBE_PORT) for server in servers
+            ])
+            now = datetime.utcnow()
+            updates = {}
+            previous = {}
+            changed = []
+            for server, latency in zip(servers, latencies):
+                fields = self.plan(server, latency, now)
+                updates[server["id"]] = fields
+                if fields.get("status", server["status"]) != server["status"]:
+                    changed.append((server["id"], fields["status"]))
+                    previous[server["id"]] = {"status": server["status"], "status_source": server.get("status_source")}
+            await self.servers.record_probes(updates, previous)
+
+            if changed:
+                # Approximate if an admin changed a status mid-sweep; the stats reconciler corrects it
+                online_delta = sum(1 if status == "online" else -1 for _, status in changed)
+                if online_delta:
+                    await stats_repo.increment(online_servers=online_delta)
+            if updates:
+                await server_catalog.bump()
+            for server_id, status in changed:
+                publish_server_change("updated", server_id, {"status": status})
+
+            unreachable = latencies.count(None)
+            self.sweeps += 1
+            self.probed += len(servers)
+            self.unreachable += unreachable
+            self.status_changes += len(changed)
+            self.last_sweep_seconds = time.perf_counter() - started
+            self.last_sweep_at = now
+            return {
+                "probed": len(servers),
+                "unreachable": unreachable,
+                "status_changes": len(changed),
+                "seconds": round(self.last_sweep_seconds, 3)
+            }
+
+    async def run(self) -> None:
+        ttl = timedelta(seconds=HEALTH_PROBE_INTERVAL_SECONDS * 2)
+        while True:
+            jitter = random.uniform(-HEALTH_PROBE_JITTER, HEALTH_PROBE_JITTER)
+            await asyncio.sleep(HEALTH_PROBE_INTERVAL_SECONDS * (1 + jitter))
+            try:
+                if await self.meta.acquire_lease(self.LEASE_KEY, self.owner, ttl):
+                    await self.sweep()
+                else:
+                    self.skipped_sweeps += 1
+            except Exception:
+                self.failed_sweeps += 1
+                logger.exception("Server health sweep failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": HEALTH_PROBE_INTERVAL_SECONDS,
+            "concurrency": HEALTH_PROBE_CONCURRENCY,
+            "timeout_seconds": HEALTH_PROBE_TIMEOUT_SECONDS,
+            "sweeps": self.sweeps,
+            "failed_sweeps": self.failed_sweeps,
+            "skipped_sweeps": self.skipped_sweeps,
+            "probed_servers": self.probed,
+            "unreachable_probes": self.unreachable,
+            "status_changes": self.status_changes,
+            "last_sweep_seconds": self.last_sweep_seconds,
+            "last_sweep_at": self.last_sweep_at
+        }
+
+health_prober = HealthProber(servers_repo, meta_repo)
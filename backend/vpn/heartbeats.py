@@ -0,0 +1,127 @@
+"""Client heartbeats and stale connection reaping"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from vpn.config import (
+    HEARTBEAT_FLUSH_SECONDS, HEARTBEAT_TIMEOUT_SECONDS, REAPER_INTERVAL_SECONDS, REAPER_BATCH_SIZE
+)
+from vpn.repositories import (
+    ServerRepository, ConnectionRepository, servers_repo, connections_repo, stats_repo, rollups_repo
+)
+from vpn.catalog import server_recommender
+from vpn.events import publish_connection_change
+from vpn.admission import record_bookkeeping
+
+logger = logging.getLogger(__name__)
+
+# Heartbeats
+class HeartbeatMonitor:
+    """Coalesces client heartbeats in memory and reaps connections that stop sending them
+
+    Each user has at most one active connection, so only the latest ping per
+    user is kept and a flush writes one update per user however often they
+    pinged. HEARTBEAT_TIMEOUT_SECONDS must comfortably exceed
+    HEARTBEAT_FLUSH_SECONDS so unflushed pings on other workers never look stale.
+    """
+
+    def __init__(self, connections: ConnectionRepository, servers: ServerRepository):
+        self.connections = connections
+        self.servers = servers
+        self._beats: Dict[str, datetime] = {}
+        self._flush_lock = asyncio.Lock()
+        self.received = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.reaped = 0
+
+    def beat(self, user_id: str) -> None:
+        self._beats[user_id] = datetime.utcnow()
+        self.received += 1
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._beats:
+                return 0
+            beats, self._beats = self._beats, {}
+            try:
+                await self.connections.touch_heartbeats(beats)
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Heartbeat flush failed, retrying %d users on the next flush", len(beats))
+                # Pings that arrived during the flush are newer, so keep those
+                for user_id, when in beats.items():
+                    self._beats.setdefault(user_id, when)
+                return 0
+            self.flushed += len(beats)
+            return len(beats)
+
+    async def reap(self) -> int:
+        """Close every connection whose last heartbeat is older than HEARTBEAT_TIMEOUT_SECONDS"""
+        await self.flush()
+        cutoff = datetime.utcnow() - timedelta(seconds=HEARTBEAT_TIMEOUT_SECONDS)
+        total = 0
+        while True:
+            stale = await self.connections.stale_ids(cutoff, REAPER_BATCH_SIZE)
+            if not stale:
+                break
+            closed = await self.connections.close_stale(stale, cutoff, str(uuid.uuid4()))
+            if closed:
+                await self._release(closed)
+                total += len(closed)
+            if not closed or len(stale) < REAPER_BATCH_SIZE:
+                break
+        self.reaped += total
+        return total
+
+    async def _release(self, closed: List[Dict[str, Any]]) -> None:
+        counts: Dict[str, int] = {}
+        for connection in closed:
+            counts[connection["server_id"]] = counts.get(connection["server_id"], 0) + 1
+        await self.servers.release_slots(counts)
+        for server_id, count in counts.items():
+            server_recommender.adjust(server_id, -count)
+        for connection in closed:
+            publish_connection_change(connection["user_id"], "disconnected", connection)
+        await record_bookkeeping(
+            stats_repo.increment(active_connections=-len(closed)),
+            rollups_repo.record_many([
+                (
+                    connection["server_id"],
+                    connection["disconnected_at"],
+                    {"disconnects": 1, "total_duration": connection.get("duration") or 0}
+                )
+                for connection in closed
+            ])
+        )
+
+    async def run(self) -> None:
+        """Flush coalesced heartbeats every HEARTBEAT_FLUSH_SECONDS"""
+        try:
+            while True:
+                await asyncio.sleep(HEARTBEAT_FLUSH_SECONDS)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def run_reaper(self) -> None:
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Stale connection reaping failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered_heartbeats": len(self._beats),
+            "received_heartbeats": self.received,
+            "flushed_heartbeats": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "reaped_connections": self.reaped
+        }
+
+heartbeat_monitor = HeartbeatMonitor(connections_repo, servers_repo)
@@ -0,0 +1,233 @@
+"""Index definitions and the explain-plan check for hot queries"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from vpn.db import mongo
+
+logger = logging.getLogger(__name__)
+
+# Indexes
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+    "sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # Mongo purges sessions once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "servers": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+    "rollups": [
+        IndexModel([("granularity", ASCENDING), ("bucket", ASCENDING)], name="granularity_bucket"),
+        IndexModel(
+            [("granularity", ASCENDING), ("server_id", ASCENDING), ("bucket", ASCENDING)],
+            name="granularity_server_id_bucket"
+        ),
+    ],
+    "connections": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)], name="user_id_status"),
+        # At most one active connection per user, enforced by Mongo
+        IndexModel(
+            [("user_id", ASCENDING)],
+            name="user_id_active_unique",
+            unique=True,
+            partialFilterExpression={"status": "active"}
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("connected_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_connected_at_id"
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("server_id", ASCENDING), ("connected_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_server_id_connected_at_id"
+        ),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("status", ASCENDING), ("last_heartbeat", ASCENDING)], name="status_last_heartbeat"),
+        IndexModel([("status", ASCENDING), ("disconnected_at", ASCENDING)], name="status_disconnected_at"),
+        IndexModel([("connected_at", ASCENDING)], name="connected_at"),
+        IndexModel([("server_id", ASCENDING), ("connected_at", ASCENDING)], name="server_id_connected_at"),
+        IndexModel(
+            [("server_id", ASCENDING)],
+            name="server_id_active",
+            partialFilterExpression={"status": "active"}
+        ),
+    ],
+    "connections_archive": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("connected_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_connected_at_id"
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("server_id", ASCENDING), ("connected_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_server_id_connected_at_id"
+        ),
+        IndexModel([("connected_at", ASCENDING)], name="connected_at"),
+        IndexModel([("disconnected_at", ASCENDING)], name="disconnected_at"),
+        IndexModel([("server_id", ASCENDING), ("connected_at", ASCENDING)], name="server_id_connected_at"),
+    ],
+}
+
+# Queries on the request path that must be served by an index
+HOT_QUERIES = [
+    ("sessions", {"session_token": "probe"}, None),
+    ("users", {"id": "probe"}, None),
+    ("users", {"email": "probe"}, None),
+    ("servers", {"id": "probe"}, None),
+    ("servers", {"id": {"$in": ["probe"]}}, None),
+    ("connections", {"user_id": "probe", "status": "active"}, None),
+    ("connections", {"user_id": "probe"}, [("connected_at", DESCENDING), ("id", DESCENDING)]),
+    ("connections", {"user_id": "probe", "server_id": "probe"}, [("connected_at", DESCENDING), ("id", DESCENDING)]),
+    ("connections", {"status": "active"}, None),
+    ("connections", {"server_id": "probe", "status": "active"}, None),
+    ("connections", {"connected_at": {"$gte": datetime(1970, 1, 1)}}, None),
+    ("connections", {"status": "disconnected", "disconnected_at": {"$lt": datetime(1970, 1, 1)}}, None),
+    ("connections_archive", {"user_id": "probe"}, [("connected_at", DESCENDING), ("id", DESCENDING)]),
+]
+
+async def merge_duplicate_users(apply: bool = False) -> List[Dict[str, Any]]:
+    """Report users sharing an email and, with apply, fold them into the earliest created one
+
+    Logins before the unique email index existed could race and insert the
+    same user twice. The kept user takes over the others' sessions and
+    finished connections, and stays an admin if any duplicate was one.
+    Active connections keep their old user_id and are reaped once their
+    heartbeats stop, since moving them could break the one-active rule.
+    """
+    users = mongo.collection("users")
+    groups = users.aggregate([
+        {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    report = []
+    async for group in groups:
+        duplicates = await users.find({"email": group["_id"]}).sort(
+            [("created_at", ASCENDING), ("id", ASCENDING)]
+        ).to_list(length=None)
+        keep, other_ids = duplicates[0], [user["id"] for user in duplicates[1:]]
+        admin = any(user.get("role") == "admin" for user in duplicates)
+        report.append({"email": group["_id"], "keep": keep["id"], "merge": other_ids, "admin": admin})
+        if not apply:
+            continue
+        if admin:
+            await users.update_one({"id": keep["id"]}, {"$set": {"role": "admin"}})
+        moved = {"user_id": {"$in": other_ids}}
+        await mongo.collection("sessions").update_many(moved, {"$set": {"user_id": keep["id"]}})
+        for name in ("connections", "connections_archive"):
+            await mongo.collection(name).update_many(
+                {**moved, "status": {"$ne": "active"}}, {"$set": {"user_id": keep["id"]}}
+            )
+        await users.delete_many({"id": {"$in": other_ids}})
+    return report
+
+async def close_duplicate_active_connections(apply: bool = False) -> List[Dict[str, Any]]:
+    """Report users with several active connections and, with apply, close all but the newest
+
+    Such rows predate the one-active-connection index or were left by the
+    connect race it now prevents. They are closed with close_reason
+    "duplicate" and their server slots are released.
+    """
+    connections = mongo.collection("connections")
+    groups = connections.aggregate([
+        {"$match": {"status": "active"}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    now = datetime.utcnow()
+    report = []
+    released: Dict[str, int] = {}
+    async for group in groups:
+        active = await connections.find({"user_id": group["_id"], "status": "active"}).sort(
+            [("connected_at", DESCENDING), ("id", DESCENDING)]
+        ).to_list(length=None)
+        report.append({
+            "user_id": group["_id"], "keep": active[0]["id"], "close": [connection["id"] for connection in active[1:]]
+        })
+        if not apply:
+            continue
+        for connection in active[1:]:
+            result = await connections.update_one({"id": connection["id"], "status": "active"}, {"$set": {
+                "status": "disconnected",
+                "disconnected_at": now,
+                "duration": max(0, int((now - connection["connected_at"]).total_seconds())),
+                "close_reason": "duplicate"
+            }})
+            if result.modified_count:
+                released[connection["server_id"]] = released.get(connection["server_id"], 0) + 1
+    for server_id, count in released.items():
+        await mongo.collection("servers").update_one(
+            {"id": server_id},
+            [{"$set": {"current_connections": {"$max": [0, {"$subtract": ["$current_connections", count]}]}}}]
+        )
+    return report
+
+# Repairs for data written before a unique index existed; run by repair_duplicates.py, never on startup
+DUPLICATE_REPAIRS = {"users": merge_duplicate_users, "connections": close_duplicate_active_connections}
+
+async def ensure_indexes() -> List[str]:
+    """Create the indexes every hot query relies on (idempotent)
+
+    A unique index that existing duplicates block is left unbuilt and
+    logged rather than repaired here, and its name is returned; the rest
+    of the collection's indexes are still built.
+    """
+    blocked = []
+    for collection_name, indexes in INDEXES.items():
+        collection = mongo.collection(collection_name)
+        try:
+            await collection.create_indexes(indexes)
+        except OperationFailure as exc:
+            if exc.code != 11000:
+                raise
+            for index in indexes:
+                try:
+                    await collection.create_indexes([index])
+                except OperationFailure as index_exc:
+                    if index_exc.code != 11000:
+                        raise
+                    blocked.append(f"{collection_name}.{index.document['name']}")
+                    logger.error(
+                        "Unique index %s on %s is not built because of duplicates; "
+                        "review them with `python repair_duplicates.py` and fix with --apply",
+                        index.document["name"], collection_name
+                    )
+    return blocked
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+async def explain_hot_queries() -> List[Dict[str, Any]]:
+    """Run explain on each hot query and report whether it avoids a collection scan"""
+    results = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = mongo.collection(collection_name).find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        results.append({
+            "collection": collection_name,
+            "query": list(query.keys()),
+            "sort": [field for field, _ in sort] if sort else [],
+            "stages": stages,
+            "indexed": "COLLSCAN" not in stages
+        })
+    return results
@@ -0,0 +1,195 @@
+"""Prometheus-style request and MongoDB command metrics"""
+
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+# Metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COMMANDS_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+class Histogram:
+    """Fixed-bucket histogram rendered in Prometheus cumulative form"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestTrace:
+    """Per-request attribution target for Mongo commands issued while serving it"""
+
+    __slots__ = ("route", "mongo_commands")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.mongo_commands = 0
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+def prometheus_labels(**labels: Any) -> str:
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+class MetricsRegistry:
+    """Per-route HTTP and Mongo command metrics exposed on /metrics"""
+
+    def __init__(self):
+        # Command listener callbacks run on Motor's executor threads
+        self._lock = threading.Lock()
+        self.requests: Dict[tuple, int] = {}
+        self.in_flight: Dict[tuple, int] = {}
+        self.latency: Dict[tuple, Histogram] = {}
+        self.commands_per_request: Dict[tuple, Histogram] = {}
+        self.mongo_commands: Dict[tuple, int] = {}
+        self.mongo_failures: Dict[tuple, int] = {}
+        self.mongo_latency: Dict[tuple, Histogram] = {}
+        self.throttled: Dict[tuple, int] = {}
+        self.startup_seconds: Optional[float] = None
+
+    def request_started(self, method: str, route: str) -> None:
+        key = (method, route)
+        with self._lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float, mongo_commands: int) -> None:
+        key = (method, route)
+        with self._lock:
+            self.in_flight[key] -= 1
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.commands_per_request.setdefault(key, Histogram(COMMANDS_PER_REQUEST_BUCKETS)).observe(mongo_commands)
+
+    def request_throttled(self, throttle: str, reason: str) -> None:
+        key = (throttle, reason)
+        with self._lock:
+            self.throttled[key] = self.throttled.get(key, 0) + 1
+
+    def command_finished(self, command: str, seconds: float, failed: bool) -> None:
+        trace = current_trace.get()
+        key = (trace.route if trace else "background", command)
+        with self._lock:
+            if trace is not None:
+                trace.mongo_commands += 1
+            self.mongo_commands[key] = self.mongo_commands.get(key, 0) + 1
+            if failed:
+                self.mongo_failures[key] = self.mongo_failures.get(key, 0) + 1
+            self.mongo_latency.setdefault(key, Histogram(MONGO_LATENCY_BUCKETS)).observe(seconds)
+
+    @staticmethod
+    def _render_counter(lines: List[str], name: str, help_text: str, kind: str,
+                        values: Dict[tuple, int], label_names: tuple) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}{prometheus_labels(**dict(zip(label_names, key)))} {value}")
+
+    @staticmethod
+    def _render_histogram(lines: List[str], name: str, help_text: str,
+                          values: Dict[tuple, Histogram], label_names: tuple) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(values.items()):
+            labels = dict(zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{prometheus_labels(**labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{prometheus_labels(**labels)} {histogram.sum}")
+            lines.append(f"{name}_count{prometheus_labels(**labels)} {histogram.count}")
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines: List[str] = []
+        if self.startup_seconds is not None:
+            lines.append("# HELP app_startup_seconds Time the app lifespan took to become ready.")
+            lines.append("# TYPE app_startup_seconds gauge")
+            lines.append(f"app_startup_seconds {self.startup_seconds}")
+        with self._lock:
+            self._render_counter(lines, "http_requests_total", "HTTP requests by route and status.",
+                                 "counter", self.requests, ("method", "route", "status"))
+            self._render_counter(lines, "http_requests_in_flight", "HTTP requests currently being served.",
+                                 "gauge", self.in_flight, ("method", "route"))
+            self._render_histogram(lines, "http_request_duration_seconds", "HTTP request latency.",
+                                   self.latency, ("method", "route"))
+            self._render_histogram(lines, "http_request_mongo_commands", "Mongo commands issued per HTTP request.",
+                                   self.commands_per_request, ("method", "route"))
+            self._render_counter(lines, "http_requests_throttled_total", "Requests shed with 429 by admission control.",
+                                 "counter", self.throttled, ("throttle", "reason"))
+            self._render_counter(lines, "mongodb_commands_total", "Mongo commands by issuing route.",
+                                 "counter", self.mongo_commands, ("route", "command"))
+            self._render_counter(lines, "mongodb_command_failures_total", "Failed Mongo commands by issuing route.",
+                                 "counter", self.mongo_failures, ("route", "command"))
+            self._render_histogram(lines, "mongodb_command_duration_seconds", "Mongo command latency.",
+                                   self.mongo_latency, ("route", "command"))
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Attribute Mongo command counts and durations to the request that issued them"""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        metrics.command_finished(event.command_name, event.duration_micros / 1e6, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        metrics.command_finished(event.command_name, event.duration_micros / 1e6, failed=True)
+
+class MetricsMiddleware:
+    """Record latency, status and in-flight counts per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def route_template(scope) -> str:
+        # Label by path template so ids in URLs don't explode label cardinality
+        partial = None
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.route_template(scope)
+        trace = RequestTrace(route)
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.request_started(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.request_finished(method, route, status, time.perf_counter() - started, trace.mongo_commands)
+            current_trace.reset(token)
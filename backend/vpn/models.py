@@ -0,0 +1,79 @@
+"""API models, field projections and JSON helpers"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, TypeAdapter
+
+# Pydantic models
+class User(BaseModel):
+    id: str
+    email: str
+    name: str
+    picture: Optional[str] = None
+    role: str = "user"  # user or admin
+    created_at: datetime
+    last_login: Optional[datetime] = None
+
+class Server(BaseModel):
+    id: str
+    name: str
+    country: str
+    city: str
+    ip_address: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    status: str = "online"  # online, offline, maintenance
+    status_source: str = "admin"  # admin or probe: who set the status last
+    load: int = 0  # 0-100 percentage
+    max_connections: int = 1000
+    current_connections: int = 0
+    probe_port: Optional[int] = None  # defaults to HEALTH_PROBE_PORT
+    latency_ms: Optional[float] = None
+    last_probed_at: Optional[datetime] = None
+    created_at: datetime
+
+class Connection(BaseModel):
+    id: str
+    user_id: str
+    server_id: str
+    connected_at: datetime
+    disconnected_at: Optional[datetime] = None
+    duration: Optional[int] = None  # in seconds
+    data_transferred: Optional[int] = None  # in bytes
+    bytes_in: Optional[int] = None
+    bytes_out: Optional[int] = None
+    last_usage_at: Optional[datetime] = None
+    last_heartbeat: Optional[datetime] = None
+    close_reason: Optional[str] = None  # timeout when closed by the stale connection reaper
+    status: str = "active"  # active, disconnected
+
+# Projections returning exactly the API fields of each document
+USER_PROJECTION = {"_id": 0, **dict.fromkeys(User.model_fields, 1)}
+SERVER_PROJECTION = {"_id": 0, **dict.fromkeys(Server.model_fields, 1)}
+CONNECTION_PROJECTION = {"_id": 0, **dict.fromkeys(Connection.model_fields, 1)}
+
+SERVER_LIST_ADAPTER = TypeAdapter(List[Server])
+
+def validate_coordinates(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Check that server latitude/longitude are set together and in range; returns the fields"""
+    if "latitude" not in fields and "longitude" not in fields:
+        return fields
+    latitude, longitude = fields.get("latitude"), fields.get("longitude")
+    if latitude is None and longitude is None:
+        return fields
+    if latitude is None or longitude is None:
+        raise ValueError("latitude and longitude must be set together")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("latitude must be within ±90 and longitude within ±180")
+    return fields
+
+class AuthResponse(BaseModel):
+    user: User
+    session_token: str
+
+def json_default(value: Any) -> Any:
+    """JSON fallback matching FastAPI's encoding of Mongo documents"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,43 @@
+"""Keyset pagination cursors, date range parameters and NDJSON streaming"""
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+import orjson
+
+from vpn.models import json_default
+
+# Keyset pagination
+def encode_cursor(when: datetime, item_id: str) -> str:
+    """Encode a (timestamp, id) sort key as an opaque page token"""
+    raw = json.dumps([when.isoformat(), item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        when, item_id = json.loads(raw)
+        return datetime.fromisoformat(when), str(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+
+def keyset_after(field: str, when: datetime, item_id: str, descending: bool = False) -> Dict[str, Any]:
+    """Filter for documents strictly after (when, item_id) in (field, id) order"""
+    op = "$lt" if descending else "$gt"
+    return {"$or": [{field: {op: when}}, {field: when, "id": {op: item_id}}]}
+
+# Date range parameters
+def as_naive_utc(when: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; convert an offset-aware query parameter to match"""
+    if when is None or when.tzinfo is None:
+        return when
+    return when.astimezone(timezone.utc).replace(tzinfo=None)
+
+# NDJSON streaming
+async def stream_ndjson(cursor):
+    """Yield a Motor cursor as newline-delimited JSON, one batch in memory at a time"""
+    async for document in cursor:
+        yield orjson.dumps(document, default=json_default) + b"\n"
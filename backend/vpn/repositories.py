@@ -0,0 +1,675 @@
+"""Repository layer: one class per collection and the shared instances"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne, timeout
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from vpn.config import (
+    MONGO_OPERATION_TIMEOUT_MS, STREAM_BATCH_SIZE, EXPORT_BATCH_SIZE, EXPORT_COLUMNS,
+    ROLLUP_GRANULARITIES
+)
+from vpn.db import mongo
+from vpn.models import USER_PROJECTION, SERVER_PROJECTION, CONNECTION_PROJECTION, validate_coordinates
+from vpn.pagination import keyset_after
+
+# Repository layer
+class Repository:
+    """Base class for non-blocking collection access with per-operation timeouts"""
+
+    def __init__(self, collection_name: str, timeout_ms: int = MONGO_OPERATION_TIMEOUT_MS):
+        self.collection_name = collection_name
+        self.timeout_ms = timeout_ms
+
+    @property
+    def collection(self):
+        return mongo.collection(self.collection_name)
+
+    def write_timeout(self):
+        """Bound the writes in a with block; insert, update, delete and bulk_write take no maxTimeMS argument"""
+        return timeout(self.timeout_ms / 1000)
+
+    async def count(self, query: Optional[Dict[str, Any]] = None) -> int:
+        return await self.collection.count_documents(query or {}, maxTimeMS=self.timeout_ms)
+
+    async def update_and_fetch(self, query: Dict[str, Any], update: Any, projection: Dict[str, Any]):
+        """find_one_and_update returning the updated document, or None when nothing matched
+
+        _id is fetched and dropped so in-memory stand-ins, which re-read the
+        updated row by _id or else by the original filter, still find a row
+        the update moved out of that filter.
+        """
+        document = await self.collection.find_one_and_update(
+            query, update, projection={**projection, "_id": 1}, return_document=ReturnDocument.AFTER,
+            maxTimeMS=self.timeout_ms
+        )
+        if document:
+            document.pop("_id", None)
+        return document
+
+class UserRepository(Repository):
+    async def get_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": user_id}, USER_PROJECTION, max_time_ms=self.timeout_ms)
+
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"email": email}, USER_PROJECTION, max_time_ms=self.timeout_ms)
+
+    def _keyset(self, after: Optional[tuple]):
+        query = keyset_after("created_at", *after) if after else {}
+        return self.collection.find(query, USER_PROJECTION).sort([("created_at", ASCENDING), ("id", ASCENDING)])
+
+    async def page(self, after: Optional[tuple], limit: int) -> List[Dict[str, Any]]:
+        """Fetch up to limit + 1 users after the cursor so callers can tell if more remain"""
+        cursor = self._keyset(after).max_time_ms(self.timeout_ms).limit(limit + 1)
+        return await cursor.to_list(length=limit + 1)
+
+    def stream(self, after: Optional[tuple], batch_size: int = STREAM_BATCH_SIZE):
+        return self._keyset(after).batch_size(batch_size)
+
+    async def create(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert a user, or return the existing one if a concurrent login inserted the email first"""
+        try:
+            with self.write_timeout():
+                await self.collection.insert_one(dict(user_data))
+        except DuplicateKeyError:
+            return await self.get_by_email(user_data["email"])
+        return None
+
+    async def touch_last_login(self, email: str, when: datetime) -> None:
+        with self.write_timeout():
+            await self.collection.update_one({"email": email}, {"$set": {"last_login": when}})
+
+    async def set_role(self, user_id: str, role: str) -> int:
+        with self.write_timeout():
+            result = await self.collection.update_one({"id": user_id}, {"$set": {"role": role}})
+        return result.matched_count
+
+class SessionRepository(Repository):
+    async def get(self, session_token: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one(
+            {"session_token": session_token}, {"_id": 0}, max_time_ms=self.timeout_ms
+        )
+
+    async def replace_for_user(self, user_id: str, session_data: Dict[str, Any]) -> None:
+        with self.write_timeout():
+            await self.collection.delete_many({"user_id": user_id})
+            await self.collection.insert_one(dict(session_data))
+
+    async def delete_for_user(self, user_id: str) -> None:
+        with self.write_timeout():
+            await self.collection.delete_many({"user_id": user_id})
+
+class ServerRepository(Repository):
+    async def get(self, server_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": server_id}, SERVER_PROJECTION, max_time_ms=self.timeout_ms)
+
+    async def list_all(self) -> List[Dict[str, Any]]:
+        cursor = self.collection.find({}, SERVER_PROJECTION, max_time_ms=self.timeout_ms)
+        return await cursor.to_list(length=None)
+
+    async def get_metadata(self, server_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch name and country for many servers in one round trip"""
+        if not server_ids:
+            return {}
+        cursor = self.collection.find(
+            {"id": {"$in": list(set(server_ids))}},
+            {"_id": 0, "id": 1, "name": 1, "country": 1},
+            max_time_ms=self.timeout_ms
+        )
+        return {server["id"]: server async for server in cursor}
+
+    async def countries(self) -> List[str]:
+        return await self.collection.distinct("country", maxTimeMS=self.timeout_ms)
+
+    async def create(self, server: Dict[str, Any]) -> None:
+        with self.write_timeout():
+            await self.collection.insert_one(validate_coordinates(dict(server)))
+
+    async def seed(self, servers: List[Dict[str, Any]]) -> int:
+        """Insert servers that don't exist yet by id and return how many were inserted"""
+        operations = [UpdateOne({"id": server["id"]}, {"$setOnInsert": server}, upsert=True) for server in servers]
+        try:
+            with self.write_timeout():
+                result = await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            # Two upserts racing on the unique id index: the other worker inserted it
+            if any(error.get("code") != 11000 for error in exc.details["writeErrors"]):
+                raise
+            return exc.details["nUpserted"]
+        return result.upserted_count
+
+    async def update(self, server_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply fields and return the server's previous status, or None if it does not exist"""
+        if "status" in fields:
+            # The health prober leaves an admin's offline alone unless status_source hands it back
+            fields = {"status_source": "admin", **fields}
+        return await self.collection.find_one_and_update(
+            {"id": server_id},
+            {"$set": validate_coordinates(fields)},
+            projection={"_id": 0, "status": 1},
+            return_document=ReturnDocument.BEFORE,
+            maxTimeMS=self.timeout_ms
+        )
+
+    async def delete(self, server_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one_and_delete(
+            {"id": server_id}, projection={"_id": 0, "status": 1}, maxTimeMS=self.timeout_ms
+        )
+
+    async def statuses(self, server_ids: List[str]) -> Dict[str, str]:
+        cursor = self.collection.find(
+            {"id": {"$in": server_ids}},
+            {"_id": 0, "id": 1, "status": 1},
+            max_time_ms=self.timeout_ms
+        )
+        return {server["id"]: server.get("status") async for server in cursor}
+
+    async def bulk_write(self, operations: list, ordered: bool) -> Dict[int, str]:
+        """Apply operations in one bulk_write and return write errors by operation index"""
+        try:
+            with self.write_timeout():
+                await self.collection.bulk_write(operations, ordered=ordered)
+        except BulkWriteError as exc:
+            return {error["index"]: error.get("errmsg", "Write failed") for error in exc.details["writeErrors"]}
+        return {}
+
+    async def probe_targets(self) -> List[Dict[str, Any]]:
+        """Servers the health prober owns the status of, with what a sweep needs to update them"""
+        cursor = self.collection.find(
+            {"status": {"$in": ["online", "offline"]}},
+            {
+                "_id": 0, "id": 1, "ip_address": 1, "probe_port": 1, "status": 1, "status_source": 1,
+                "probe_failures": 1, "current_connections": 1, "max_connections": 1
+            },
+            max_time_ms=self.timeout_ms
+        )
+        return await cursor.to_list(length=None)
+
+    async def record_probes(self, updates: Dict[str, Dict[str, Any]], previous: Dict[str, Dict[str, Any]]) -> None:
+        """Write one sweep's results in a single bulk_write, leaving servers put into maintenance meanwhile
+
+        A status change only applies while the server still has the status
+        and status_source in `previous`, so an admin's change mid-sweep wins.
+        """
+        operations = [
+            UpdateOne(
+                {"id": server_id, **previous.get(server_id, {"status": {"$in": ["online", "offline"]}})},
+                {"$set": fields}
+            )
+            for server_id, fields in updates.items()
+        ]
+        if operations:
+            with self.write_timeout():
+                await self.collection.bulk_write(operations, ordered=False)
+
+    async def reserve_slot(self, server_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically take a connection slot on an online server that has capacity left"""
+        return await self.update_and_fetch(
+            {
+                "id": server_id,
+                "status": "online",
+                "$expr": {"$lt": ["$current_connections", "$max_connections"]}
+            },
+            {"$inc": {"current_connections": 1}},
+            {"id": 1, "name": 1, "current_connections": 1}
+        )
+
+    async def add_usage(self, usage: Dict[str, tuple]) -> None:
+        """Fold (bytes_in, bytes_out) totals into each server's traffic counters"""
+        operations = [
+            UpdateOne({"id": server_id}, {"$inc": {
+                "bytes_in": bytes_in,
+                "bytes_out": bytes_out,
+                "data_transferred": bytes_in + bytes_out
+            }})
+            for server_id, (bytes_in, bytes_out) in usage.items()
+        ]
+        if operations:
+            with self.write_timeout():
+                await self.collection.bulk_write(operations, ordered=False)
+
+    async def release_slot(self, server_id: str) -> Optional[int]:
+        """Give a slot back, returning the server's connection count just before, or None if none was held"""
+        server = await self.collection.find_one_and_update(
+            {"id": server_id, "current_connections": {"$gt": 0}},
+            {"$inc": {"current_connections": -1}},
+            projection={"_id": 0, "current_connections": 1},
+            return_document=ReturnDocument.BEFORE,
+            maxTimeMS=self.timeout_ms
+        )
+        return server["current_connections"] if server else None
+
+    async def release_slots(self, counts: Dict[str, int]) -> None:
+        """Release several slots per server in one round trip, never going below zero"""
+        operations = [
+            UpdateOne(
+                {"id": server_id},
+                [{"$set": {"current_connections": {"$max": [0, {"$subtract": ["$current_connections", count]}]}}}]
+            )
+            for server_id, count in counts.items()
+        ]
+        with self.write_timeout():
+            await self.collection.bulk_write(operations, ordered=False)
+
+class ConnectionRepository(Repository):
+    async def get_active(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one(
+            {"user_id": user_id, "status": "active"}, CONNECTION_PROJECTION, max_time_ms=self.timeout_ms
+        )
+
+    @staticmethod
+    def history_filter(
+        user_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        server_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"user_id": user_id}
+        if server_id:
+            query["server_id"] = server_id
+        if start or end:
+            query["connected_at"] = {}
+            if start:
+                query["connected_at"]["$gte"] = start
+            if end:
+                query["connected_at"]["$lt"] = end
+        return query
+
+    async def history(
+        self,
+        query: Dict[str, Any],
+        limit: int = 50,
+        after: Optional[tuple] = None
+    ) -> List[Dict[str, Any]]:
+        """Fetch up to limit + 1 connections, newest first, after the keyset cursor"""
+        if after:
+            query = {"$and": [query, keyset_after("connected_at", *after, descending=True)]}
+        cursor = self.collection.find(
+            query, CONNECTION_PROJECTION, max_time_ms=self.timeout_ms
+        ).sort([("connected_at", DESCENDING), ("id", DESCENDING)]).limit(limit + 1)
+        return await cursor.to_list(length=limit + 1)
+
+    async def history_totals(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Session count, total duration and distinct server ids of the matching connections"""
+        pipeline = [
+            {"$match": query},
+            {"$group": {
+                "_id": None,
+                "session_count": {"$sum": 1},
+                "total_duration": {"$sum": "$duration"},
+                "servers": {"$addToSet": "$server_id"}
+            }},
+            {"$project": {"_id": 0}}
+        ]
+        cursor = self.collection.aggregate(pipeline, maxTimeMS=self.timeout_ms)
+        totals = await cursor.to_list(length=1)
+        return totals[0] if totals else {"session_count": 0, "total_duration": 0, "servers": []}
+
+    @staticmethod
+    def summarize(*totals: Dict[str, Any]) -> Dict[str, Any]:
+        servers = set()
+        for part in totals:
+            servers.update(part["servers"])
+        return {
+            "session_count": sum(part["session_count"] for part in totals),
+            "total_duration": sum(part["total_duration"] for part in totals),
+            "unique_servers": len(servers)
+        }
+
+    async def create(self, connection_data: Dict[str, Any]) -> None:
+        with self.write_timeout():
+            await self.collection.insert_one(dict(connection_data))
+
+    @staticmethod
+    def export_filter(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        server_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        query: Dict[str, Any] = {}
+        if server_id:
+            query["server_id"] = server_id
+        if start or end:
+            query["connected_at"] = {}
+            if start:
+                query["connected_at"]["$gte"] = start
+            if end:
+                query["connected_at"]["$lt"] = end
+        return query
+
+    def export(self, query: Dict[str, Any], batch_size: int = EXPORT_BATCH_SIZE, extra_fields: Sequence[str] = ()):
+        # No maxTimeMS: it would cap the whole export, not each batch
+        projection = {"_id": 0, **{column: 1 for column in EXPORT_COLUMNS if column not in ("server_name", "server_country")}}
+        projection.update({field: 1 for field in extra_fields})
+        return self.collection.find(query, projection).sort("connected_at", ASCENDING).batch_size(batch_size)
+
+    async def server_ids(self, connection_ids: List[str]) -> Dict[str, str]:
+        cursor = self.collection.find(
+            {"id": {"$in": connection_ids}},
+            {"_id": 0, "id": 1, "server_id": 1},
+            max_time_ms=self.timeout_ms
+        )
+        return {connection["id"]: connection["server_id"] async for connection in cursor}
+
+    async def add_usage(self, usage: Dict[str, list]) -> None:
+        """Fold [bytes_in, bytes_out, last_timestamp] totals into each connection"""
+        operations = [
+            UpdateOne({"id": connection_id}, {
+                "$inc": {
+                    "bytes_in": bytes_in,
+                    "bytes_out": bytes_out,
+                    "data_transferred": bytes_in + bytes_out
+                },
+                "$max": {"last_usage_at": datetime.utcfromtimestamp(last_timestamp)}
+            })
+            for connection_id, (bytes_in, bytes_out, last_timestamp) in usage.items()
+        ]
+        if operations:
+            with self.write_timeout():
+                await self.collection.bulk_write(operations, ordered=False)
+
+    async def count_by_day(self, since: datetime) -> Dict[str, int]:
+        pipeline = [
+            {"$match": {"connected_at": {"$gte": since}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$connected_at"}},
+                "connections": {"$sum": 1}
+            }}
+        ]
+        cursor = self.collection.aggregate(pipeline, maxTimeMS=self.timeout_ms)
+        return {doc["_id"]: doc["connections"] async for doc in cursor}
+
+    async def close_active(self, user_id: str, when: datetime) -> Optional[Dict[str, Any]]:
+        """Close the user's active connection, recording its duration, and return it"""
+        return await self.update_and_fetch(
+            {"user_id": user_id, "status": "active"},
+            [{
+                "$set": {
+                    "status": "disconnected",
+                    "disconnected_at": when,
+                    "duration": {
+                        "$toInt": {"$floor": {"$divide": [{"$subtract": [when, "$connected_at"]}, 1000]}}
+                    }
+                }
+            }],
+            CONNECTION_PROJECTION
+        )
+
+    async def touch_heartbeats(self, beats: Dict[str, datetime]) -> None:
+        """Record the latest heartbeat for each user's active connection"""
+        operations = [
+            UpdateOne({"user_id": user_id, "status": "active"}, {"$max": {"last_heartbeat": when}})
+            for user_id, when in beats.items()
+        ]
+        with self.write_timeout():
+            await self.collection.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def stale_filter(cutoff: datetime) -> Dict[str, Any]:
+        # Connections opened before heartbeats were recorded fall back to connected_at
+        return {
+            "status": "active",
+            "$or": [
+                {"last_heartbeat": {"$lt": cutoff}},
+                {"last_heartbeat": None, "connected_at": {"$lt": cutoff}}
+            ]
+        }
+
+    async def stale_ids(self, cutoff: datetime, limit: int) -> List[str]:
+        cursor = self.collection.find(
+            self.stale_filter(cutoff), {"_id": 0, "id": 1}, max_time_ms=self.timeout_ms
+        ).limit(limit)
+        return [connection["id"] async for connection in cursor]
+
+    async def close_stale(self, connection_ids: List[str], cutoff: datetime, reap_id: str) -> List[Dict[str, Any]]:
+        """Close connections that are still stale as of their last heartbeat and return the ones this call closed"""
+        last_seen = {"$ifNull": ["$last_heartbeat", "$connected_at"]}
+        with self.write_timeout():
+            await self.collection.update_many(
+                {"id": {"$in": connection_ids}, **self.stale_filter(cutoff)},
+                [{
+                    "$set": {
+                        "status": "disconnected",
+                        "disconnected_at": last_seen,
+                        "duration": {
+                            "$toInt": {"$floor": {"$divide": [{"$subtract": [last_seen, "$connected_at"]}, 1000]}}
+                        },
+                        "close_reason": "timeout",
+                        "reap_id": reap_id
+                    }
+                }]
+            )
+        cursor = self.collection.find(
+            {"id": {"$in": connection_ids}, "reap_id": reap_id},
+            CONNECTION_PROJECTION,
+            max_time_ms=self.timeout_ms
+        )
+        return await cursor.to_list(length=None)
+
+    async def archivable_ids(self, cutoff: datetime, reclaim_before: datetime, limit: int) -> List[str]:
+        cursor = self.collection.find(
+            self.archivable_filter(cutoff, reclaim_before), {"_id": 0, "id": 1}, max_time_ms=self.timeout_ms
+        ).limit(limit)
+        return [connection["id"] async for connection in cursor]
+
+    @staticmethod
+    def archivable_filter(cutoff: datetime, reclaim_before: datetime) -> Dict[str, Any]:
+        # Claims left behind by a worker that died mid-batch expire after ARCHIVE_CLAIM_TIMEOUT
+        return {
+            "status": "disconnected",
+            "disconnected_at": {"$lt": cutoff},
+            "$or": [{"archive_claimed_at": None}, {"archive_claimed_at": {"$lt": reclaim_before}}]
+        }
+
+    async def oldest_archive_claim(self, cutoff: datetime) -> Optional[datetime]:
+        """When the oldest claimed row still in the hot collection was claimed, if any"""
+        cursor = self.collection.find(
+            {"status": "disconnected", "disconnected_at": {"$lt": cutoff}, "archive_claimed_at": {"$ne": None}},
+            {"_id": 0, "archive_claimed_at": 1},
+            max_time_ms=self.timeout_ms
+        )
+        return min([connection["archive_claimed_at"] async for connection in cursor], default=None)
+
+    async def claim_for_archive(
+        self, connection_ids: List[str], cutoff: datetime, reclaim_before: datetime, archive_id: str, when: datetime
+    ) -> List[Dict[str, Any]]:
+        """Claim connections for one archive batch and return the full documents this call claimed"""
+        with self.write_timeout():
+            await self.collection.update_many(
+                {"id": {"$in": connection_ids}, **self.archivable_filter(cutoff, reclaim_before)},
+                {"$set": {"archive_id": archive_id, "archive_claimed_at": when}}
+            )
+        cursor = self.collection.find(
+            {"id": {"$in": connection_ids}, "archive_id": archive_id},
+            {"archive_id": 0, "archive_claimed_at": 0},
+            max_time_ms=self.timeout_ms
+        )
+        return await cursor.to_list(length=None)
+
+    async def insert_archived(self, connections: List[Dict[str, Any]]) -> None:
+        try:
+            with self.write_timeout():
+                await self.collection.insert_many(connections, ordered=False)
+        except BulkWriteError as exc:
+            # Rows copied by an earlier attempt whose delete from the hot collection never ran
+            if any(error.get("code") != 11000 for error in exc.details["writeErrors"]):
+                raise
+
+    async def delete_archived(self, connection_ids: List[str], archive_id: str) -> int:
+        with self.write_timeout():
+            result = await self.collection.delete_many({"id": {"$in": connection_ids}, "archive_id": archive_id})
+        return result.deleted_count
+
+class StatsRepository(Repository):
+    """Incrementally maintained dashboard counters with per-day connection buckets"""
+
+    TOTALS_ID = "totals"
+
+    @staticmethod
+    def day_key(when: datetime) -> str:
+        return when.strftime("%Y-%m-%d")
+
+    async def increment(self, **deltas: int) -> None:
+        with self.write_timeout():
+            await self.collection.update_one({"_id": self.TOTALS_ID}, {"$inc": deltas}, upsert=True)
+
+    async def record_connect(self, when: datetime) -> None:
+        day = self.day_key(when)
+        with self.write_timeout():
+            await self.collection.bulk_write([
+                UpdateOne({"_id": self.TOTALS_ID}, {"$inc": {"active_connections": 1}}, upsert=True),
+                UpdateOne({"_id": f"day:{day}"}, {"$inc": {"connections": 1}, "$set": {"day": day}}, upsert=True),
+            ], ordered=False)
+
+    async def get_totals(self) -> Dict[str, Any]:
+        return await self.collection.find_one({"_id": self.TOTALS_ID}, max_time_ms=self.timeout_ms) or {}
+
+    async def sum_days(self, days: List[str]) -> int:
+        cursor = self.collection.find(
+            {"_id": {"$in": [f"day:{day}" for day in days]}},
+            {"connections": 1},
+            max_time_ms=self.timeout_ms
+        )
+        return sum([doc.get("connections", 0) async for doc in cursor])
+
+    async def replace(self, totals: Dict[str, int], days: Dict[str, int]) -> None:
+        operations = [UpdateOne({"_id": self.TOTALS_ID}, {"$set": totals}, upsert=True)]
+        for day, connections in days.items():
+            operations.append(
+                UpdateOne({"_id": f"day:{day}"}, {"$set": {"day": day, "connections": connections}}, upsert=True)
+            )
+        with self.write_timeout():
+            await self.collection.bulk_write(operations, ordered=False)
+
+class RollupRepository(Repository):
+    """Per-server hourly and daily buckets of connection activity"""
+
+    @staticmethod
+    def bucket_start(when: datetime, granularity: str) -> datetime:
+        if granularity == "hour":
+            return when.replace(minute=0, second=0, microsecond=0)
+        return datetime(when.year, when.month, when.day)
+
+    @staticmethod
+    def bucket_id(granularity: str, server_id: str, bucket: datetime) -> str:
+        return f"{granularity}:{server_id}:{bucket.isoformat()}"
+
+    async def record(
+        self,
+        server_id: str,
+        when: datetime,
+        increments: Dict[str, int],
+        peak_concurrent: Optional[int] = None
+    ) -> None:
+        with self.write_timeout():
+            await self.collection.bulk_write(self._updates(server_id, when, increments, peak_concurrent), ordered=False)
+
+    async def record_many(self, events: List[tuple]) -> None:
+        """Record (server_id, when, increments) events in one bulk write"""
+        operations = []
+        for server_id, when, increments in events:
+            operations.extend(self._updates(server_id, when, increments))
+        with self.write_timeout():
+            await self.collection.bulk_write(operations, ordered=False)
+
+    def _updates(
+        self,
+        server_id: str,
+        when: datetime,
+        increments: Dict[str, int],
+        peak_concurrent: Optional[int] = None
+    ) -> List[UpdateOne]:
+        operations = []
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = self.bucket_start(when, granularity)
+            update: Dict[str, Any] = {
+                "$inc": increments,
+                "$setOnInsert": {"server_id": server_id, "granularity": granularity, "bucket": bucket}
+            }
+            if peak_concurrent is not None:
+                update["$max"] = {"peak_concurrent": peak_concurrent}
+            operations.append(UpdateOne({"_id": self.bucket_id(granularity, server_id, bucket)}, update, upsert=True))
+        return operations
+
+    async def replace(self, buckets: List[Dict[str, Any]], batch_size: int = 1000) -> None:
+        for offset in range(0, len(buckets), batch_size):
+            operations = [
+                UpdateOne(
+                    {"_id": self.bucket_id(bucket["granularity"], bucket["server_id"], bucket["bucket"])},
+                    {"$set": bucket},
+                    upsert=True
+                )
+                for bucket in buckets[offset:offset + batch_size]
+            ]
+            with self.write_timeout():
+                await self.collection.bulk_write(operations, ordered=False)
+
+    async def series(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        server_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"granularity": granularity, "bucket": {"$gte": start, "$lt": end}}
+        if server_id:
+            query["server_id"] = server_id
+        cursor = self.collection.find(query, {"_id": 0}, max_time_ms=self.timeout_ms).sort("bucket", ASCENDING)
+        return await cursor.to_list(length=None)
+
+class MetaRepository(Repository):
+    """Small named documents shared between workers, such as version counters"""
+
+    async def get_version(self, key: str) -> int:
+        doc = await self.collection.find_one({"_id": key}, {"version": 1}, max_time_ms=self.timeout_ms)
+        return doc["version"] if doc else 0
+
+    async def bump_version(self, key: str) -> int:
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            maxTimeMS=self.timeout_ms
+        )
+        return doc["version"]
+
+    async def bump_version_with(self, key: str, item: str, history: int) -> int:
+        """Bump a version and append item to the list of the last `history` items, one per version"""
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"version": 1}, "$push": {"items": {"$each": [item], "$slice": -history}}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            maxTimeMS=self.timeout_ms
+        )
+        return doc["version"]
+
+    async def get_version_items(self, key: str) -> tuple:
+        doc = await self.collection.find_one({"_id": key}, {"version": 1, "items": 1}, max_time_ms=self.timeout_ms)
+        return (doc["version"], doc.get("items", [])) if doc else (0, [])
+
+    async def acquire_lease(self, key: str, owner: str, ttl: timedelta) -> bool:
+        """Take or renew a named lease so only one worker runs a periodic job"""
+        now = datetime.utcnow()
+        try:
+            with self.write_timeout():
+                await self.collection.update_one(
+                    {"_id": key, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+                    {"$set": {"owner": owner, "expires_at": now + ttl}},
+                    upsert=True
+                )
+        except DuplicateKeyError:
+            # Held by another worker: the upsert tried to insert a second document with this _id
+            return False
+        return True
+
+users_repo = UserRepository("users")
+sessions_repo = SessionRepository("sessions")
+servers_repo = ServerRepository("servers")
+connections_repo = ConnectionRepository("connections")
+archived_connections_repo = ConnectionRepository("connections_archive")
+stats_repo = StatsRepository("stats")
+rollups_repo = RollupRepository("rollups")
+meta_repo = MetaRepository("meta")
@@ -0,0 +1,98 @@
+"""Sample data for development databases"""
+
+import uuid
+from datetime import datetime
+
+from vpn.repositories import servers_repo
+from vpn.catalog import server_catalog
+
+# Initialize sample data
+async def init_sample_data():
+    """Initialize sample servers if none exist; safe when several workers start at once"""
+    if await servers_repo.count() == 0:
+        now = datetime.utcnow()
+        sample_servers = [
+            {
+                "name": "US East (New York)",
+                "country": "United States",
+                "city": "New York",
+                "latitude": 40.7128,
+                "longitude": -74.006,
+                "ip_address": "198.51.100.10",
+                "status": "online",
+                "load": 25,
+                "max_connections": 1000,
+                "current_connections": 250,
+                "created_at": now
+            },
+            {
+                "name": "US West (Los Angeles)",
+                "country": "United States",
+                "city": "Los Angeles",
+                "latitude": 34.0522,
+                "longitude": -118.2437,
+                "ip_address": "198.51.100.20",
+                "status": "online",
+                "load": 45,
+                "max_connections": 1000,
+                "current_connections": 450,
+                "created_at": now
+            },
+            {
+                "name": "UK (London)",
+                "country": "United Kingdom",
+                "city": "London",
+                "latitude": 51.5074,
+                "longitude": -0.1278,
+                "ip_address": "198.51.100.30",
+                "status": "online",
+                "load": 60,
+                "max_connections": 800,
+                "current_connections": 480,
+                "created_at": now
+            },
+            {
+                "name": "Germany (Berlin)",
+                "country": "Germany",
+                "city": "Berlin",
+                "latitude": 52.52,
+                "longitude": 13.405,
+                "ip_address": "198.51.100.40",
+                "status": "online",
+                "load": 35,
+                "max_connections": 1200,
+                "current_connections": 420,
+                "created_at": now
+            },
+            {
+                "name": "Japan (Tokyo)",
+                "country": "Japan",
+                "city": "Tokyo",
+                "latitude": 35.6762,
+                "longitude": 139.6503,
+                "ip_address": "198.51.100.50",
+                "status": "maintenance",
+                "load": 0,
+                "max_connections": 600,
+                "current_connections": 0,
+                "created_at": now
+            },
+            {
+                "name": "Singapore",
+                "country": "Singapore",
+                "city": "Singapore",
+                "latitude": 1.3521,
+                "longitude": 103.8198,
+                "ip_address": "198.51.100.60",
+                "status": "online",
+                "load": 80,
+                "max_connections": 500,
+                "current_connections": 400,
+                "created_at": now
+            }
+        ]
+        for server in sample_servers:
+            # Stable ids let concurrent workers upsert the same documents instead of duplicating them
+            server["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"vpn-sample-server:{server['name']}"))
+        if await servers_repo.seed(sample_servers):
+            await server_catalog.bump()
@@ -0,0 +1,141 @@
+"""Admin statistics reconciliation and time-series rollups"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from vpn.config import STREAM_BATCH_SIZE, STATS_WINDOW_DAYS, STATS_RECONCILE_SECONDS, ROLLUP_GRANULARITIES
+from vpn.repositories import (
+    StatsRepository, users_repo, servers_repo, connections_repo, archived_connections_repo,
+    stats_repo, rollups_repo
+)
+from vpn.archive import connection_archiver
+
+logger = logging.getLogger(__name__)
+
+# Admin statistics
+async def reconcile_stats() -> None:
+    """Recount totals and recent day buckets from the source collections to correct drift"""
+    now = datetime.utcnow()
+    start = datetime(now.year, now.month, now.day) - timedelta(days=STATS_WINDOW_DAYS - 1)
+    totals = {
+        "total_users": await users_repo.count(),
+        "total_servers": await servers_repo.count(),
+        "online_servers": await servers_repo.count({"status": "online"}),
+        "active_connections": await connections_repo.count({"status": "active"}),
+        "reconciled_at": now
+    }
+    days = {StatsRepository.day_key(start + timedelta(days=offset)): 0 for offset in range(STATS_WINDOW_DAYS)}
+    days.update(await connections_repo.count_by_day(start))
+    await stats_repo.replace(totals, days)
+
+async def run_stats_reconciler() -> None:
+    while True:
+        await asyncio.sleep(STATS_RECONCILE_SECONDS)
+        try:
+            await reconcile_stats()
+        except Exception:
+            logger.exception("Stats reconciliation failed")
+
+# Time-series rollups
+def compute_rollups(frame, granularity: str, since: datetime, now: datetime) -> List[Dict[str, Any]]:
+    """Vectorized rollup of a connections frame into per-server buckets
+
+    The frame holds server_id, connected_at, disconnected_at (NaT while
+    active) and duration. It must include every connection that overlaps
+    [since, now] so the running concurrency is correct at the window start.
+    peak_concurrent is the most connection rows open at once on the server
+    during the bucket, counting those carried in from earlier buckets, and
+    a bucket is emitted for every period in which a connection was open.
+    """
+    import numpy as np
+    import pandas as pd
+
+    freq = ROLLUP_GRANULARITIES[granularity]
+    if frame.empty:
+        return []
+    since_ts = pd.Timestamp(since)
+
+    started = frame[frame["connected_at"] >= since_ts]
+    connects = started.groupby(["server_id", started["connected_at"].dt.floor(freq)], observed=True).size().rename("connects")
+
+    ended = frame[frame["disconnected_at"] >= since_ts]
+    ended_groups = ended.groupby(["server_id", ended["disconnected_at"].dt.floor(freq)], observed=True)
+    disconnects = ended_groups.size().rename("disconnects")
+    total_duration = ended_groups["duration"].sum().rename("total_duration")
+
+    # Sweep +1/-1 events in time order; disconnects sort first on ties
+    closed = frame.dropna(subset=["disconnected_at"])
+    events = pd.DataFrame({
+        "server_id": np.concatenate([frame["server_id"].to_numpy(), closed["server_id"].to_numpy()]),
+        "time": np.concatenate([frame["connected_at"].to_numpy(), closed["disconnected_at"].to_numpy()]),
+        "delta": np.concatenate([np.ones(len(frame), dtype=np.int64), -np.ones(len(closed), dtype=np.int64)])
+    }).sort_values(["server_id", "time", "delta"], kind="mergesort")
+    events["level"] = events.groupby("server_id", observed=True)["delta"].cumsum()
+
+    # Level each bucket opens with: that after the last event at or before its start
+    starts = pd.date_range(since_ts.floor(freq), pd.Timestamp(now).floor(freq), freq=freq)
+    grid = pd.MultiIndex.from_product(
+        [events["server_id"].unique(), starts], names=["server_id", "time"]
+    ).to_frame(index=False).sort_values("time", kind="mergesort")
+    carried = pd.merge_asof(
+        grid, events.sort_values("time", kind="mergesort")[["server_id", "time", "level"]],
+        on="time", by="server_id"
+    )
+    carried = carried[carried["level"] > 0].set_index(["server_id", "time"])["level"]
+
+    inside = events[events["time"] >= since_ts]
+    inside_peak = inside.groupby(["server_id", inside["time"].dt.floor(freq)], observed=True)["level"].max()
+    peak = pd.concat([carried, inside_peak], axis=1).max(axis=1).rename("peak_concurrent")
+
+    rollup = pd.concat([connects, disconnects, total_duration, peak], axis=1).fillna(0).sort_index()
+    rollup = rollup[rollup.index.get_level_values(1) <= pd.Timestamp(now)]
+    buckets = []
+    for (server_id, bucket), row in zip(rollup.index, rollup.itertuples(index=False)):
+        buckets.append({
+            "server_id": server_id,
+            "granularity": granularity,
+            "bucket": bucket.to_pydatetime(),
+            "connects": int(row.connects),
+            "disconnects": int(row.disconnects),
+            "total_duration": int(row.total_duration),
+            "peak_concurrent": max(0, int(row.peak_concurrent))
+        })
+    return buckets
+
+async def backfill_rollups(since: datetime) -> Dict[str, int]:
+    """Rebuild rollup buckets from connection history since the given time"""
+    import pandas as pd
+
+    now = datetime.utcnow()
+    repositories = [connections_repo]
+    if connection_archiver.reaches_archive(since):
+        repositories.append(archived_connections_repo)
+    columns: Dict[str, list] = {"server_id": [], "connected_at": [], "disconnected_at": [], "duration": []}
+    for repository in repositories:
+        cursor = repository.collection.find(
+            {"$or": [
+                {"connected_at": {"$gte": since}},
+                {"disconnected_at": {"$gte": since}},
+                {"status": "active"}
+            ]},
+            {"_id": 0, "server_id": 1, "connected_at": 1, "disconnected_at": 1, "duration": 1}
+        ).batch_size(STREAM_BATCH_SIZE)
+        async for connection in cursor:
+            for column, values in columns.items():
+                values.append(connection.get(column))
+    frame = pd.DataFrame({
+        "server_id": pd.Series(columns["server_id"], dtype="category"),
+        "connected_at": pd.to_datetime(pd.Series(columns["connected_at"], dtype="object")),
+        "disconnected_at": pd.to_datetime(pd.Series(columns["disconnected_at"], dtype="object")),
+        "duration": pd.to_numeric(pd.Series(columns["duration"], dtype="object")).fillna(0)
+    })
+    del columns
+
+    counts = {}
+    for granularity in ROLLUP_GRANULARITIES:
+        buckets = await asyncio.to_thread(compute_rollups, frame, granularity, since, now)
+        await rollups_repo.replace(buckets)
+        counts[granularity] = len(buckets)
+    return counts
@@ -0,0 +1,143 @@
+"""Token-bucket admission control for connect and login storms"""
+
+import math
+import random
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+from vpn.config import (
+    CONNECT_USER_RATE, CONNECT_USER_BURST, CONNECT_GLOBAL_RATE, CONNECT_GLOBAL_BURST,
+    CONNECT_MAX_IN_FLIGHT, LOGIN_CLIENT_RATE, LOGIN_CLIENT_BURST, LOGIN_GLOBAL_RATE,
+    LOGIN_GLOBAL_BURST, LOGIN_MAX_IN_FLIGHT, THROTTLE_MAX_KEYS
+)
+from vpn.metrics import metrics
+
+# Admission control
+class TokenBucketLimiter:
+    """Keyed token buckets that each cost one float, stored as a theoretical arrival time (GCRA)
+
+    A bucket refilling at `rate` tokens per second and holding `burst`
+    tokens admits a request while its next arrival time is at most `burst`
+    intervals ahead of now. Arrival times live in a preallocated array, so
+    admitting a known key allocates nothing; once `max_keys` keys are
+    tracked the least recently used slot is reused, and an evicted key
+    simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.enabled = rate > 0 and burst > 0
+        self.interval = 1.0 / rate if self.enabled else 0.0
+        self.window = self.interval * burst
+        self.max_keys = max_keys
+        self._arrivals = array("d", bytes(8 * max_keys))
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _slot(self, key: str) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+        if len(self._slots) < self.max_keys:
+            slot = len(self._slots)
+        else:
+            _, slot = self._slots.popitem(last=False)
+        self._slots[key] = slot
+        self._arrivals[slot] = 0.0
+        return slot
+
+    def acquire(self, key: str, now: float) -> float:
+        """Take a token for key; return 0 when admitted, else the seconds until one is available"""
+        if not self.enabled:
+            return 0.0
+        slot = self._slot(key)
+        arrival = max(self._arrivals[slot], now) + self.interval
+        wait = arrival - now - self.window
+        if wait > 0:
+            return wait
+        self._arrivals[slot] = arrival
+        return 0.0
+
+    def release(self, key: str) -> None:
+        """Return a token taken by acquire for a request that did no work"""
+        slot = self._slots.get(key)
+        if self.enabled and slot is not None:
+            self._arrivals[slot] -= self.interval
+
+class RequestThrottle:
+    """Sheds a route's excess load with 429 before it reaches Mongo or the auth provider
+
+    A request needs a free in-flight slot, a token from its caller's
+    bucket and one from the route-wide bucket; otherwise it is rejected at
+    once with Retry-After instead of queueing behind the storm.
+    """
+
+    def __init__(self, name: str, per_key: TokenBucketLimiter, overall: TokenBucketLimiter, max_in_flight: int):
+        self.name = name
+        self.per_key = per_key
+        self.overall = overall
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {"in_flight": 0, "key_rate": 0, "global_rate": 0}
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.shed[reason] += 1
+        metrics.request_throttled(self.name, reason)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many {self.name} requests, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    @asynccontextmanager
+    async def admit(self, key: str):
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self._reject("in_flight", 1)
+        now = time.monotonic()
+        wait = self.per_key.acquire(key, now)
+        if wait:
+            self._reject("key_rate", wait)
+        wait = self.overall.acquire("", now)
+        if wait:
+            self.per_key.release(key)
+            # Spread retries over a refill window so the storm doesn't return in lockstep
+            self._reject("global_rate", wait + random.uniform(0, self.overall.window))
+
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "tracked_keys": len(self.per_key)
+        }
+
+connect_throttle = RequestThrottle(
+    "connect",
+    TokenBucketLimiter(CONNECT_USER_RATE, CONNECT_USER_BURST, THROTTLE_MAX_KEYS),
+    TokenBucketLimiter(CONNECT_GLOBAL_RATE, CONNECT_GLOBAL_BURST),
+    CONNECT_MAX_IN_FLIGHT
+)
+login_throttle = RequestThrottle(
+    "login",
+    TokenBucketLimiter(LOGIN_CLIENT_RATE, LOGIN_CLIENT_BURST, THROTTLE_MAX_KEYS),
+    TokenBucketLimiter(LOGIN_GLOBAL_RATE, LOGIN_GLOBAL_BURST),
+    LOGIN_MAX_IN_FLIGHT
+)
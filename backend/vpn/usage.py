@@ -0,0 +1,193 @@
+"""Traffic usage ingestion from VPN nodes"""
+
+import asyncio
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Header
+from pymongo.errors import BulkWriteError
+
+from vpn.config import (
+    NODE_API_KEY, USAGE_FLUSH_SAMPLES, USAGE_FLUSH_SECONDS, USAGE_BUFFER_MAX_SAMPLES, USAGE_MAX_CLOCK_SKEW_SECONDS
+)
+from vpn.repositories import ServerRepository, ConnectionRepository, servers_repo, connections_repo
+
+logger = logging.getLogger(__name__)
+
+# Usage ingestion
+class UsageIngestor:
+    """Buffers traffic samples from VPN nodes and flushes them to Mongo in bulk
+
+    Samples are summed per connection as they arrive, so a flush writes one
+    update per connection and one per server no matter how many samples
+    were received. Ingestion is refused once the buffer holds
+    USAGE_BUFFER_MAX_SAMPLES unflushed samples.
+
+    A flush that fails without writing (the database is unreachable) puts
+    its samples back for the next flush, so an outage fills the buffer and
+    turns into 429s instead of lost traffic. Per-document write errors are
+    not retried: the other writes in the batch have already been applied.
+    Server totals are retried on their own once connection totals are in.
+    """
+
+    SERVER_CACHE_SIZE = 100000
+
+    def __init__(self, connections: ConnectionRepository, servers: ServerRepository):
+        self.connections = connections
+        self.servers = servers
+        self._buffer: Dict[str, list] = {}
+        self._pending = 0
+        self._unrouted: Dict[str, list] = {}
+        self._server_ids: "OrderedDict[str, str]" = OrderedDict()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.accepted_samples = 0
+        self.rejected_batches = 0
+        self.flushed_samples = 0
+        self.failed_flushes = 0
+        self.retried_samples = 0
+        self.dropped_connections = 0
+
+    def ingest(self, samples: List[Dict[str, Any]]) -> int:
+        if self._pending + len(samples) > USAGE_BUFFER_MAX_SAMPLES:
+            self.rejected_batches += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Usage buffer is full",
+                headers={"Retry-After": str(max(1, int(USAGE_FLUSH_SECONDS)))}
+            )
+        # Validate and sum the whole batch before touching the shared buffer
+        batch: Dict[str, list] = {}
+        latest = time.time() + USAGE_MAX_CLOCK_SKEW_SECONDS
+        try:
+            for sample in samples:
+                connection_id = str(sample["connection_id"])
+                bytes_in = int(sample["bytes_in"])
+                bytes_out = int(sample["bytes_out"])
+                timestamp = float(sample["timestamp"])
+                if bytes_in < 0 or bytes_out < 0:
+                    raise ValueError("byte counts must not be negative")
+                # Also false for NaN, and rejects millisecond epochs as far in the future
+                if not 0 <= timestamp <= latest:
+                    raise ValueError(f"timestamp {timestamp} is not a Unix time in seconds")
+                entry = batch.get(connection_id)
+                if entry is None:
+                    batch[connection_id] = [bytes_in, bytes_out, timestamp]
+                else:
+                    entry[0] += bytes_in
+                    entry[1] += bytes_out
+                    if timestamp > entry[2]:
+                        entry[2] = timestamp
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid usage sample: {e}")
+
+        self._merge(self._buffer, batch)
+        self._pending += len(samples)
+        self.accepted_samples += len(samples)
+        if self._pending >= USAGE_FLUSH_SAMPLES:
+            self._flush_requested.set()
+        return len(samples)
+
+    @staticmethod
+    def _merge(buffer: Dict[str, list], batch: Dict[str, list]) -> None:
+        """Sum [bytes_in, bytes_out, last_timestamp] entries of `batch` into `buffer`"""
+        for connection_id, (bytes_in, bytes_out, timestamp) in batch.items():
+            entry = buffer.get(connection_id)
+            if entry is None:
+                buffer[connection_id] = [bytes_in, bytes_out, timestamp]
+            else:
+                entry[0] += bytes_in
+                entry[1] += bytes_out
+                if timestamp > entry[2]:
+                    entry[2] = timestamp
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._buffer and not self._unrouted:
+                return 0
+            batch, pending = self._buffer, self._pending
+            self._buffer, self._pending = {}, 0
+            try:
+                await self.connections.add_usage(batch)
+            except BulkWriteError as e:
+                # Operations follow the batch order, so each error's index names its connection
+                connection_ids = list(batch)
+                for error in e.details.get("writeErrors", []):
+                    batch.pop(connection_ids[error["index"]], None)
+                self.failed_flushes += 1
+                self.dropped_connections += len(connection_ids) - len(batch)
+                logger.error("Usage flush skipped %d connections: %r",
+                             len(connection_ids) - len(batch), e.details.get("writeErrors", [])[:3])
+            except Exception:
+                self.failed_flushes += 1
+                self.retried_samples += pending
+                self._merge(self._buffer, batch)
+                self._pending += pending
+                logger.exception("Usage flush failed, kept %d samples for the next flush", pending)
+                return 0
+            # Connection totals are in; retry only the server side if that fails
+            self._merge(self._unrouted, batch)
+            try:
+                await self.servers.add_usage(await self._server_totals(self._unrouted))
+                self._unrouted = {}
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Usage flush failed to update server totals for %d connections, will retry",
+                                 len(self._unrouted))
+            self.flushed_samples += pending
+            return pending
+
+    async def run(self) -> None:
+        """Flush whenever the size trigger fires or USAGE_FLUSH_SECONDS elapse"""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=USAGE_FLUSH_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                await self.flush()
+        finally:
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered_samples": self._pending,
+            "buffered_connections": len(self._buffer),
+            "accepted_samples": self.accepted_samples,
+            "flushed_samples": self.flushed_samples,
+            "rejected_batches": self.rejected_batches,
+            "failed_flushes": self.failed_flushes,
+            "retried_samples": self.retried_samples,
+            "dropped_connections": self.dropped_connections,
+            "unrouted_connections": len(self._unrouted)
+        }
+
+    async def _server_totals(self, batch: Dict[str, list]) -> Dict[str, tuple]:
+        missing = [connection_id for connection_id in batch if connection_id not in self._server_ids]
+        if missing:
+            for connection_id, server_id in (await self.connections.server_ids(missing)).items():
+                self._server_ids[connection_id] = server_id
+            while len(self._server_ids) > self.SERVER_CACHE_SIZE:
+                self._server_ids.popitem(last=False)
+        totals: Dict[str, list] = {}
+        for connection_id, (bytes_in, bytes_out, _) in batch.items():
+            server_id = self._server_ids.get(connection_id)
+            if server_id is None:
+                continue
+            total = totals.setdefault(server_id, [0, 0])
+            total[0] += bytes_in
+            total[1] += bytes_out
+        return {server_id: tuple(total) for server_id, total in totals.items()}
+
+usage_ingestor = UsageIngestor(connections_repo, servers_repo)
+
+async def verify_node_key(x_node_key: Optional[str] = Header(None)) -> None:
+    """Authenticate VPN nodes by the shared NODE_API_KEY"""
+    if not NODE_API_KEY:
+        raise HTTPException(status_code=503, detail="Usage ingestion is not configured")
+    if not x_node_key or not hmac.compare_digest(x_node_key, NODE_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid node key")
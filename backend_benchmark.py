@@ -0,0 +1,1058 @@
+"""Local load and latency-regression benchmark for backend/server.py
+
+Runs the FastAPI app in-process against mongomock-motor or a local mongod
+(MONGO_URL), seeds users, servers and connection history, then drives
+concurrent authenticated traffic at every route and reports p50/p95/p99
+latency and throughput per endpoint.
+
+Usage:
+    python backend_benchmark.py                     # in memory, needs: pip install mongomock-motor
+    python backend_benchmark.py --mongo             # local mongod at MONGO_URL
+    python backend_benchmark.py --update-baseline   # store the medians of this run as the baseline
+    python backend_benchmark.py --storm 5           # reconnect storm against admission control
+    python backend_benchmark.py --geo 100000        # IP geolocation and nearest-server lookups
+    python backend_benchmark.py --probe 5000        # one health-probe sweep against local listeners
+    python backend_benchmark.py --ingest 500000     # usage samples/s through POST /api/usage
+    python backend_benchmark.py --drivers 20000     # Motor versus blocking pymongo against MONGO_URL
+    python backend_benchmark.py --fanout 5000       # push fan-out to idle SSE and WebSocket subscribers
+
+The run fails (exit code 1) when an endpoint's p95 latency or throughput
+regresses past --tolerance relative to benchmark_baselines.json, when any
+response has a status other than the one its scenario expects, or when no
+baseline is stored for the backend and workload shape. Each endpoint is
+measured --runs times and compared (and stored) by the median of each
+metric over those runs. A regression must also exceed --floor-ms of added
+latency per request, so routes of a few milliseconds are not failed by
+scheduler noise. Routes that mongomock can only answer by scanning whole
+collections are reported but not gated in memory, where they time
+mongomock rather than the handler; mongod runs gate them. The defaults
+match the committed in-memory baseline; in-memory and mongod runs each
+compare only against their own baseline. Latency runs switch connect and
+login admission control off; --storm runs with the configured limits and
+fails when more connects are admitted than the global token bucket
+allows, or, against mongod, when a wave issues more Mongo commands than
+its admitted connects and authentication account for.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import vpn  # submodules are imported, and configured from the environment, by load_server()
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+NODE_KEY = "benchmark-node-key"
+
+
+class StubAuthProvider(BaseHTTPRequestHandler):
+    """Local stand-in for the Emergent session-data endpoint"""
+
+    def do_GET(self):
+        session_id = self.headers.get("X-Session-ID", "")
+        body = json.dumps({
+            "id": f"login-{session_id}",
+            "email": f"login-{session_id}@benchmark.local",
+            "name": f"Login {session_id}",
+            "session_token": f"login-token-{session_id}"
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_provider():
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), StubAuthProvider)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    return stub
+
+
+def load_server(in_memory):
+    """Import backend/server.py configured for an isolated benchmark database, timing the import"""
+    if in_memory:
+        try:
+            import mongomock_motor
+        except ImportError:
+            sys.exit("In-memory runs need mongomock-motor: pip install mongomock-motor, or pass --mongo")
+        import motor.motor_asyncio
+
+        class InMemoryClient(mongomock_motor.AsyncMongoMockClient):
+            def __init__(self, *args, **kwargs):
+                super().__init__()
+
+        motor.motor_asyncio.AsyncIOMotorClient = InMemoryClient
+
+    started = time.perf_counter()
+    import server
+    import_seconds = time.perf_counter() - started
+
+    if in_memory:
+        # mongomock ignores partialFilterExpression, which would make the
+        # one-active-connection index reject every reconnect
+        vpn.indexes.INDEXES["connections"] = [
+            index for index in vpn.indexes.INDEXES["connections"]
+            if index.document["name"] != "user_id_active_unique"
+        ]
+    return server, import_seconds
+
+
+class VPNBenchmark:
+    def __init__(self, server, import_seconds, args):
+        self.server = server
+        self.import_seconds = import_seconds
+        self.startup_seconds = None
+        self.args = args
+        self.users = []
+        self.admins = []
+        self.server_ids = []
+        self.runs = {}
+        self.results = {}
+
+    async def seed(self):
+        """Insert users, sessions, servers and connection history directly"""
+        db = vpn.db.mongo.db
+        now = datetime.utcnow()
+        print(f"🌱 Seeding {self.args.users} users, {self.args.servers} servers, "
+              f"{self.args.connections} connections...")
+
+        countries = ["United States", "United Kingdom", "Germany", "Japan", "Singapore", "Brazil", "India"]
+        servers = []
+        for i in range(self.args.servers):
+            country = countries[i % len(countries)]
+            servers.append(vpn.models.validate_coordinates({
+                "id": str(uuid.uuid4()),
+                "name": f"{country} #{i}",
+                "country": country,
+                "city": f"City {i}",
+                "ip_address": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                "latitude": (i * 7.3) % 120 - 50,
+                "longitude": (i * 13.7) % 360 - 180,
+                "status": "online" if i % 10 else "maintenance",
+                "load": (i * 37) % 100,
+                "max_connections": 100000,
+                "current_connections": 0,
+                "created_at": now
+            }))
+        await db.servers.insert_many(servers)
+        self.server_ids = [s["id"] for s in servers if s["status"] == "online"]
+
+        users, sessions = [], []
+        for i in range(self.args.users):
+            user_id = f"bench-user-{i}"
+            role = "admin" if i < max(1, self.args.users // 100) else "user"
+            users.append({
+                "id": user_id,
+                "email": f"{user_id}@benchmark.local",
+                "name": f"Benchmark User {i}",
+                "role": role,
+                "created_at": now - timedelta(seconds=i),
+                "last_login": now
+            })
+            token = f"bench-token-{i}"
+            sessions.append({
+                "session_token": token,
+                "user_id": user_id,
+                "created_at": now,
+                "expires_at": now + timedelta(days=7)
+            })
+            (self.admins if role == "admin" else self.users).append(token)
+        await db.users.insert_many(users)
+        await db.sessions.insert_many(sessions)
+
+        history = []
+        for i in range(self.args.connections):
+            connected_at = now - timedelta(minutes=7 * i % (60 * 24 * 30))
+            duration = 60 + i % 3600
+            history.append({
+                "id": str(uuid.uuid4()),
+                "user_id": f"bench-user-{i % self.args.users}",
+                "server_id": self.server_ids[i % len(self.server_ids)],
+                "connected_at": connected_at,
+                "disconnected_at": connected_at + timedelta(seconds=duration),
+                "duration": duration,
+                "status": "disconnected"
+            })
+            if len(history) >= 5000:
+                await db.connections.insert_many(history)
+                history = []
+        if history:
+            await db.connections.insert_many(history)
+
+        await vpn.catalog.server_catalog.bump()
+        await vpn.stats.reconcile_stats()
+
+    # Every scenario answers 200 unless listed; anything else counts as an error
+    EXPECTED_STATUSES = {"POST /api/usage": {202}}
+    # Bound by mongomock's unindexed scans of the seeded connections and users; measured once, gated on mongod only
+    MEMORY_SCAN_BOUND = {
+        "POST /api/auth/profile", "POST connect/disconnect churn", "GET /api/connections/current",
+        "GET /api/connections/history", "POST /api/usage", "GET /api/admin/users"
+    }
+
+    def gated(self, name):
+        return self.args.mongo or name not in self.MEMORY_SCAN_BOUND
+
+    def scenarios(self):
+        """(name, method, path factory, options factory) for every route"""
+        users, admins, server_ids = self.users, self.admins, self.server_ids
+
+        def user(i):
+            return {"Authorization": f"Bearer {users[i % len(users)]}"}
+
+        def admin(i):
+            return {"Authorization": f"Bearer {admins[i % len(admins)]}"}
+
+        def usage_samples(i):
+            return {"samples": [
+                {"connection_id": f"bench-conn-{(i * 100 + j) % 5000}", "bytes_in": 1500, "bytes_out": 700,
+                 "timestamp": time.time()}
+                for j in range(100)
+            ]}
+
+        return [
+            ("GET /", "GET", lambda i: "/", lambda i: {}),
+            ("GET /api/auth/me", "GET", lambda i: "/api/auth/me", lambda i: {"headers": user(i)}),
+            ("POST /api/auth/profile", "POST", lambda i: "/api/auth/profile",
+             lambda i: {"headers": {"X-Session-ID": f"bench-{i}"}}),
+            ("GET /api/servers", "GET", lambda i: "/api/servers", lambda i: {"headers": user(i)}),
+            ("GET /api/servers/countries", "GET", lambda i: "/api/servers/countries",
+             lambda i: {"headers": user(i)}),
+            ("GET /api/servers/recommend", "GET", lambda i: "/api/servers/recommend",
+             lambda i: {"headers": user(i)}),
+            ("GET /api/servers/nearest", "GET", lambda i: f"/api/servers/nearest?lat={i % 120 - 50}&lon={i % 360 - 180}",
+             lambda i: {"headers": user(i)}),
+            ("POST connect/disconnect churn", "CHURN", lambda i: f"/api/servers/{server_ids[i % len(server_ids)]}/connect",
+             lambda i: {"headers": user(i)}),
+            ("GET /api/connections/current", "GET", lambda i: "/api/connections/current",
+             lambda i: {"headers": user(i)}),
+            ("GET /api/connections/history", "GET", lambda i: "/api/connections/history",
+             lambda i: {"headers": user(i)}),
+            ("POST /api/usage", "POST", lambda i: "/api/usage",
+             lambda i: {"headers": {"X-Node-Key": NODE_KEY}, "json": usage_samples(i)}),
+            ("GET /api/admin/users", "GET", lambda i: "/api/admin/users", lambda i: {"headers": admin(i)}),
+            ("GET /api/admin/servers", "GET", lambda i: "/api/admin/servers", lambda i: {"headers": admin(i)}),
+            ("POST /api/admin/servers", "POST", lambda i: "/api/admin/servers",
+             lambda i: {"headers": admin(i), "json": {
+                 "name": f"Bench {i}", "country": "Benchland", "city": "Bench", "ip_address": "192.0.2.1"}}),
+            ("PUT /api/admin/servers/{id}", "PUT", lambda i: f"/api/admin/servers/{server_ids[i % len(server_ids)]}",
+             lambda i: {"headers": admin(i), "json": {"load": i % 100}}),
+            ("GET /api/admin/stats", "GET", lambda i: "/api/admin/stats", lambda i: {"headers": admin(i)}),
+            ("GET /api/admin/stats/timeseries", "GET", lambda i: "/api/admin/stats/timeseries",
+             lambda i: {"headers": admin(i)}),
+            ("PUT /api/admin/users/{id}/role", "PUT", lambda i: f"/api/admin/users/bench-user-{len(admins) + i % len(users)}/role",
+             lambda i: {"headers": admin(i), "json": {"role": "user"}}),
+            # Logs out the users the login scenario created, each from a fresh session
+            ("POST /api/auth/logout", "LOGOUT", lambda i: "/api/auth/logout", lambda i: f"login-bench-{i}"),
+        ]
+
+    async def fresh_session(self, user_id):
+        token = f"bench-logout-{uuid.uuid4().hex}"
+        now = datetime.utcnow()
+        await vpn.db.mongo.collection("sessions").insert_one({
+            "session_token": token, "user_id": user_id, "created_at": now, "expires_at": now + timedelta(days=1)
+        })
+        return token
+
+    async def run_scenario(self, client, name, method, path, options):
+        latencies = []
+        statuses = {}
+        counter = iter(range(self.args.requests))
+
+        async def worker():
+            for i in counter:
+                if method == "LOGOUT":
+                    # Logout ends all of a user's sessions, so every run needs new ones; inserting them is not timed
+                    token = await self.fresh_session(options(i))
+                    kwargs = {"headers": {"Authorization": f"Bearer {token}"}}
+                else:
+                    kwargs = options(i)
+                started = time.perf_counter()
+                if method == "CHURN":
+                    response = await client.post(path(i), **kwargs)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    response = await client.post("/api/connections/disconnect", **kwargs)
+                elif method == "LOGOUT":
+                    response = await client.post(path(i), **kwargs)
+                else:
+                    response = await client.request(method, path(i), **kwargs)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        # Charge deferred usage writes to the scenario that queued them
+        await vpn.usage.usage_ingestor.flush()
+        elapsed = time.perf_counter() - started
+
+        latencies_ms = np.array(latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        expected = self.EXPECTED_STATUSES.get(name, {200})
+        errors = sum(count for status, count in statuses.items() if status not in expected)
+        run = {
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "throughput": round(len(latencies) / elapsed, 1),
+            "errors": errors,
+            "statuses": {str(status): count for status, count in sorted(statuses.items())}
+        }
+        self.runs.setdefault(name, []).append(run)
+        return run
+
+    def summarize(self, name):
+        """Median of each metric over the scenario's runs, with errors and statuses summed"""
+        runs = self.runs[name]
+        statuses = {}
+        for run in runs:
+            for status, count in run["statuses"].items():
+                statuses[status] = statuses.get(status, 0) + count
+        self.results[name] = {
+            **{metric: round(float(np.median([run[metric] for run in runs])), 3)
+               for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput")},
+            "runs": len(runs),
+            "errors": sum(run["errors"] for run in runs),
+            "statuses": dict(sorted(statuses.items()))
+        }
+
+    async def run(self):
+        app = self.server.app
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            self.startup_seconds = time.perf_counter() - started
+            print(f"⏱️  Import {self.import_seconds:.2f}s, startup {self.startup_seconds:.2f}s")
+            try:
+                await self.seed()
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                    if self.args.storm:
+                        return await self.run_storm(client, self.args.storm)
+                    scenarios = self.scenarios()
+                    # Whole rounds, so a slow spell on the machine lands in one run of many routes
+                    for round_number in range(self.args.runs):
+                        print(f"\n🔁 Run {round_number + 1}/{self.args.runs}")
+                        for name, method, path, options in scenarios:
+                            if round_number and not self.gated(name):
+                                continue
+                            print(f"\n🔍 Benchmarking {name}...")
+                            result = await self.run_scenario(client, name, method, path, options)
+                            print(f"   p50 {result['p50_ms']:.2f}ms  p95 {result['p95_ms']:.2f}ms  "
+                                  f"p99 {result['p99_ms']:.2f}ms  {result['throughput']:.0f} req/s  "
+                                  f"statuses {result['statuses']}")
+                        await self.reset_round()
+                    for name in self.runs:
+                        self.summarize(name)
+                    return True
+            finally:
+                await vpn.db.mongo.client.drop_database(vpn.config.MONGO_DB_NAME)
+
+    async def reset_round(self):
+        """Drop the servers a run created, so every run sees the same catalog"""
+        await vpn.db.mongo.collection("servers").delete_many({"country": "Benchland"})
+        await vpn.catalog.server_catalog.bump()
+        await vpn.stats.reconcile_stats()
+
+    def connect_commands(self):
+        """Mongo commands issued so far by the connect route"""
+        return sum(count for (route, _), count in vpn.metrics.metrics.mongo_commands.items()
+                   if route == "/api/servers/{server_id}/connect")
+
+    async def run_storm(self, client, waves, spacing=0.5):
+        """Reconnect every user at once, several times, and check admitted work stays bounded"""
+        throttle = vpn.throttle.connect_throttle
+        overall = throttle.overall
+        print(f"\n🌩️  Reconnect storm: {waves} waves of {len(self.users)} concurrent connects")
+
+        async def connect(i):
+            response = await client.post(f"/api/servers/{self.server_ids[i % len(self.server_ids)]}/connect",
+                                         headers={"Authorization": f"Bearer {self.users[i]}"})
+            if response.status_code == 429 and "retry-after" not in response.headers:
+                raise AssertionError("429 response without Retry-After")
+            return response.status_code
+
+        started = time.perf_counter()
+        admitted = 0
+        over_budget = []
+        session_cache = vpn.auth.session_cache
+        for wave in range(waves):
+            commands_before = self.connect_commands()
+            misses_before = session_cache.misses
+            wave_started = time.perf_counter()
+            statuses = {}
+            for status in await asyncio.gather(*(connect(i) for i in range(len(self.users)))):
+                statuses[status] = statuses.get(status, 0) + 1
+            admitted += statuses.get(200, 0)
+            # Shed requests may only cost their authentication: a session and a user read per cache miss,
+            # plus the session cache's version checks
+            budget = (statuses.get(200, 0) * self.args.storm_commands_per_connect
+                      + 2 * (session_cache.misses - misses_before)
+                      + math.ceil(time.perf_counter() - wave_started) + 1)
+            self.results[f"storm wave {wave}"] = {
+                "seconds": round(time.perf_counter() - wave_started, 3),
+                "mongo_commands": self.connect_commands() - commands_before,
+                "mongo_command_budget": budget,
+                "statuses": {str(status): count for status, count in sorted(statuses.items())}
+            }
+            result = self.results[f"storm wave {wave}"]
+            # mongomock issues no command events, so only a real mongod reports DB work
+            commands = f"{result['mongo_commands']}/{budget}" if self.args.mongo else "n/a"
+            print(f"   wave {wave}: {result['seconds']:.2f}s  mongo commands {commands}  "
+                  f"statuses {result['statuses']}")
+            if self.args.mongo and result["mongo_commands"] > budget:
+                over_budget.append(wave)
+            await asyncio.sleep(spacing)
+
+        elapsed = time.perf_counter() - started
+        print(f"   shed {throttle.shed}")
+        if over_budget:
+            print(f"❌ Waves {over_budget} issued more Mongo commands than "
+                  f"{self.args.storm_commands_per_connect} per admitted connect plus authentication")
+            return False
+        if not overall.enabled:
+            print("⚠️  CONNECT_GLOBAL_RATE is 0, so the global bucket imposes no bound")
+            return True
+        allowed = overall.burst + overall.rate * elapsed
+        if admitted > allowed:
+            print(f"❌ Admitted {admitted} connects, over the {allowed:.0f} the global bucket allows")
+            return False
+        print(f"✅ Admitted {admitted} connects, within the {allowed:.0f} the global bucket allows")
+        return True
+
+    def check_regressions(self, baselines, tolerance, floor_ms):
+        """Compare the run medians against stored baselines and return the regressions found
+
+        A regression has to pass both the relative tolerance and floor_ms of
+        added time per request: on p95 directly, and on throughput through
+        the event loop's time per request (1000 / throughput ms).
+        """
+        regressions = []
+        for name, result in self.results.items():
+            if result["errors"]:
+                regressions.append(f"{name}: {result['errors']} unexpected responses, statuses {result['statuses']}")
+            if not self.gated(name):
+                continue
+            baseline = baselines.get(name)
+            if not baseline:
+                regressions.append(f"{name}: no baseline stored; run with --update-baseline")
+                continue
+            p95_limit = max(baseline["p95_ms"] * (1 + tolerance), baseline["p95_ms"] + floor_ms)
+            if result["p95_ms"] > p95_limit:
+                regressions.append(f"{name}: p95 {result['p95_ms']:.2f}ms > baseline {baseline['p95_ms']:.2f}ms")
+            throughput_limit = min(baseline["throughput"] * (1 - tolerance),
+                                   1000 / (1000 / baseline["throughput"] + floor_ms))
+            if result["throughput"] < throughput_limit:
+                regressions.append(
+                    f"{name}: throughput {result['throughput']:.0f} < baseline {baseline['throughput']:.0f} req/s")
+        return regressions
+
+
+def serialization_benchmark(server, count, rounds=20):
+    """Compare the validated response_model path with the orjson fast path at `count` servers"""
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    now = datetime.utcnow()
+    documents = [{
+        "id": str(uuid.uuid4()),
+        "name": f"Server {i}",
+        "country": f"Country {i % 50}",
+        "city": f"City {i}",
+        "ip_address": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+        "status": "online",
+        "load": i % 100,
+        "max_connections": 1000,
+        "current_connections": i % 1000,
+        "created_at": now
+    } for i in range(count)]
+    history = [{
+        "id": str(uuid.uuid4()),
+        "user_id": "user",
+        "server_id": documents[i % count]["id"],
+        "connected_at": now - timedelta(hours=i),
+        "disconnected_at": now - timedelta(hours=i) + timedelta(minutes=30),
+        "duration": 1800,
+        "status": "disconnected",
+        "server_name": documents[i % count]["name"],
+        "server_country": documents[i % count]["country"]
+    } for i in range(vpn.config.MAX_PAGE_SIZE)]
+    field = create_response_field(name="servers", type_=List[vpn.models.Server])
+
+    async def catalog_reload_before():
+        servers = [vpn.models.Server(**document) for document in documents]
+        json.dumps([s.model_dump(mode="json") for s in servers])
+        return servers
+
+    async def catalog_reload_after():
+        return vpn.catalog.CatalogSnapshot(1, vpn.models.SERVER_LIST_ADAPTER.validate_python(documents))
+
+    servers = asyncio.run(catalog_reload_before())
+    snapshot = asyncio.run(catalog_reload_after())
+
+    async def servers_before():
+        return JSONResponse(await serialize_response(field=field, response_content=servers)).body
+
+    async def servers_after():
+        return vpn.catalog.cached_json(snapshot.body, snapshot.etag).body
+
+    async def history_before():
+        return JSONResponse(jsonable_encoder({"connections": history, "next_cursor": None})).body
+
+    async def history_after():
+        return ORJSONResponse({"connections": history, "next_cursor": None}).body
+
+    assert json.loads(asyncio.run(servers_before())) == json.loads(asyncio.run(servers_after()))
+    assert json.loads(asyncio.run(history_before())) == json.loads(asyncio.run(history_after()))
+
+    def timed(fn):
+        async def repeat():
+            started = time.perf_counter()
+            for _ in range(rounds):
+                await fn()
+            return (time.perf_counter() - started) / rounds * 1000
+        return asyncio.run(repeat())
+
+    print(f"🔍 Serialization at {count} servers / {len(history)} history rows, {rounds} rounds")
+    for name, before, after in [
+        ("catalog reload", catalog_reload_before, catalog_reload_after),
+        ("GET /api/servers body", servers_before, servers_after),
+        ("GET /api/connections/history body", history_before, history_after),
+    ]:
+        before_ms, after_ms = timed(before), timed(after)
+        print(f"   {name}: {before_ms:.2f}ms -> {after_ms:.2f}ms ({before_ms / max(after_ms, 1e-6):.1f}x)")
+
+
+def geo_benchmark(server, lookups, server_count):
+    """Time IP geolocation and nearest-server ranking at `lookups` lookups each"""
+    rng = np.random.default_rng(7)
+    range_size = 4096
+    starts = np.arange(0, 2 ** 32, range_size, dtype=np.int64)
+    latitudes = rng.uniform(-60, 70, len(starts))
+    longitudes = rng.uniform(-180, 180, len(starts))
+    ranges = [(int(start), int(start) + range_size - 1, float(lat), float(lon), "ZZ")
+              for start, lat, lon in zip(starts, latitudes, longitudes)]
+
+    now = datetime.utcnow()
+    documents = [{
+        "id": str(uuid.uuid4()),
+        "name": f"Server {i}",
+        "country": f"Country {i % 50}",
+        "city": f"City {i}",
+        "ip_address": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+        "latitude": float(rng.uniform(-60, 70)),
+        "longitude": float(rng.uniform(-180, 180)),
+        "status": "online",
+        "created_at": now
+    } for i in range(server_count)]
+    snapshot = vpn.catalog.CatalogSnapshot(1, vpn.models.SERVER_LIST_ADAPTER.validate_python(documents))
+
+    def address(value):
+        return f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+    # Uniform addresses almost never share a /24; clustered ones mostly do
+    scattered = [address(int(value)) for value in rng.integers(0, 2 ** 32, lookups)]
+    prefixes = rng.integers(0, 2 ** 24, 1000)
+    clustered = [address(int(prefixes[i % 1000]) << 8 | int(value))
+                 for i, value in enumerate(rng.integers(0, 256, lookups))]
+    points = list(zip(rng.uniform(-60, 70, lookups).tolist(), rng.uniform(-180, 180, lookups).tolist()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "geoip.bin")
+        vpn.geo.write_geoip_database(path, ranges)
+        database = vpn.geo.GeoIPDatabase()
+        database.open(path)
+        locator = vpn.geo.ServerLocator()
+        try:
+            assert database.lookup("0.0.0.1") is not None
+            locator.rank(snapshot, 0.0, 0.0, 5)
+
+            def timed(name, fn, items):
+                started = time.perf_counter()
+                for item in items:
+                    fn(item)
+                elapsed = time.perf_counter() - started
+                print(f"   {name}: {elapsed / len(items) * 1e6:.2f}µs per lookup, {len(items) / elapsed:,.0f}/s")
+
+            print(f"🔍 Geolocation over {len(ranges):,} ranges and nearest of {server_count} servers, "
+                  f"{lookups:,} lookups each")
+            timed("geoip lookup, scattered addresses", database.lookup, scattered)
+            timed("geoip lookup, clustered addresses", database.lookup, clustered)
+            print(f"   /24 cache: {database.hits:,} hits, {database.misses:,} misses")
+            timed("nearest 5 servers", lambda point: locator.rank(snapshot, point[0], point[1], 5), points)
+        finally:
+            database.close()
+
+
+def probe_benchmark(server, server_count, budget):
+    """Time one health-probe sweep over `server_count` servers answered by local TCP listeners
+
+    Servers are spread over 127.0.0.0/8 and a handful of listening ports,
+    with every tenth one pointed at a closed port. Returns whether the sweep
+    finished within `budget` seconds with exactly those servers unreachable.
+    """
+    async def handle(reader, writer):
+        writer.close()
+
+    async def sweep():
+        listeners = [await asyncio.start_server(handle, "0.0.0.0", 0, backlog=1024) for _ in range(8)]
+        ports = [listener.sockets[0].getsockname()[1] for listener in listeners]
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+        servers = [{
+            "id": str(i),
+            "ip_address": f"127.{i // 65536 % 256}.{i // 256 % 256}.{i % 256 or 1}",
+            "probe_port": closed_port if i % 10 == 0 else ports[i % len(ports)],
+            "status": "online",
+            "current_connections": i % 1000,
+            "max_connections": 1000
+        } for i in range(server_count)]
+        try:
+            started = time.perf_counter()
+            latencies = await vpn.health.health_prober.probe_all(
+                [(s["ip_address"], s["probe_port"]) for s in servers]
+            )
+            probed = time.perf_counter() - started
+            now = datetime.utcnow()
+            updates = {s["id"]: vpn.health.HealthProber.plan(s, latency, now) for s, latency in zip(servers, latencies)}
+            return probed, time.perf_counter() - started, latencies, updates
+        finally:
+            for listener in listeners:
+                listener.close()
+                await listener.wait_closed()
+
+    print(f"🩺 Health-probe sweep over {server_count:,} servers, "
+          f"concurrency {vpn.config.HEALTH_PROBE_CONCURRENCY}, timeout {vpn.config.HEALTH_PROBE_TIMEOUT_SECONDS}s")
+    probed, elapsed, latencies, updates = asyncio.run(sweep())
+    reachable = sorted(latency for latency in latencies if latency is not None)
+    unreachable = len(latencies) - len(reachable)
+    expected = (server_count + 9) // 10
+    print(f"   probes: {probed:.2f}s ({server_count / probed:,.0f}/s), with write-back plan: {elapsed:.2f}s")
+    if reachable:
+        print(f"   connect latency p50 {reachable[len(reachable) // 2]:.1f}ms, "
+              f"p99 {reachable[int(len(reachable) * 0.99)]:.1f}ms")
+    print(f"   unreachable: {unreachable} (expected {expected}), "
+          f"offline after this sweep: {sum(u.get('status') == 'offline' for u in updates.values())}")
+    if unreachable != expected:
+        print("❌ Probe results don't match the listeners")
+        return False
+    if elapsed > budget:
+        print(f"❌ Sweep took {elapsed:.2f}s, over the {budget:.2f}s budget")
+        return False
+    return True
+
+
+def ingest_benchmark(server, samples, min_rate, batch_size=1000, connections=10000):
+    """Time POST /api/usage through the ASGI stack, without flushing, at `samples` samples
+
+    This is the per-worker ceiling for node traffic reports: JSON parsing,
+    node-key check, validation and summing into the buffer. Returns whether
+    the rate reached `min_rate` samples/s.
+    """
+    now = time.time()
+    bodies = [orjson.dumps({"samples": [
+        {"connection_id": f"bench-conn-{(start + j) % connections}", "bytes_in": 1500, "bytes_out": 700,
+         "timestamp": now}
+        for j in range(batch_size)
+    ]}) for start in range(0, samples, batch_size)]
+    ingestor = vpn.usage.usage_ingestor
+
+    async def post_all():
+        transport = httpx.ASGITransport(app=server.app)
+        headers = {"X-Node-Key": NODE_KEY, "Content-Type": "application/json"}
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            assert (await client.post("/api/usage", headers=headers, content=bodies[0])).status_code == 202
+            ingestor._buffer.clear()
+            ingestor._pending = 0
+            started = time.perf_counter()
+            for body in bodies:
+                response = await client.post("/api/usage", headers=headers, content=body)
+                if response.status_code != 202:
+                    raise RuntimeError(f"POST /api/usage answered {response.status_code}: {response.text}")
+            return time.perf_counter() - started
+
+    print(f"📈 Usage ingestion of {samples:,} samples in batches of {batch_size} over {connections:,} connections")
+    elapsed = asyncio.run(post_all())
+    rate = samples / elapsed
+    print(f"   POST /api/usage: {rate:,.0f} samples/s ({elapsed / len(bodies) * 1000:.2f}ms per batch), "
+          f"{len(ingestor._buffer):,} connections buffered")
+    started = time.perf_counter()
+    ingestor.ingest(orjson.loads(bodies[0])["samples"])
+    print(f"   ingest() alone: {batch_size / (time.perf_counter() - started):,.0f} samples/s")
+    if rate < min_rate:
+        print(f"❌ Ingestion ran at {rate:,.0f} samples/s, under the {min_rate:,.0f} samples/s floor")
+        return False
+    return True
+
+
+def driver_benchmark(queries, concurrency, documents=10000):
+    """Compare Motor with the blocking pymongo calls the handlers used to make, against MONGO_URL
+
+    Each driver runs `queries` indexed find_one lookups from `concurrency`
+    coroutines on one event loop, the way concurrent requests share a
+    uvicorn worker: Motor awaited, pymongo called straight from the
+    coroutine (the old async-handler path) and pymongo on the default
+    thread pool. A ticker coroutine records the longest event-loop stall,
+    which is what every other request on the worker waits out.
+    """
+    import motor.motor_asyncio
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    url, name = vpn.config.MONGO_URL, f"vpn_driver_benchmark_{uuid.uuid4().hex[:8]}"
+    blocking = MongoClient(url, serverSelectionTimeoutMS=2000, maxPoolSize=concurrency)
+    try:
+        blocking.admin.command("ping")
+    except PyMongoError as exc:
+        print(f"❌ The driver comparison needs a mongod at {url}: {exc}")
+        return False
+    collection = blocking[name].users
+    collection.create_index("id", unique=True)
+    collection.insert_many([{"id": f"user-{i}", "email": f"user-{i}@benchmark.local", "name": f"User {i}"}
+                            for i in range(documents)])
+    ids = [f"user-{i * 7919 % documents}" for i in range(queries)]
+
+    async def measure(lookup):
+        work = iter(ids)
+        stall = 0.0
+
+        async def ticker():
+            nonlocal stall
+            while True:
+                before = time.perf_counter()
+                await asyncio.sleep(0.001)
+                stall = max(stall, time.perf_counter() - before - 0.001)
+
+        async def worker():
+            for user_id in work:
+                await lookup(user_id)
+
+        tick = asyncio.create_task(ticker())
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        tick.cancel()
+        return queries / elapsed, stall * 1000
+
+    async def compare():
+        motor_client = motor.motor_asyncio.AsyncIOMotorClient(url, maxPoolSize=concurrency)
+        motor_users = motor_client[name].users
+
+        async def with_motor(user_id):
+            await motor_users.find_one({"id": user_id}, {"_id": 0})
+
+        async def inline_pymongo(user_id):
+            collection.find_one({"id": user_id}, {"_id": 0})
+
+        async def threaded_pymongo(user_id):
+            await asyncio.to_thread(collection.find_one, {"id": user_id}, {"_id": 0})
+
+        try:
+            await with_motor(ids[0])
+            return [(label, *await measure(lookup)) for label, lookup in (
+                ("motor", with_motor),
+                ("pymongo, blocking the loop", inline_pymongo),
+                ("pymongo on a thread pool", threaded_pymongo),
+            )]
+        finally:
+            motor_client.close()
+
+    print(f"🔌 Driver comparison: {queries:,} find_one by id over {documents:,} users, concurrency {concurrency}")
+    try:
+        results = asyncio.run(compare())
+    finally:
+        blocking.drop_database(name)
+        blocking.close()
+    for label, throughput, stall_ms in results:
+        print(f"   {label}: {throughput:,.0f} queries/s, longest event-loop stall {stall_ms:.1f}ms")
+    return True
+
+
+def fanout_benchmark(server, subscribers, events, budget):
+    """Time push fan-out to `subscribers` idle SSE and WebSocket clients of a real uvicorn server
+
+    The app serves from its own thread and event loop, like a worker
+    process; half the subscribers hold /api/events open and half /api/ws.
+    Each of `events` server events is published on the app's loop and timed
+    until every subscriber has received it. Clients share this process, so
+    the times include their parsing. Returns whether every event reached
+    every subscriber with the slowest fan-out within `budget` seconds.
+    """
+    import resource
+    import uvicorn
+    try:
+        import websockets
+    except ImportError:
+        sys.exit("The fan-out benchmark needs websockets: pip install websockets")
+
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    app_server = uvicorn.Server(uvicorn.Config(
+        server.app, lifespan="on", log_level="warning", ws="websockets", backlog=4096, timeout_keep_alive=600
+    ))
+    app_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=app_loop.run_until_complete, args=(app_server.serve(sockets=[listener]),),
+                              daemon=True)
+    thread.start()
+    while not app_server.started:
+        time.sleep(0.05)
+
+    def on_app_loop(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, app_loop).result()
+
+    users = max(1, subscribers // 10)
+    now = datetime.utcnow()
+
+    async def seed_sessions():
+        db = vpn.db.mongo.db
+        await db.users.insert_many([{"id": f"fanout-user-{i}", "email": f"fanout-{i}@benchmark.local",
+                                     "name": f"Fan-out {i}", "role": "user", "created_at": now}
+                                    for i in range(users)])
+        await db.sessions.insert_many([{"session_token": f"fanout-token-{i}", "user_id": f"fanout-user-{i}",
+                                        "created_at": now, "expires_at": now + timedelta(days=1)}
+                                       for i in range(users)])
+
+    on_app_loop(seed_sessions())
+    bus = vpn.events.event_bus
+    received = [dict() for _ in range(events)]
+
+    async def sse_subscriber(client, i):
+        headers = {"Authorization": f"Bearer fanout-token-{i % users}"}
+        async with client.stream("GET", "/api/events", headers=headers) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    data = json.loads(line[6:])
+                    if data.get("action") == "fanout":
+                        received[data["seq"]][i] = time.perf_counter()
+
+    async def ws_subscriber(i):
+        async with websockets.connect(f"ws://127.0.0.1:{port}/api/ws?token=fanout-token-{i % users}",
+                                      max_queue=None, ping_interval=None, open_timeout=None) as ws:
+            async for message in ws:
+                data = json.loads(message).get("data") or {}
+                if data.get("action") == "fanout":
+                    received[data["seq"]][i] = time.perf_counter()
+
+    async def run():
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                     timeout=httpx.Timeout(None)) as client:
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            tasks = []
+            # Connect in waves so the handshakes do not pile up behind each other
+            for wave in range(0, subscribers, 250):
+                tasks += [asyncio.create_task(sse_subscriber(client, i) if i % 2 == 0 else ws_subscriber(i))
+                          for i in range(wave, min(wave + 250, subscribers))]
+                while bus.subscriber_count < len(tasks):
+                    failed = [task for task in tasks if task.done()]
+                    if failed:
+                        for task in tasks:
+                            task.cancel()
+                        raise RuntimeError(f"{len(failed)} subscribers failed to connect: "
+                                           f"{failed[0].exception()!r}")
+                    await asyncio.sleep(0.05)
+            connected = time.perf_counter() - started
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(f"   {subscribers:,} subscribers connected in {connected:.2f}s, "
+                  f"peak RSS +{(rss_after - rss_before) / 1024:.0f}MB "
+                  f"({(rss_after - rss_before) / subscribers:.1f}KB each, clients and server together)")
+
+            fanouts, publish_ms = [], []
+            for seq in range(events):
+                published = time.perf_counter()
+
+                async def publish(seq=seq):
+                    before = time.perf_counter()
+                    bus.publish("server", {"action": "fanout", "seq": seq})
+                    return (time.perf_counter() - before) * 1000
+
+                publish_ms.append(on_app_loop(publish()))
+                deadline = published + budget * 4
+                while len(received[seq]) < subscribers and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.005)
+                if received[seq]:
+                    fanouts.append(max(received[seq].values()) - published)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return fanouts, publish_ms
+
+    print(f"📣 Push fan-out to {subscribers:,} idle subscribers (half SSE, half WebSocket), {events} events")
+    try:
+        fanouts, publish_ms = asyncio.run(run())
+    finally:
+        app_server.should_exit = True
+        thread.join(timeout=10)
+    missed = sum(subscribers - len(seen) for seen in received)
+    fanouts_ms = np.array(fanouts) * 1000
+    print(f"   publish on the app loop: p50 {np.percentile(publish_ms, 50):.2f}ms, max {max(publish_ms):.2f}ms")
+    if len(fanouts_ms):
+        print(f"   delivered to all: p50 {np.percentile(fanouts_ms, 50):.1f}ms, "
+              f"p99 {np.percentile(fanouts_ms, 99):.1f}ms, max {fanouts_ms.max():.1f}ms")
+    if missed:
+        print(f"❌ {missed:,} deliveries missing across {events} events")
+        return False
+    if fanouts_ms.max() > budget * 1000:
+        print(f"❌ Slowest fan-out took {fanouts_ms.max():.0f}ms, over the {budget * 1000:.0f}ms budget")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and latency-regression benchmark for the VPN API")
+    parser.add_argument("--mongo", action="store_true", help="use the mongod at MONGO_URL instead of mongomock-motor")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--servers", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression fraction")
+    parser.add_argument("--floor-ms", type=float, default=3.0,
+                        help="added latency per request below which no regression is reported")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="runs per gated endpoint; each metric's median over them is compared")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--startup-budget", type=float, default=5.0,
+                        help="fail if importing and starting the app takes longer (seconds)")
+    parser.add_argument("--storm", type=int, metavar="WAVES",
+                        help="only run a reconnect storm of this many waves against admission control")
+    parser.add_argument("--storm-commands-per-connect", type=int, default=20,
+                        help="with --mongo, fail a storm wave issuing more Mongo commands than this per admitted "
+                             "connect plus authentication")
+    parser.add_argument("--geo", type=int, metavar="LOOKUPS",
+                        help="only run the geolocation and nearest-server micro-benchmark (uses --servers)")
+    parser.add_argument("--serialization", type=int, metavar="SERVERS",
+                        help="only run the response serialization micro-benchmark at this many servers")
+    parser.add_argument("--probe", type=int, metavar="SERVERS",
+                        help="only time one health-probe sweep over this many local stand-in servers")
+    parser.add_argument("--probe-budget", type=float, default=10.0,
+                        help="fail if the --probe sweep takes longer (seconds)")
+    parser.add_argument("--drivers", type=int, metavar="QUERIES",
+                        help="only compare Motor with blocking pymongo at this many lookups (needs MONGO_URL)")
+    parser.add_argument("--fanout", type=int, metavar="SUBSCRIBERS",
+                        help="only time push fan-out to this many idle SSE and WebSocket subscribers")
+    parser.add_argument("--fanout-events", type=int, default=50, help="events published in the --fanout run")
+    parser.add_argument("--fanout-budget", type=float, default=3.0,
+                        help="fail if delivering one event to every --fanout subscriber takes longer (seconds)")
+    parser.add_argument("--ingest", type=int, metavar="SAMPLES",
+                        help="only time usage ingestion through POST /api/usage at this many samples")
+    parser.add_argument("--ingest-rate", type=float, default=50000,
+                        help="fail if --ingest accepts fewer samples per second")
+    args = parser.parse_args()
+
+    if args.serialization:
+        serialization_benchmark(load_server(False)[0], args.serialization)
+        return 0
+    if args.geo:
+        geo_benchmark(load_server(False)[0], args.geo, args.servers)
+        return 0
+    if args.probe:
+        return 0 if probe_benchmark(load_server(False)[0], args.probe, args.probe_budget) else 1
+    if args.fanout:
+        os.environ["MONGO_DB_NAME"] = f"vpn_benchmark_{uuid.uuid4().hex[:8]}"
+        os.environ["SEED_SAMPLE_DATA"] = "false"
+        return 0 if fanout_benchmark(load_server(not args.mongo)[0], args.fanout, args.fanout_events,
+                                     args.fanout_budget) else 1
+    if args.drivers:
+        load_server(False)
+        return 0 if driver_benchmark(args.drivers, args.concurrency) else 1
+    if args.ingest:
+        os.environ["NODE_API_KEY"] = NODE_KEY
+        os.environ["USAGE_BUFFER_MAX_SAMPLES"] = str(args.ingest + 1000)
+        return 0 if ingest_benchmark(load_server(False)[0], args.ingest, args.ingest_rate) else 1
+
+    stub = start_stub_provider()
+    os.environ["AUTH_PROVIDER_URL"] = f"http://127.0.0.1:{stub.server_port}/"
+    os.environ["NODE_API_KEY"] = NODE_KEY
+    os.environ["MONGO_DB_NAME"] = f"vpn_benchmark_{uuid.uuid4().hex[:8]}"
+    if not args.storm:
+        # Latency runs measure the handlers, not the limits in front of them
+        for name in ("CONNECT_USER_RATE", "CONNECT_GLOBAL_RATE", "CONNECT_MAX_IN_FLIGHT",
+                     "LOGIN_CLIENT_RATE", "LOGIN_GLOBAL_RATE", "LOGIN_MAX_IN_FLIGHT"):
+            os.environ[name] = "0"
+    # Baselines are only comparable for the same backend and workload shape
+    mode = (f"{'mongo' if args.mongo else 'memory'}/users={args.users},servers={args.servers},"
+            f"connections={args.connections},concurrency={args.concurrency},requests={args.requests}")
+
+    print("🚀 Starting VPN Service API Benchmark")
+    print("=" * 50)
+    benchmark = VPNBenchmark(*load_server(not args.mongo), args)
+    passed = asyncio.run(benchmark.run())
+    stub.shutdown()
+
+    # Import and lifespan startup must stay within budget so workers come up quickly
+    startup_seconds = benchmark.import_seconds + benchmark.startup_seconds
+    if startup_seconds > args.startup_budget:
+        print(f"\n❌ Import + startup took {startup_seconds:.2f}s, over the {args.startup_budget:.2f}s budget")
+        return 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(benchmark.results, f, indent=2)
+    if args.storm:
+        return 0 if passed else 1
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.update_baseline:
+        failing = [name for name, result in benchmark.results.items() if result["errors"]]
+        if failing:
+            print(f"\n❌ Not storing a baseline with unexpected responses from: {', '.join(failing)}")
+            return 1
+        baselines[mode] = {
+            name: {"p95_ms": result["p95_ms"], "throughput": result["throughput"]}
+            for name, result in benchmark.results.items()
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n📝 Stored {mode} baseline in {args.baseline}")
+        return 0
+
+    print("\n" + "=" * 50)
+    if mode not in baselines:
+        print(f"❌ No baseline stored for {mode}; run with --update-baseline to create one")
+        return 1
+
+    regressions = benchmark.check_regressions(baselines[mode], args.tolerance, args.floor_ms)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) past {args.tolerance:.0%} tolerance:")
+        for regression in regressions:
+            print(f"   - {regression}")
+        return 1
+
+    print(f"✅ No regressions against the {mode} baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,6 +29,62 @@ function App() {
     loadServers();
   }, []);
 
+  // Live server load and connection updates pushed by the backend
+  useEffect(() => {
+    if (!user) return;
+
+    const refreshServers = async () => {
+      try {
+        const response = await axios.get('/api/servers');
+        setServers(response.data);
+      } catch (error) {
+        console.error('Error refreshing servers:', error);
+      }
+    };
+
+    const events = new EventSource(`${API_BASE_URL}/api/events`, { withCredentials: true });
+
+    events.addEventListener('server_connections', (event) => {
+      const { server_id, delta } = JSON.parse(event.data);
+      setServers(prev => prev.map(s => 
+        s.id === server_id ? { ...s, current_connections: s.current_connections + delta } : s
+      ));
+    });
+    events.addEventListener('server', refreshServers);
+    events.addEventListener('connection', () => loadCurrentConnection());
+    events.addEventListener('resync', () => {
+      refreshServers();
+      loadCurrentConnection();
+    });
+
+    return () => events.close();
+  }, [user]);
+
+  // Keep the active connection alive so the backend doesn't reap it as stale
+  const connectionId = currentConnection?.id;
+  useEffect(() => {
+    if (!connectionId) return;
+
+    let timer;
+    let cancelled = false;
+    const sendHeartbeat = async () => {
+      let interval = 30;
+      try {
+        const response = await axios.post('/api/connections/heartbeat');
+        interval = response.data.interval_seconds || interval;
+      } catch (error) {
+        console.error('Heartbeat failed:', error);
+      }
+      if (!cancelled) timer = setTimeout(sendHeartbeat, interval * 1000);
+    };
+
+    sendHeartbeat();
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [connectionId]);
+
   // Handle URL fragment authentication (from Emergent auth redirect)
   useEffect(() => {
     const handleAuthFragment = async () => {
@@ -111,6 +167,11 @@ function App() {
       loadServers(); // Refresh server data
     } catch (error) {
       console.error('Connection error:', error);
+      if (error.response?.status === 429) {
+        const retryAfter = error.response.headers['retry-after'] || 'a few';
+        alert(`Too many connection attempts, please retry in ${retryAfter} seconds`);
+        return;
+      }
       alert('Failed to connect to server');
     }
   };
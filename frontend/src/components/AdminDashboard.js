@@ -20,7 +20,9 @@ import {
   AlertCircle,
   CheckCircle,
   Wrench,
-  Crown
+  Crown,
+  Upload,
+  Download
 } from 'lucide-react';
 
 const AdminDashboard = ({ user }) => {
@@ -28,6 +30,9 @@ const AdminDashboard = ({ user }) => {
   const [loading, setLoading] = useState(true);
   const [stats, setStats] = useState({});
   const [users, setUsers] = useState([]);
+  const [usersCursor, setUsersCursor] = useState(null);
+  const [loadingMoreUsers, setLoadingMoreUsers] = useState(false);
+  const [importingServers, setImportingServers] = useState(false);
   const [servers, setServers] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
   const [showCreateServer, setShowCreateServer] = useState(false);
@@ -48,6 +53,7 @@ const AdminDashboard = ({ user }) => {
       
       setStats(statsRes.data);
       setUsers(usersRes.data.users);
+      setUsersCursor(usersRes.data.next_cursor);
       setServers(serversRes.data);
     } catch (error) {
       console.error('Error loading admin data:', error);
@@ -56,6 +62,22 @@ const AdminDashboard = ({ user }) => {
     }
   };
 
+  const loadMoreUsers = async () => {
+    if (!usersCursor) return;
+    try {
+      setLoadingMoreUsers(true);
+      const response = await axios.get('/api/admin/users', {
+        params: { after: usersCursor }
+      });
+      setUsers(prev => [...prev, ...response.data.users]);
+      setUsersCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error loading more users:', error);
+    } finally {
+      setLoadingMoreUsers(false);
+    }
+  };
+
   const updateUserRole = async (userId, newRole) => {
     try {
       await axios.put(`/api/admin/users/${userId}/role`, { role: newRole });
@@ -91,6 +113,34 @@ const AdminDashboard = ({ user }) => {
     }
   };
 
+  const importServers = async (event) => {
+    const file = event.target.files[0];
+    event.target.value = '';
+    if (!file) return;
+
+    setImportingServers(true);
+    try {
+      const formData = new FormData();
+      formData.append('file', file);
+      const response = await axios.post('/api/admin/servers/bulk', formData, {
+        params: { ordered: false }
+      });
+      const { summary, results } = response.data;
+      const problems = results.filter(r => !['created', 'updated', 'deleted'].includes(r.status));
+      await loadAdminData(); // Refresh data
+      alert(
+        `Imported servers: ${summary.created} created, ${summary.updated} updated, ${summary.deleted} deleted` +
+        (problems.length ? `\n${problems.length} rows not applied, first: row ${problems[0].index + 1} ` +
+          `${problems[0].status}${problems[0].error ? ` (${problems[0].error})` : ''}` : '')
+      );
+    } catch (error) {
+      console.error('Error importing servers:', error);
+      alert('Failed to import servers');
+    } finally {
+      setImportingServers(false);
+    }
+  };
+
   const deleteServer = async (serverId) => {
     if (!window.confirm('Are you sure you want to delete this server?')) return;
     
@@ -361,6 +411,18 @@ const AdminDashboard = ({ user }) => {
             ))}
           </div>
 
+          {usersCursor && (
+            <div className="text-center">
+              <button
+                onClick={loadMoreUsers}
+                disabled={loadingMoreUsers}
+                className="btn-secondary"
+              >
+                {loadingMoreUsers ? 'Loading...' : 'Load more users'}
+              </button>
+            </div>
+          )}
+
           {filteredUsers.length === 0 && (
             <div className="text-center py-12">
               <UserX className="w-16 h-16 text-gray-400 mx-auto mb-4" />
@@ -388,6 +450,25 @@ const AdminDashboard = ({ user }) => {
                   className="input-field pl-10 w-64"
                 />
               </div>
+              {/* A plain link lets the browser stream the export straight to disk */}
+              <a
+                href={`${axios.defaults.baseURL}/api/admin/connections/export?format=csv`}
+                className="btn-secondary"
+                download
+              >
+                <Download className="w-4 h-4" />
+                Export Connections
+              </a>
+              <label className={`btn-secondary cursor-pointer ${importingServers ? 'opacity-50 pointer-events-none' : ''}`}>
+                <Upload className="w-4 h-4" />
+                {importingServers ? 'Importing...' : 'Import'}
+                <input
+                  type="file"
+                  accept=".csv,.json,.ndjson,.jsonl"
+                  onChange={importServers}
+                  className="hidden"
+                />
+              </label>
               <button
                 onClick={() => setShowCreateServer(true)}
                 className="btn-primary"
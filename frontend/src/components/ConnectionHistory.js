@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { 
   Clock, 
@@ -16,20 +16,49 @@ import {
 
 const ConnectionHistory = () => {
   const [connections, setConnections] = useState([]);
+  const [summary, setSummary] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [filterPeriod, setFilterPeriod] = useState('all'); // all, today, week, month
   const [sortBy, setSortBy] = useState('recent'); // recent, duration, server
+  // Fixed when the period changes, so later pages share the first page's window
+  const historyParams = useRef({});
 
   useEffect(() => {
     loadConnectionHistory();
-  }, []);
+  }, [filterPeriod]);
+
+  const getPeriodStart = () => {
+    const now = new Date();
+    switch (filterPeriod) {
+      case 'today':
+        return new Date(now.getFullYear(), now.getMonth(), now.getDate());
+      case 'week':
+        return new Date(now.getTime() - 7 * 24 * 60 * 60 * 1000);
+      case 'month':
+        return new Date(now.getTime() - 30 * 24 * 60 * 60 * 1000);
+      default:
+        return null;
+    }
+  };
+
+  const getHistoryParams = () => {
+    const periodStart = getPeriodStart();
+    return periodStart ? { from: periodStart.toISOString() } : {};
+  };
 
   const loadConnectionHistory = async () => {
+    historyParams.current = getHistoryParams();
     try {
       setLoading(true);
-      const response = await axios.get('/api/connections/history');
+      const response = await axios.get('/api/connections/history', {
+        params: historyParams.current
+      });
       setConnections(response.data.connections);
+      setSummary(response.data.summary);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading connection history:', error);
     } finally {
@@ -37,6 +66,22 @@ const ConnectionHistory = () => {
     }
   };
 
+  const loadMoreHistory = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await axios.get('/api/connections/history', {
+        params: { ...historyParams.current, after: nextCursor }
+      });
+      setConnections(prev => [...prev, ...response.data.connections]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error loading more connection history:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatDuration = (seconds) => {
     if (!seconds) return 'N/A';
     
@@ -88,28 +133,11 @@ const ConnectionHistory = () => {
   };
 
   const filterConnections = () => {
-    let filtered = connections.filter(conn => {
-      const matchesSearch = (conn.server_name || '').toLowerCase().includes(searchTerm.toLowerCase()) ||
-                           (conn.server_country || '').toLowerCase().includes(searchTerm.toLowerCase());
-      
-      if (!matchesSearch) return false;
-      
-      const connDate = new Date(conn.connected_at);
-      const now = new Date();
-      
-      switch (filterPeriod) {
-        case 'today':
-          return connDate.toDateString() === now.toDateString();
-        case 'week':
-          const weekAgo = new Date(now.getTime() - 7 * 24 * 60 * 60 * 1000);
-          return connDate >= weekAgo;
-        case 'month':
-          const monthAgo = new Date(now.getTime() - 30 * 24 * 60 * 60 * 1000);
-          return connDate >= monthAgo;
-        default:
-          return true;
-      }
-    });
+    // The period filter is applied by the server; search narrows the loaded pages
+    let filtered = connections.filter(conn => 
+      (conn.server_name || '').toLowerCase().includes(searchTerm.toLowerCase()) ||
+      (conn.server_country || '').toLowerCase().includes(searchTerm.toLowerCase())
+    );
 
     // Sort connections
     filtered.sort((a, b) => {
@@ -129,6 +157,17 @@ const ConnectionHistory = () => {
   const filteredConnections = filterConnections();
 
   const getTotalStats = () => {
+    // Server-side summary covers every matching session, not just the loaded pages
+    if (summary && !searchTerm) {
+      const { session_count, total_duration, unique_servers } = summary;
+      return {
+        totalConnections: session_count,
+        totalDuration: total_duration,
+        uniqueServers: unique_servers,
+        averageDuration: session_count > 0 ? Math.round(total_duration / session_count) : 0
+      };
+    }
+
     const totalConnections = filteredConnections.length;
     const totalDuration = filteredConnections.reduce((sum, conn) => sum + (conn.duration || 0), 0);
     const uniqueServers = new Set(filteredConnections.map(conn => conn.server_id)).size;
@@ -265,7 +304,7 @@ const ConnectionHistory = () => {
         </div>
 
         <div className="mt-4 text-sm text-gray-400">
-          Showing {filteredConnections.length} of {connections.length} connections
+          Showing {filteredConnections.length} of {summary ? summary.session_count : connections.length} connections
         </div>
       </div>
 
@@ -353,6 +392,18 @@ const ConnectionHistory = () => {
               </div>
             </div>
           ))}
+
+          {nextCursor && (
+            <div className="text-center">
+              <button
+                onClick={loadMoreHistory}
+                disabled={loadingMore}
+                className="btn-secondary"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       ) : (
         <div className="text-center py-12">
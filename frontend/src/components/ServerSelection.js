@@ -1,4 +1,5 @@
 import React, { useState, useMemo } from 'react';
+import axios from 'axios';
 import { 
   Globe, 
   MapPin, 
@@ -20,6 +21,22 @@ const ServerSelection = ({ servers, currentConnection, onConnect, onDisconnect }
   const [filterCountry, setFilterCountry] = useState('all');
   const [filterStatus, setFilterStatus] = useState('all');
   const [sortBy, setSortBy] = useState('load'); // load, name, country
+  const [quickConnecting, setQuickConnecting] = useState(false);
+
+  const connectToBestServer = async () => {
+    try {
+      setQuickConnecting(true);
+      const response = await axios.get('/api/servers/recommend', {
+        params: filterCountry === 'all' ? {} : { country: filterCountry }
+      });
+      await onConnect(response.data.id);
+    } catch (error) {
+      console.error('Error finding best server:', error);
+      alert('No server is available right now');
+    } finally {
+      setQuickConnecting(false);
+    }
+  };
 
   // Get unique countries
   const countries = useMemo(() => {
@@ -125,6 +142,32 @@ const ServerSelection = ({ servers, currentConnection, onConnect, onDisconnect }
         </div>
       )}
 
+      {/* Quick Connect */}
+      {!currentConnection && (
+        <div className="mb-8 glass-strong p-6">
+          <div className="flex items-center justify-between">
+            <div className="flex items-center space-x-4">
+              <div className="flex items-center justify-center w-12 h-12 bg-purple-500/20 rounded-xl">
+                <Zap className="w-6 h-6 text-purple-400" />
+              </div>
+              <div>
+                <h3 className="text-lg font-semibold text-white">Quick Connect</h3>
+                <p className="text-gray-300">
+                  {filterCountry === 'all' ? 'Least loaded server worldwide' : `Least loaded server in ${filterCountry}`}
+                </p>
+              </div>
+            </div>
+            <button
+              onClick={connectToBestServer}
+              disabled={quickConnecting}
+              className="btn-primary"
+            >
+              {quickConnecting ? 'Connecting...' : 'Connect'}
+            </button>
+          </div>
+        </div>
+      )}
+
       {/* Filters and Search */}
       <div className="mb-8 glass p-6">
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-4">
@@ -0,0 +1,145 @@
+"""Shared fixtures: the app against in-memory MongoDB, or against mongod when MONGO_URL answers
+
+In-memory runs use mongomock-motor, which ignores partial filter
+expressions and explain plans; anything that depends on those takes the
+`mongod_client` fixture and is skipped when no mongod is reachable.
+"""
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+# Admission control and sample data would make tests order-dependent
+os.environ.update({
+    "SEED_SAMPLE_DATA": "false",
+    "CONNECT_USER_RATE": "0",
+    "CONNECT_GLOBAL_RATE": "0",
+    "CONNECT_MAX_IN_FLIGHT": "0",
+    "LOGIN_CLIENT_RATE": "0",
+    "LOGIN_GLOBAL_RATE": "0",
+    "LOGIN_MAX_IN_FLIGHT": "0",
+    "NODE_API_KEY": "test-node-key",
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo import MongoClient
+
+import server
+from vpn import auth, catalog, db, heartbeats, indexes, usage
+from vpn.config import MONGO_URL
+
+NODE_HEADERS = {"X-Node-Key": "test-node-key"}
+
+_mongod_available = None
+
+
+def mongod_available() -> bool:
+    global _mongod_available
+    if _mongod_available is None:
+        try:
+            MongoClient(MONGO_URL, serverSelectionTimeoutMS=500).admin.command("ping")
+            _mongod_available = True
+        except Exception:
+            _mongod_available = False
+    return _mongod_available
+
+
+def reset_process_state():
+    """Forget per-process caches and buffers left behind by the previous test's database"""
+    catalog.server_catalog._snapshot = None
+    catalog.server_catalog._checked_at = 0.0
+    catalog.server_recommender._snapshot = None
+    auth.session_cache.clear()
+    auth.auth_provider._cache.clear()
+    auth.auth_provider.breaker.record_success()
+    heartbeats.heartbeat_monitor._beats.clear()
+    usage.usage_ingestor._buffer.clear()
+    usage.usage_ingestor._pending = 0
+    usage.usage_ingestor._unrouted.clear()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def in_memory_mongo(monkeypatch):
+    """Give every app started in the test the same in-memory MongoDB, as workers share one mongod"""
+    import mongomock_motor
+
+    shared = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(db, "AsyncIOMotorClient", lambda *args, **kwargs: shared)
+    # mongomock would apply the partial unique index to every row
+    monkeypatch.setitem(indexes.INDEXES, "connections", [
+        index for index in indexes.INDEXES["connections"] if index.document["name"] != "user_id_active_unique"
+    ])
+
+
+@pytest.fixture
+def client(in_memory_mongo):
+    """TestClient for a fresh app on an empty in-memory database"""
+    reset_process_state()
+    app = server.create_app(db.Settings(mongo_db_name=f"vpn_test_{uuid.uuid4().hex[:8]}", seed_sample_data=False))
+    with TestClient(app) as test_client:
+        yield test_client
+    reset_process_state()
+
+
+@pytest.fixture
+def mongod_client():
+    """TestClient for a fresh app on a throwaway database in the mongod at MONGO_URL"""
+    if not mongod_available():
+        pytest.skip(f"no mongod answering at {MONGO_URL}")
+    name = f"vpn_test_{uuid.uuid4().hex[:8]}"
+    reset_process_state()
+    app = server.create_app(db.Settings(mongo_db_name=name, seed_sample_data=False))
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        MongoClient(MONGO_URL).drop_database(name)
+        reset_process_state()
+
+
+def run(client, fn, *args):
+    """Call an async function on the app's event loop"""
+    return client.portal.call(fn, *args)
+
+
+def login(client, user_id="user-1", role="user", email=None):
+    """Insert a user with a live session and return its auth headers"""
+    now = datetime.utcnow()
+
+    async def insert():
+        await db.mongo.collection("users").insert_one({
+            "id": user_id, "email": email or f"{user_id}@example.com", "name": user_id,
+            "role": role, "created_at": now
+        })
+        await db.mongo.collection("sessions").insert_one({
+            "session_token": f"token-{user_id}", "user_id": user_id,
+            "created_at": now, "expires_at": now + timedelta(days=1)
+        })
+
+    run(client, insert)
+    return {"Authorization": f"Bearer token-{user_id}"}
+
+
+def add_servers(client, *servers):
+    """Insert servers with sensible defaults and publish a new catalog version"""
+    now = datetime.utcnow()
+    documents = [{
+        "id": str(uuid.uuid4()), "name": "Server", "country": "Testland", "city": "Test City",
+        "ip_address": "127.0.0.1", "status": "online", "load": 0, "max_connections": 10,
+        "current_connections": 0, "created_at": now, **fields
+    } for fields in servers]
+
+    async def insert():
+        for document in documents:
+            await catalog.servers_repo.create(dict(document))
+        await catalog.server_catalog.bump()
+
+    run(client, insert)
+    return [document["id"] for document in documents]
@@ -0,0 +1,111 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+from tests.conftest import add_servers, login, run
+from vpn import indexes
+from vpn.admission import connection_admission
+from vpn.db import mongo
+
+
+def snapshot(client):
+    async def read():
+        servers = {s["id"]: s["current_connections"] async for s in mongo.collection("servers").find()}
+        active = await mongo.collection("connections").find({"status": "active"}).to_list(None)
+        totals = await mongo.collection("stats").find_one({"_id": "totals"})
+        return servers, active, totals
+    return run(client, read)
+
+
+def test_reconnecting_to_a_full_server_reuses_the_users_slot(client):
+    headers = login(client)
+    other = login(client, "user-2")
+    full, elsewhere = add_servers(client, {"name": "full", "max_connections": 1}, {"name": "elsewhere"})
+
+    assert client.post(f"/api/servers/{full}/connect", headers=headers).status_code == 200
+    assert client.post(f"/api/servers/{full}/connect", headers=headers).status_code == 200
+    assert client.post(f"/api/servers/{full}/connect", headers=other).status_code == 503
+
+    assert client.post(f"/api/servers/{elsewhere}/connect", headers=other).status_code == 200
+    assert client.post(f"/api/servers/{full}/connect", headers=other).status_code == 503
+    servers, active, _ = snapshot(client)
+    assert servers == {full: 1, elsewhere: 1}
+    assert sorted((c["user_id"], c["server_id"]) for c in active) == [("user-1", full), ("user-2", elsewhere)]
+
+
+def test_duplicate_active_connections_are_closed_keeping_the_newest(client):
+    (server_id,) = add_servers(client, {"name": "S", "current_connections": 3})
+    now = datetime.utcnow()
+
+    async def duplicates():
+        await mongo.collection("connections").insert_many([{
+            "id": f"c{i}", "user_id": "user-1", "server_id": server_id, "status": "active",
+            "connected_at": now - timedelta(minutes=i)
+        } for i in range(3)])
+        report = await indexes.close_duplicate_active_connections()
+        assert await mongo.collection("connections").count_documents({"status": "active"}) == 3
+        return report, await indexes.close_duplicate_active_connections(apply=True)
+
+    report, applied = run(client, duplicates)
+    assert report == applied == [{"user_id": "user-1", "keep": "c0", "close": ["c1", "c2"]}]
+    servers, active, _ = snapshot(client)
+    assert [c["id"] for c in active] == ["c0"] and servers == {server_id: 1}
+    closed = run(client, lambda: mongo.collection("connections").find_one({"id": "c2"}))
+    assert closed["close_reason"] == "duplicate" and closed["duration"] >= 120
+
+
+def test_unique_active_index_is_built_once_legacy_duplicates_are_closed(mongod_client):
+    (server_id,) = add_servers(mongod_client, {"name": "S", "current_connections": 2})
+    now = datetime.utcnow()
+
+    async def rebuild():
+        connections = mongo.collection("connections")
+        await connections.drop_index("user_id_active_unique")
+        await connections.insert_many([{
+            "id": f"c{i}", "user_id": "user-1", "server_id": server_id, "status": "active", "connected_at": now
+        } for i in range(2)])
+        assert await indexes.ensure_indexes() == ["connections.user_id_active_unique"]
+        await indexes.close_duplicate_active_connections(apply=True)
+        assert await indexes.ensure_indexes() == []
+        return await connections.index_information()
+
+    assert "user_id_active_unique" in run(mongod_client, rebuild)
+    servers, active, _ = snapshot(mongod_client)
+    assert len(active) == 1 and servers == {server_id: 1}
+
+
+def test_thousands_of_concurrent_connects_keep_counters_consistent(mongod_client):
+    """2000 users connect, switch and disconnect at once over 8 servers with room for 800"""
+    server_ids = add_servers(mongod_client, *({"name": f"S{i}", "max_connections": 100} for i in range(8)))
+    users = [f"user-{i}" for i in range(2000)]
+    rng = random.Random(6)
+    admitted = []
+
+    async def churn(user_id):
+        for _ in range(4):
+            try:
+                if rng.random() < 0.25:
+                    await connection_admission.disconnect(user_id)
+                else:
+                    await connection_admission.connect(user_id, rng.choice(server_ids))
+                    admitted.append(user_id)
+            except HTTPException as exc:
+                assert exc.status_code in (409, 503)
+
+    async def storm():
+        await asyncio.gather(*(churn(user_id) for user_id in users))
+
+    run(mongod_client, storm)
+    servers, active, totals = snapshot(mongod_client)
+
+    per_server = {server_id: 0 for server_id in server_ids}
+    for connection in active:
+        per_server[connection["server_id"]] += 1
+    assert servers == per_server
+    assert all(count <= 100 for count in servers.values())
+    assert len({c["user_id"] for c in active}) == len(active)
+    assert totals["active_connections"] == len(active)
+    # Enough connects got through to fill servers, and enough were refused to prove the cap held
+    assert len(active) > 400 and len(admitted) < 4 * len(users)
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from tests.conftest import login, run
+from vpn import api, auth
+from vpn.auth import AuthProviderClient, CircuitBreaker, SessionCache, session_cache
+from vpn.db import mongo
+from vpn.repositories import meta_repo
+from vpn.throttle import RequestThrottle, TokenBucketLimiter
+
+
+def client_request(host="203.0.113.7"):
+    return Request({"type": "http", "client": (host, 40000), "headers": []})
+
+
+@pytest.fixture
+def provider_server():
+    """A local session-data endpoint; set `status` or `delay` on it to change its answers"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server.requests.append((self.client_address, self.headers["X-Session-ID"]))
+            time.sleep(server.delay)
+            body = json.dumps({"id": "user-1", "email": "user-1@example.com", "name": "User"}).encode()
+            self.send_response(server.status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests, server.status, server.delay = [], 200, 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/session-data"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def provider_status(provider, session_id):
+    try:
+        await provider.get_session_data(session_id)
+    except HTTPException as exc:
+        return exc.status_code
+    return 200
+
+
+def stub_provider(monkeypatch, email="new@example.com"):
+    async def get_session_data(session_id):
+        return {"id": f"user-{session_id}", "email": email, "name": "New User", "session_token": f"token-{session_id}"}
+
+    monkeypatch.setattr(api.auth_provider, "get_session_data", get_session_data)
+
+
+def test_login_creates_the_user_once_and_a_session(client, monkeypatch):
+    stub_provider(monkeypatch)
+
+    first = client.post("/api/auth/profile", headers={"X-Session-ID": "a"})
+    second = client.post("/api/auth/profile", headers={"X-Session-ID": "b"})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["user"]["id"] == second.json()["user"]["id"] == "user-a"
+    me = client.get("/api/auth/me", headers={"Authorization": "Bearer token-b"})
+    assert me.json()["email"] == "new@example.com"
+    assert run(client, lambda: mongo.collection("users").count_documents({})) == 1
+
+
+def test_concurrent_first_logins_share_one_user(client, monkeypatch):
+    stub_provider(monkeypatch)
+
+    async def login_twice():
+        responses = await asyncio.gather(*(
+            api.auth_profile(client_request(), api.Response(), x_session_id=session_id) for session_id in ("a", "b")
+        ))
+        return [response.user.id for response in responses], await mongo.collection("users").count_documents({})
+
+    user_ids, users = run(client, login_twice)
+
+    assert users == 1
+    assert user_ids[0] == user_ids[1]
+
+
+def test_login_limit_follows_the_client_not_its_session_ids(client, monkeypatch):
+    stub_provider(monkeypatch)
+    monkeypatch.setattr(api, "login_throttle", RequestThrottle(
+        "login", TokenBucketLimiter(0.01, 2, 10), TokenBucketLimiter(100, 100), max_in_flight=0
+    ))
+
+    statuses = [client.post("/api/auth/profile", headers={"X-Session-ID": f"s{i}"}).status_code for i in range(3)]
+
+    assert statuses == [200, 200, 429]
+
+
+def test_logout_invalidates_the_cached_session(client):
+    headers = login(client)
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert session_cache.stats()["size"] == 1
+
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_invalidations_from_another_worker_reach_this_cache(client, monkeypatch):
+    monkeypatch.setattr(auth, "SESSION_CACHE_VERSION_CHECK_SECONDS", 0)
+    headers = login(client)
+    assert client.get("/api/auth/me", headers=headers).json()["role"] == "user"
+    other_worker = SessionCache(meta_repo)
+
+    run(client, lambda: mongo.collection("users").update_one({"id": "user-1"}, {"$set": {"role": "admin"}}))
+    run(client, other_worker.invalidate_user, "user-1")
+
+    assert client.get("/api/auth/me", headers=headers).json()["role"] == "admin"
+    assert session_cache.stats()["remote_invalidations"] == 1
+
+
+def test_admin_routes_need_the_admin_role(client):
+    user = login(client, "user")
+    admin = login(client, "admin", role="admin")
+
+    assert client.get("/api/admin/stats", headers=user).status_code == 403
+    assert client.get("/api/admin/stats", headers=admin).status_code == 200
+
+
+def test_circuit_breaker_opens_after_threshold_and_allows_one_trial(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    monkeypatch.setattr(breaker, "opened_at", breaker.opened_at - 31)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.anyio
+async def test_provider_client_pools_its_connection_and_caches_validated_ids(provider_server):
+    provider = AuthProviderClient(url=provider_server.url, timeout=2)
+    try:
+        assert (await provider.get_session_data("a"))["id"] == "user-1"
+        await provider.get_session_data("b")
+        await provider.get_session_data("a")
+    finally:
+        await provider.close()
+
+    assert [session_id for _, session_id in provider_server.requests] == ["a", "b"]
+    assert len({address for address, _ in provider_server.requests}) == 1
+
+
+@pytest.mark.anyio
+async def test_provider_client_maps_rejections_to_401_and_outages_to_503(provider_server):
+    provider = AuthProviderClient(url=provider_server.url, timeout=2)
+    try:
+        provider_server.status = 404
+        assert await provider_status(provider, "a") == 401
+        assert provider.breaker.failures == 0
+
+        provider_server.status = 502
+        assert await provider_status(provider, "a") == 503
+        assert provider.breaker.failures == 1
+
+    finally:
+        await provider.close()
+
+    provider_server.status, provider_server.delay = 200, 0.5
+    impatient = AuthProviderClient(url=provider_server.url, timeout=0.1)
+    try:
+        assert await provider_status(impatient, "a") == 503
+        assert impatient.breaker.failures == 1
+    finally:
+        await impatient.close()
+
+
+@pytest.mark.anyio
+async def test_provider_client_rejects_non_ascii_ids_without_calling_out(provider_server):
+    provider = AuthProviderClient(url=provider_server.url, timeout=2)
+    try:
+        assert await provider_status(provider, "bad\x80\xe9") == 401
+    finally:
+        await provider.close()
+
+    assert provider_server.requests == []
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_half_open_trial_does_not_wedge_the_breaker(provider_server, monkeypatch):
+    provider = AuthProviderClient(url=provider_server.url, timeout=2)
+    provider.breaker.failures = provider.breaker.failure_threshold
+    provider.breaker.opened_at = time.monotonic() - provider.breaker.reset_seconds - 1
+    provider_server.delay = 0.5
+    try:
+        trial = asyncio.ensure_future(provider.get_session_data("a"))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        provider_server.delay = 0
+        assert await provider_status(provider, "b") == 200
+        assert provider.breaker.state == "closed"
+    finally:
+        await provider.close()
+
+
+def test_an_invalidation_during_a_miss_keeps_the_stale_user_out_of_the_cache(client, monkeypatch):
+    headers = login(client)
+    get_by_id = auth.users_repo.get_by_id
+
+    async def read_then_change_role(user_id):
+        # The role change and its invalidation land between the session read and set()
+        user = await get_by_id(user_id)
+        await mongo.collection("users").update_one({"id": user_id}, {"$set": {"role": "admin"}})
+        await session_cache.invalidate_user(user_id)
+        return user
+
+    monkeypatch.setattr(auth.users_repo, "get_by_id", read_then_change_role)
+    assert client.get("/api/auth/me", headers=headers).json()["role"] == "user"
+    monkeypatch.setattr(auth.users_repo, "get_by_id", get_by_id)
+
+    assert session_cache.stats()["size"] == 0
+    assert client.get("/api/auth/me", headers=headers).json()["role"] == "admin"
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from tests.conftest import login
+from vpn.bulk import iter_json_array
+
+
+async def collect(chunks, **kwargs):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+    return [item async for item in iter_json_array(stream(), **kwargs)]
+
+
+@pytest.mark.anyio
+async def test_json_array_items_are_parsed_across_chunk_boundaries():
+    body = json.dumps([{"name": f"S{i}"} for i in range(50)]).encode()
+    chunks = [body[offset:offset + 7] for offset in range(0, len(body), 7)]
+
+    assert await collect(chunks) == [{"name": f"S{i}"} for i in range(50)]
+
+
+@pytest.mark.anyio
+async def test_a_malformed_item_fails_without_reading_the_rest_of_the_upload():
+    read = []
+
+    async def stream():
+        yield b'[{"name": "ok"}, {"name": oops}, '
+        for i in range(10000):
+            read.append(i)
+            yield b'{"name": "padding"}, ' * 10
+
+    items = []
+    with pytest.raises(ValueError, match="Item 1"):
+        async for item in iter_json_array(stream(), max_item_bytes=1024):
+            items.append(item)
+
+    assert items == [{"name": "ok"}]
+    assert len(read) < 10
+
+
+def test_bulk_import_reports_where_a_malformed_array_stopped(client):
+    admin = login(client, "admin", role="admin")
+    body = '[{"name": "A", "country": "C", "city": "X", "ip_address": "10.0.0.1"}, {"name": nope}' + " " * 100000 + "]"
+
+    result = client.post("/api/admin/servers/bulk", headers={**admin, "Content-Type": "application/json"},
+                         content=body).json()
+
+    assert result["aborted"] and result["summary"]["created"] == 1
+    assert result["results"][-1]["index"] == 1 and result["results"][-1]["status"] == "invalid"
@@ -0,0 +1,82 @@
+from tests.conftest import add_servers, login, run
+from vpn.catalog import server_catalog
+from vpn.db import mongo
+
+
+def test_server_list_is_served_with_an_etag_until_the_catalog_changes(client):
+    headers = login(client)
+    add_servers(client, {"name": "A"})
+
+    first = client.get("/api/servers", headers=headers)
+    etag = first.headers["ETag"]
+    assert [server["name"] for server in first.json()] == ["A"]
+    assert client.get("/api/servers", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    add_servers(client, {"name": "B"})
+    changed = client.get("/api/servers", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert sorted(server["name"] for server in changed.json()) == ["A", "B"]
+
+
+def test_countries_are_distinct_and_sorted(client):
+    headers = login(client)
+    add_servers(client, {"country": "Norway"}, {"country": "Chile"}, {"country": "Norway"})
+
+    assert client.get("/api/servers/countries", headers=headers).json() == {"countries": ["Chile", "Norway"]}
+
+
+def test_recommend_picks_the_least_loaded_online_server(client):
+    headers = login(client)
+    add_servers(
+        client,
+        {"name": "busy", "load": 90, "current_connections": 9},
+        {"name": "idle", "load": 10, "current_connections": 1},
+        {"name": "down", "load": 0, "status": "offline"},
+        {"name": "full", "load": 0, "current_connections": 10},
+        {"name": "elsewhere", "load": 0, "country": "Elsewhere"},
+    )
+
+    assert client.get("/api/servers/recommend", headers=headers, params={"country": "Testland"}).json()["name"] == "idle"
+    assert client.get("/api/servers/recommend", headers=headers).json()["name"] == "elsewhere"
+    assert client.get("/api/servers/recommend", headers=headers, params={"country": "Nowhere"}).status_code == 404
+
+
+def test_admin_server_updates_bump_the_catalog(client):
+    admin = login(client, "admin", role="admin")
+    created = client.post("/api/admin/servers", headers=admin, json={
+        "name": "new", "country": "C", "city": "X", "ip_address": "10.0.0.1", "status": "online"
+    }).json()
+    server_id = created["server_id"]
+
+    assert client.put(f"/api/admin/servers/{server_id}", headers=admin, json={"status": "maintenance"}).status_code == 200
+    assert [s["status"] for s in client.get("/api/admin/servers", headers=admin).json()] == ["maintenance"]
+    assert client.get("/api/admin/stats", headers=admin).json()["online_servers"] == 0
+
+    assert client.delete(f"/api/admin/servers/{server_id}", headers=admin).status_code == 200
+    assert client.get("/api/admin/servers", headers=admin).json() == []
+
+
+def test_server_updates_are_validated_before_they_reach_the_catalog(client):
+    admin = login(client, "admin", role="admin")
+    [server_id] = add_servers(client, {"name": "A"})
+
+    bad = client.put(f"/api/admin/servers/{server_id}", headers=admin, json={"max_connections": "lots"})
+    unknown = client.put(f"/api/admin/servers/{server_id}", headers=admin, json={"current_connections": 5})
+    good = client.put(f"/api/admin/servers/{server_id}", headers=admin, json={"max_connections": "20"})
+
+    assert bad.status_code == unknown.status_code == 400
+    assert good.status_code == 200
+    assert client.get("/api/servers", headers=admin).json()[0]["max_connections"] == 20
+
+
+def test_a_malformed_server_document_is_left_out_of_the_catalog(client, caplog):
+    headers = login(client)
+    [good, bad] = add_servers(client, {"name": "good"}, {"name": "bad"})
+    run(client, lambda: mongo.collection("servers").update_one({"id": bad}, {"$set": {"max_connections": "lots"}}))
+    run(client, server_catalog.bump)
+
+    response = client.get("/api/servers", headers=headers)
+
+    assert response.status_code == 200
+    assert [server["id"] for server in response.json()] == [good]
+    assert bad in caplog.text
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+from tests.conftest import add_servers, login, run
+from vpn.db import mongo
+from vpn.heartbeats import heartbeat_monitor
+
+
+def server_counts(client):
+    async def counts():
+        return {s["name"]: s["current_connections"] async for s in mongo.collection("servers").find()}
+    return run(client, counts)
+
+
+def test_connect_switch_and_disconnect_keep_counters_exact(client):
+    headers = login(client)
+    first, second = add_servers(client, {"name": "first"}, {"name": "second"})
+
+    assert client.post(f"/api/servers/{first}/connect", headers=headers).status_code == 200
+    assert client.post(f"/api/servers/{second}/connect", headers=headers).status_code == 200
+    assert server_counts(client) == {"first": 0, "second": 1}
+    assert client.get("/api/connections/current", headers=headers).json()["connection"]["server_name"] == "second"
+
+    assert client.post("/api/connections/disconnect", headers=headers).status_code == 200
+    assert client.post("/api/connections/disconnect", headers=headers).status_code == 400
+    assert server_counts(client) == {"first": 0, "second": 0}
+    assert client.get("/api/connections/current", headers=headers).json() == {"connection": None}
+
+
+def test_connect_is_refused_for_unknown_offline_and_full_servers(client):
+    headers = login(client)
+    offline, full = add_servers(client, {"status": "offline"}, {"max_connections": 1, "current_connections": 1})
+
+    assert client.post("/api/servers/missing/connect", headers=headers).status_code == 404
+    assert client.post(f"/api/servers/{offline}/connect", headers=headers).status_code == 400
+    assert client.post(f"/api/servers/{full}/connect", headers=headers).status_code == 503
+
+
+def test_history_pages_newest_first_with_a_summary(client):
+    headers = login(client)
+    (server_id,) = add_servers(client, {"name": "S"})
+    now = datetime.utcnow()
+
+    async def history():
+        await mongo.collection("connections").insert_many([{
+            "id": f"c{i}", "user_id": "user-1", "server_id": server_id, "status": "disconnected",
+            "connected_at": now - timedelta(hours=i), "disconnected_at": now - timedelta(hours=i) + timedelta(minutes=1),
+            "duration": 60
+        } for i in range(5)])
+
+    run(client, history)
+    page = client.get("/api/connections/history", headers=headers, params={"limit": 3}).json()
+    assert [c["id"] for c in page["connections"]] == ["c0", "c1", "c2"]
+    assert page["summary"] == {"session_count": 5, "total_duration": 300, "unique_servers": 1}
+    assert page["connections"][0]["server_name"] == "S"
+
+    rest = client.get("/api/connections/history", headers=headers, params={"limit": 3, "after": page["next_cursor"]}).json()
+    assert [c["id"] for c in rest["connections"]] == ["c3", "c4"]
+    assert rest["next_cursor"] is None and rest["summary"] is None
+
+
+def test_offset_aware_date_ranges_are_compared_as_utc(client):
+    headers = login(client)
+    admin = login(client, "admin", role="admin")
+    (server_id,) = add_servers(client, {"name": "S"})
+    now = datetime.utcnow()
+
+    async def history():
+        await mongo.collection("connections").insert_one({
+            "id": "c", "user_id": "user-1", "server_id": server_id, "status": "disconnected",
+            "connected_at": now - timedelta(hours=1), "disconnected_at": now, "duration": 3600
+        })
+
+    run(client, history)
+    recent = (now - timedelta(hours=2)).isoformat() + "Z"
+    archived = (now - timedelta(days=365)).isoformat() + "Z"
+    # Half an hour ago at -02:00 would read as before the connection if the offset were dropped
+    later = (now - timedelta(hours=2, minutes=30)).isoformat() + "-02:00"
+
+    for start in (recent, archived):
+        page = client.get("/api/connections/history", headers=headers, params={"from": start})
+        assert page.status_code == 200
+        assert [c["id"] for c in page.json()["connections"]] == ["c"]
+        export = client.get("/api/admin/connections/export", headers=admin, params={"from": start, "format": "ndjson"})
+        assert [line for line in export.text.splitlines() if '"c"' in line]
+
+    page = client.get("/api/connections/history", headers=headers, params={"from": later})
+    assert page.json()["connections"] == []
+
+
+def test_connections_without_heartbeats_are_reaped(client):
+    headers = login(client)
+    (server_id,) = add_servers(client, {"name": "S"})
+    client.post(f"/api/servers/{server_id}/connect", headers=headers)
+
+    async def age_and_reap():
+        old = datetime.utcnow() - timedelta(hours=1)
+        await mongo.collection("connections").update_many({}, {"$set": {"last_heartbeat": old}})
+        return await heartbeat_monitor.reap()
+
+    assert run(client, age_and_reap) == 1
+    assert server_counts(client) == {"S": 0}
+    connection = run(client, lambda: mongo.collection("connections").find_one({}))
+    assert connection["status"] == "disconnected" and connection["close_reason"] == "timeout"
+
+
+def test_heartbeats_are_coalesced_per_user(client):
+    headers = login(client)
+    (server_id,) = add_servers(client, {"name": "S"})
+    client.post(f"/api/servers/{server_id}/connect", headers=headers)
+
+    for _ in range(3):
+        assert client.post("/api/connections/heartbeat", headers=headers).status_code == 200
+
+    assert heartbeat_monitor.stats()["buffered_heartbeats"] == 1
+    assert run(client, heartbeat_monitor.flush) == 1
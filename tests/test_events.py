@@ -0,0 +1,29 @@
+import json
+import time
+
+from tests.conftest import login, run
+from vpn.events import event_bus
+
+
+def wait_for_subscribers(count):
+    deadline = time.monotonic() + 5
+    while event_bus.subscriber_count != count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return event_bus.subscriber_count
+
+
+def test_websocket_delivers_events_and_unsubscribes_when_the_client_closes(client):
+    login(client)
+
+    with client.websocket_connect("/api/ws?token=token-user-1") as websocket:
+        assert wait_for_subscribers(1) == 1
+        run(client, lambda: _publish("server", {"action": "updated", "id": "s-1"}))
+        message = json.loads(websocket.receive_text())
+
+    assert message["type"] == "server"
+    assert message["data"] == {"action": "updated", "id": "s-1"}
+    assert wait_for_subscribers(0) == 0
+
+
+async def _publish(event_type, data):
+    event_bus.publish(event_type, data)
@@ -0,0 +1,74 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from tests.conftest import add_servers, login, run
+from vpn.archive import connection_archiver, write_archive_parquet
+from vpn.db import mongo
+
+
+def insert_connections(client, server_id, *connected_ats):
+    async def insert():
+        await mongo.collection("connections").insert_many([{
+            "id": f"c{i}", "user_id": "user-1", "server_id": server_id, "connected_at": connected_at,
+            "disconnected_at": connected_at + timedelta(minutes=30), "duration": 1800, "status": "disconnected",
+            "close_reason": "user", "bytes_in": 10 * i, "bytes_out": 20 * i, "data_transferred": 30 * i
+        } for i, connected_at in enumerate(connected_ats)])
+    run(client, insert)
+
+
+def export(client, headers, format):
+    response = client.get(f"/api/admin/connections/export?format={format}", headers=headers)
+    assert response.status_code == 200
+    return response.content
+
+
+def test_parquet_export_reads_back_with_server_details(client):
+    headers = login(client, role="admin")
+    (server_id,) = add_servers(client, {"name": "Frankfurt", "country": "Germany"})
+    insert_connections(client, server_id, datetime(2026, 3, 1, 12), datetime(2026, 3, 2, 8, 15, 30))
+
+    table = pq.read_table(io.BytesIO(export(client, headers, "parquet")))
+
+    rows = table.to_pylist()
+    assert [row["id"] for row in rows] == ["c0", "c1"]
+    assert rows[1]["server_name"] == "Frankfurt" and rows[1]["server_country"] == "Germany"
+    assert rows[1]["connected_at"] == datetime(2026, 3, 2, 8, 15, 30)
+    assert rows[1]["data_transferred"] == 30
+
+
+def test_archive_parquet_is_partitioned_by_connected_at_month(tmp_path):
+    connections = [{
+        "id": f"c{day}", "user_id": "u", "server_id": "s", "connected_at": datetime(2026, month, day),
+        "disconnected_at": datetime(2026, month, day, 1), "duration": 3600, "close_reason": "user",
+        "bytes_in": 1, "bytes_out": 2, "data_transferred": 3, "last_usage_at": None, "last_heartbeat": None
+    } for month, day in ((1, 5), (1, 20), (2, 3))]
+
+    assert write_archive_parquet(connections, str(tmp_path), "batch") == 2
+
+    assert sorted(path.parent.name for path in tmp_path.glob("*/batch.parquet")) == ["month=2026-01", "month=2026-02"]
+    january = pd.read_parquet(tmp_path / "month=2026-01" / "batch.parquet")
+    assert list(january["id"]) == ["c5", "c20"]
+    assert january["connected_at"].iloc[0] == pd.Timestamp(2026, 1, 5)
+
+
+def test_rows_caught_mid_archive_are_exported_once(client, monkeypatch):
+    headers = login(client, role="admin")
+    (server_id,) = add_servers(client, {"name": "S"})
+    old = datetime.utcnow() - timedelta(days=200)
+    insert_connections(client, server_id, old, old + timedelta(days=1))
+
+    async def interrupted(connection_ids, archive_id):
+        return 0
+
+    with monkeypatch.context() as patch:
+        patch.setattr(connection_archiver.connections, "delete_archived", interrupted)
+        assert run(client, connection_archiver.archive_old) == 2
+    assert run(client, lambda: mongo.collection("connections").count_documents({})) == 2
+
+    lines = export(client, headers, "ndjson").decode().splitlines()
+
+    assert sorted(json.loads(line)["id"] for line in lines) == ["c0", "c1"]
@@ -0,0 +1,47 @@
+from tests.conftest import add_servers, login
+from vpn.geo import GeoIPDatabase, write_geoip_database
+
+
+def address(text):
+    a, b, c, d = (int(part) for part in text.split("."))
+    return a << 24 | b << 16 | c << 8 | d
+
+
+def database(tmp_path, ranges):
+    path = str(tmp_path / "geoip.bin")
+    write_geoip_database(path, ranges)
+    geoip = GeoIPDatabase()
+    geoip.open(path)
+    return geoip
+
+
+def test_a_prefix_split_by_a_range_boundary_is_never_answered_from_cache(tmp_path):
+    geoip = database(tmp_path, [
+        (address("10.0.0.0"), address("10.0.0.127"), 1.0, 1.0, "AA"),
+        (address("10.0.0.128"), address("10.0.0.199"), 2.0, 2.0, "BB"),
+        (address("10.0.1.0"), address("10.0.1.255"), 3.0, 3.0, "CC"),
+    ])
+    try:
+        answers = [geoip.lookup(f"10.0.0.{host}") for host in (1, 200, 130, 2, 130)]
+        assert [answer.country if answer else None for answer in answers] == ["AA", None, "BB", "AA", "BB"]
+
+        assert geoip.lookup("10.0.1.1").country == geoip.lookup("10.0.1.254").country == "CC"
+        assert geoip.lookup("10.0.2.1") is None and geoip.lookup("10.0.2.2") is None
+        assert geoip.stats()["cached_prefixes"] == 2
+        assert (geoip.hits, geoip.split_prefixes) == (2, 5)
+    finally:
+        geoip.close()
+
+
+def test_nearest_ranks_by_distance_from_the_given_point(client):
+    headers = login(client)
+    add_servers(
+        client,
+        {"name": "Oslo", "latitude": 59.9, "longitude": 10.7},
+        {"name": "Santiago", "latitude": -33.4, "longitude": -70.6},
+        {"name": "Nowhere"},
+    )
+
+    nearest = client.get("/api/servers/nearest", headers=headers, params={"lat": 52.5, "lon": 13.4}).json()
+
+    assert [server["name"] for server in nearest["servers"]] == ["Oslo", "Santiago"]
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from tests.conftest import add_servers, login, run
+from vpn.config import HEALTH_PROBE_FAILURES
+from vpn.db import mongo
+from vpn.health import HealthProber, health_prober
+
+
+def statuses(client):
+    async def read():
+        return {s["name"]: (s["status"], s.get("status_source")) async for s in mongo.collection("servers").find()}
+    return run(client, read)
+
+
+def stub_probe(monkeypatch, latency, during=None):
+    async def probe(host, port):
+        if during:
+            await during()
+        return latency
+
+    monkeypatch.setattr(health_prober, "probe", probe)
+
+
+def test_plan_only_brings_back_servers_the_prober_took_offline():
+    now = datetime.utcnow()
+    admin_offline = {"status": "offline", "status_source": "admin", "max_connections": 10}
+    probe_offline = {"status": "offline", "status_source": "probe", "max_connections": 10}
+    failing = {"status": "online", "status_source": "admin", "probe_failures": HEALTH_PROBE_FAILURES - 1}
+
+    assert "status" not in HealthProber.plan(admin_offline, 3.0, now)
+    assert "status" not in HealthProber.plan({"status": "offline"}, 3.0, now)
+    assert HealthProber.plan(probe_offline, 3.0, now)["status"] == "online"
+    assert HealthProber.plan(failing, None, now)["status_source"] == "probe"
+    assert "status" not in HealthProber.plan({**admin_offline, "probe_failures": 5}, None, now)
+
+
+def test_sweep_leaves_admin_created_offline_servers_offline(client, monkeypatch):
+    headers = login(client, role="admin")
+    created = client.post("/api/admin/servers", headers=headers, json={
+        "name": "new", "country": "Testland", "city": "Test City", "ip_address": "127.0.0.1"
+    })
+    assert created.status_code == 200
+    add_servers(client, {"name": "recovered", "status": "offline", "status_source": "probe"})
+    stub_probe(monkeypatch, 3.0)
+
+    assert run(client, health_prober.sweep)["status_changes"] == 1
+
+    assert statuses(client) == {"new": ("offline", "admin"), "recovered": ("online", "probe")}
+
+
+def test_an_admin_offline_during_a_sweep_wins(client, monkeypatch):
+    headers = login(client, role="admin")
+    (server_id,) = add_servers(client, {"name": "flapping", "status": "offline", "status_source": "probe"})
+
+    async def admin_takes_it_offline():
+        await mongo.collection("servers").update_one(
+            {"id": server_id}, {"$set": {"status": "offline", "status_source": "admin"}}
+        )
+
+    stub_probe(monkeypatch, 3.0, during=admin_takes_it_offline)
+    run(client, health_prober.sweep)
+
+    assert statuses(client) == {"flapping": ("offline", "admin")}
+    response = client.put(f"/api/admin/servers/{server_id}", headers=headers,
+                          json={"status": "offline", "status_source": "probe"})
+    assert response.status_code == 200
+    stub_probe(monkeypatch, 3.0)
+    run(client, health_prober.sweep)
+    assert statuses(client) == {"flapping": ("online", "probe")}
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from tests.conftest import login, run
+from vpn import indexes
+from vpn.db import mongo
+
+
+def test_hot_queries_are_index_backed(mongod_client):
+    headers = login(mongod_client, "admin", role="admin")
+
+    report = mongod_client.get("/api/admin/indexes", headers=headers).json()
+
+    unindexed = [query for query in report["queries"] if not query["indexed"]]
+    assert report["all_indexed"], unindexed
+
+
+def test_explain_hot_queries_covers_every_hot_query(mongod_client):
+    results = run(mongod_client, indexes.explain_hot_queries)
+
+    assert len(results) == len(indexes.HOT_QUERIES)
+    assert all("COLLSCAN" not in result["stages"] for result in results)
+
+
+def test_duplicate_emails_are_reported_then_merged_only_on_apply(client):
+    now = datetime.utcnow()
+
+    async def legacy_duplicates():
+        users = mongo.collection("users")
+        await users.drop_indexes()
+        await users.insert_many([
+            {"id": "first", "email": "dup@example.com", "name": "A", "role": "user", "created_at": now},
+            {"id": "second", "email": "dup@example.com", "name": "A", "role": "admin",
+             "created_at": now + timedelta(seconds=1)},
+            {"id": "other", "email": "other@example.com", "name": "B", "role": "user", "created_at": now},
+        ])
+        await mongo.collection("sessions").insert_one({
+            "session_token": "legacy", "user_id": "second", "created_at": now, "expires_at": now + timedelta(days=1)
+        })
+        await mongo.collection("connections").insert_many([
+            {"id": "done", "user_id": "second", "server_id": "s", "status": "disconnected", "connected_at": now},
+            {"id": "live", "user_id": "second", "server_id": "s", "status": "active", "connected_at": now},
+        ])
+        blocked = await indexes.ensure_indexes()
+        untouched = await users.count_documents({})
+        report = await indexes.merge_duplicate_users()
+        assert await users.count_documents({}) == untouched
+        assert report == await indexes.merge_duplicate_users(apply=True)
+        assert await indexes.ensure_indexes() == []
+        return (
+            blocked,
+            untouched,
+            report,
+            await users.find({}, {"_id": 0, "id": 1, "role": 1}).sort("id").to_list(None),
+            await mongo.collection("sessions").find_one({"session_token": "legacy"}),
+            {c["id"]: c["user_id"] async for c in mongo.collection("connections").find()},
+            await users.index_information(),
+        )
+
+    blocked, untouched, report, users, session, connections, index_info = run(client, legacy_duplicates)
+
+    assert blocked == ["users.email_unique"] and untouched == 3
+    assert report == [{"email": "dup@example.com", "keep": "first", "merge": ["second"], "admin": True}]
+    assert users == [{"id": "first", "role": "admin"}, {"id": "other", "role": "user"}]
+    assert session["user_id"] == "first"
+    assert connections == {"done": "first", "live": "second"}
+    assert index_info["email_unique"]["unique"]
+
+
+def test_ensure_indexes_is_idempotent(client):
+    run(client, indexes.ensure_indexes)
+    run(client, indexes.ensure_indexes)
@@ -0,0 +1,86 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from tests.conftest import login
+from vpn import metrics as metrics_module
+from vpn.metrics import MetricsRegistry, MongoCommandMetrics, RequestTrace, current_trace
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh registry in place of the process-wide one the listener reports to"""
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, "metrics", registry)
+    return registry
+
+
+def command(name, micros=1500):
+    return SimpleNamespace(command_name=name, duration_micros=micros)
+
+
+def sample(text, name, **labels):
+    """The value of one sample line, matching its labels in any order"""
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}\{{(.*)\}} (\S+)", line)
+        if match and dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(1))) == labels:
+            return float(match.group(2))
+    return None
+
+
+def test_mongo_commands_are_charged_to_the_route_serving_them(registry):
+    listener = MongoCommandMetrics()
+    trace = RequestTrace("/api/servers/{server_id}/connect")
+    token = current_trace.set(trace)
+    try:
+        listener.succeeded(command("findAndModify"))
+        listener.succeeded(command("insert"))
+        listener.failed(command("insert"))
+    finally:
+        current_trace.reset(token)
+    listener.succeeded(command("update"))
+
+    text = registry.render()
+
+    assert trace.mongo_commands == 3
+    route = "/api/servers/{server_id}/connect"
+    assert sample(text, "mongodb_commands_total", route=route, command="insert") == 2
+    assert sample(text, "mongodb_command_failures_total", route=route, command="insert") == 1
+    assert sample(text, "mongodb_commands_total", route="background", command="update") == 1
+    assert sample(text, "mongodb_command_duration_seconds_count", route=route, command="findAndModify") == 1
+
+
+def test_render_is_prometheus_text_with_cumulative_buckets(registry):
+    registry.startup_seconds = 0.25
+    for seconds in (0.003, 0.02, 0.02, 30.0):
+        registry.request_started("GET", "/api/servers")
+        registry.request_finished("GET", "/api/servers", 200, seconds, mongo_commands=1)
+    registry.request_throttled("login", 'per "client"')
+
+    text = registry.render()
+
+    assert text.endswith("\n")
+    assert "# TYPE http_requests_total counter" in text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert "app_startup_seconds 0.25" in text.splitlines()
+    labels = {"method": "GET", "route": "/api/servers"}
+    assert sample(text, "http_requests_total", status="200", **labels) == 4
+    assert sample(text, "http_requests_in_flight", **labels) == 0
+    assert sample(text, "http_request_duration_seconds_bucket", le="0.005", **labels) == 1
+    assert sample(text, "http_request_duration_seconds_bucket", le="0.025", **labels) == 3
+    assert sample(text, "http_request_duration_seconds_bucket", le="10.0", **labels) == 3
+    assert sample(text, "http_request_duration_seconds_bucket", le="+Inf", **labels) == 4
+    assert sample(text, "http_request_duration_seconds_count", **labels) == 4
+    assert sample(text, "http_requests_throttled_total", throttle="login", reason='per \\"client\\"') == 1
+
+
+def test_metrics_endpoint_labels_requests_by_route_template(client):
+    admin = login(client, "admin", role="admin")
+    client.put("/api/admin/servers/no-such-server", headers=admin, json={"load": 1})
+
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain")
+    assert sample(response.text, "http_requests_total", method="PUT", route="/api/admin/servers/{server_id}", status="404")
+    assert "no-such-server" not in response.text
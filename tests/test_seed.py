@@ -0,0 +1,55 @@
+import asyncio
+import uuid
+
+from fastapi.testclient import TestClient
+
+import server
+from tests.conftest import reset_process_state, run
+from vpn import db
+from vpn.catalog import server_catalog
+from vpn.db import mongo
+from vpn.repositories import meta_repo
+from vpn.seed import init_sample_data
+
+
+def sample_servers(client):
+    async def read():
+        return await mongo.collection("servers").find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    return run(client, read)
+
+
+def test_concurrent_seeding_inserts_each_sample_server_once(client):
+    async def seed_from_several_workers():
+        await asyncio.gather(*(init_sample_data() for _ in range(5)))
+        return await meta_repo.get_version(server_catalog.VERSION_KEY)
+
+    version = run(client, seed_from_several_workers)
+    servers = sample_servers(client)
+
+    assert len(servers) == 6
+    assert len({server["id"] for server in servers}) == 6
+    assert version >= 1
+
+
+def test_seeding_again_changes_nothing(client):
+    run(client, init_sample_data)
+    first = sample_servers(client)
+    version = run(client, meta_repo.get_version, server_catalog.VERSION_KEY)
+
+    run(client, init_sample_data)
+
+    assert sample_servers(client) == first
+    assert run(client, meta_repo.get_version, server_catalog.VERSION_KEY) == version
+
+
+def test_worker_startups_on_one_database_seed_it_once(in_memory_mongo):
+    settings = db.Settings(mongo_db_name=f"vpn_test_{uuid.uuid4().hex[:8]}", seed_sample_data=True)
+    versions = []
+    for _ in range(2):
+        reset_process_state()
+        with TestClient(server.create_app(settings)) as worker:
+            servers = sample_servers(worker)
+            versions.append(run(worker, meta_repo.get_version, server_catalog.VERSION_KEY))
+
+    assert len(servers) == 6
+    assert versions[0] == versions[1] >= 1
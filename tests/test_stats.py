@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from tests.conftest import add_servers, login, run
+from vpn.db import mongo
+from vpn.stats import backfill_rollups, compute_rollups
+
+
+def frame(*rows):
+    return pd.DataFrame({
+        "server_id": pd.Series([row[0] for row in rows], dtype="category"),
+        "connected_at": pd.to_datetime(pd.Series([row[1] for row in rows], dtype="object")),
+        "disconnected_at": pd.to_datetime(pd.Series([row[2] for row in rows], dtype="object")),
+        "duration": [row[3] for row in rows],
+    })
+
+
+def at(hour, minute=0):
+    return datetime(2026, 1, 1, hour, minute)
+
+
+def test_peaks_carry_open_sessions_into_later_buckets():
+    connections = frame(
+        ("a", at(0, 10), at(4, 30), 15600),
+        ("a", at(1, 5), at(1, 20), 900),
+        ("b", at(2), None, 0),
+    )
+
+    buckets = compute_rollups(connections, "hour", at(1), at(5, 30))
+
+    peaks = {(b["server_id"], b["bucket"].hour): b["peak_concurrent"] for b in buckets}
+    assert peaks == {
+        ("a", 1): 2, ("a", 2): 1, ("a", 3): 1, ("a", 4): 1,
+        ("b", 2): 1, ("b", 3): 1, ("b", 4): 1, ("b", 5): 1,
+    }
+    quiet = next(b for b in buckets if b["server_id"] == "a" and b["bucket"].hour == 3)
+    assert (quiet["connects"], quiet["disconnects"]) == (0, 0)
+
+
+def test_live_peaks_follow_the_slot_counter_and_backfill_makes_them_exact(client):
+    # current_connections of 5 has no connection rows behind it, like seeded sample data
+    (server_id,) = add_servers(client, {"name": "S", "current_connections": 5})
+    users = [login(client, f"user-{i}") for i in range(3)]
+    for headers in users:
+        assert client.post(f"/api/servers/{server_id}/connect", headers=headers).status_code == 200
+    client.post("/api/connections/disconnect", headers=users[0])
+
+    def peaks():
+        return run(client, lambda: mongo.collection("rollups").find({"granularity": "hour"}).to_list(None))
+
+    live = [bucket["peak_concurrent"] for bucket in peaks()]
+    run(client, backfill_rollups, datetime.utcnow() - timedelta(days=1))
+    backfilled = [bucket["peak_concurrent"] for bucket in peaks()]
+
+    assert live == [8]
+    assert backfilled == [3]
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from vpn.throttle import RequestThrottle, TokenBucketLimiter
+
+
+def test_bucket_admits_burst_then_refills_at_rate():
+    limiter = TokenBucketLimiter(rate=2, burst=3, max_keys=10)
+
+    assert [limiter.acquire("k", 100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("k", 100.0) == pytest.approx(0.5)
+    assert limiter.acquire("k", 100.5) == 0.0
+    assert limiter.acquire("other", 100.5) == 0.0
+
+
+def test_release_returns_the_token():
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=1)
+    assert limiter.acquire("k", 0.0) == 0.0
+    limiter.release("k")
+    assert limiter.acquire("k", 0.0) == 0.0
+
+
+def test_least_recently_used_key_is_evicted_with_a_full_bucket():
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    limiter.acquire("a", 0.0)
+    limiter.acquire("b", 0.0)
+    limiter.acquire("c", 0.0)
+
+    assert len(limiter) == 2
+    assert limiter.acquire("a", 0.0) == 0.0
+
+
+def test_zero_rate_disables_the_limit():
+    limiter = TokenBucketLimiter(rate=0, burst=5)
+    assert all(limiter.acquire("k", 0.0) == 0.0 for _ in range(100))
+
+
+@pytest.mark.anyio
+async def test_throttle_sheds_with_retry_after_and_caps_in_flight():
+    throttle = RequestThrottle("test", TokenBucketLimiter(1, 2, 10), TokenBucketLimiter(100, 100), max_in_flight=1)
+
+    async with throttle.admit("u"):
+        with pytest.raises(HTTPException) as busy:
+            async with throttle.admit("v"):
+                pass
+    assert busy.value.status_code == 429 and throttle.shed["in_flight"] == 1
+
+    async with throttle.admit("u"):
+        pass
+    with pytest.raises(HTTPException) as limited:
+        async with throttle.admit("u"):
+            pass
+    assert limited.value.headers["Retry-After"] == "1"
+    assert throttle.stats()["shed"] == {"in_flight": 1, "key_rate": 1, "global_rate": 0}
+
+
+@pytest.mark.anyio
+async def test_global_rejection_gives_back_the_callers_token():
+    throttle = RequestThrottle("test", TokenBucketLimiter(1, 1, 10), TokenBucketLimiter(1, 1), max_in_flight=0)
+    async with throttle.admit("a"):
+        pass
+
+    with pytest.raises(HTTPException):
+        async with throttle.admit("b"):
+            pass
+
+    assert throttle.per_key.acquire("b", time.monotonic()) == 0.0
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from tests.conftest import NODE_HEADERS, add_servers, login, run
+from vpn.db import mongo
+from vpn.usage import usage_ingestor
+
+
+def connect(client):
+    headers = login(client)
+    (server_id,) = add_servers(client, {"name": "S"})
+    client.post(f"/api/servers/{server_id}/connect", headers=headers)
+    connection = client.get("/api/connections/current", headers=headers).json()["connection"]
+    return connection["id"], server_id
+
+
+def sample(connection_id, timestamp=None, size=100):
+    return {"connection_id": connection_id, "bytes_in": size, "bytes_out": size, "timestamp": timestamp or time.time()}
+
+
+def stored(client, collection, item_id):
+    return run(client, lambda: mongo.collection(collection).find_one({"id": item_id}))
+
+
+@pytest.mark.parametrize("timestamp", ["NaN", "Infinity", "-1", str(int(time.time() * 1000))])
+def test_timestamps_that_are_not_unix_seconds_are_rejected(client, timestamp):
+    body = '{"samples": [{"connection_id": "c", "bytes_in": 1, "bytes_out": 1, "timestamp": %s}]}' % timestamp
+
+    response = client.post("/api/usage", headers={**NODE_HEADERS, "Content-Type": "application/json"}, content=body)
+
+    assert response.status_code == 422
+    assert usage_ingestor.stats()["buffered_samples"] == 0
+
+
+def test_samples_are_summed_per_connection_and_flushed(client):
+    connection_id, server_id = connect(client)
+    samples = [sample(connection_id) for _ in range(3)]
+
+    assert client.post("/api/usage", headers=NODE_HEADERS, json={"samples": samples}).json() == {"accepted": 3}
+    assert run(client, usage_ingestor.flush) == 3
+
+    assert stored(client, "connections", connection_id)["data_transferred"] == 600
+    assert stored(client, "servers", server_id)["data_transferred"] == 600
+
+
+def test_a_failed_flush_keeps_its_samples_for_the_next_one(client, monkeypatch):
+    connection_id, server_id = connect(client)
+    client.post("/api/usage", headers=NODE_HEADERS, json={"samples": [sample(connection_id)]})
+
+    async def unreachable(batch):
+        raise AutoReconnect("connection refused")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(usage_ingestor.connections, "add_usage", unreachable)
+        assert run(client, usage_ingestor.flush) == 0
+    client.post("/api/usage", headers=NODE_HEADERS, json={"samples": [sample(connection_id)]})
+
+    assert usage_ingestor.stats()["buffered_samples"] == 2
+    assert run(client, usage_ingestor.flush) == 2
+    assert stored(client, "connections", connection_id)["data_transferred"] == 400
+    assert stored(client, "servers", server_id)["data_transferred"] == 400
+
+
+def test_server_totals_are_retried_without_rewriting_connection_totals(client, monkeypatch):
+    connection_id, server_id = connect(client)
+    client.post("/api/usage", headers=NODE_HEADERS, json={"samples": [sample(connection_id)]})
+
+    async def unreachable(totals):
+        raise AutoReconnect("connection refused")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(usage_ingestor.servers, "add_usage", unreachable)
+        run(client, usage_ingestor.flush)
+    assert usage_ingestor.stats()["unrouted_connections"] == 1
+
+    run(client, usage_ingestor.flush)
+    assert stored(client, "connections", connection_id)["data_transferred"] == 200
+    assert stored(client, "servers", server_id)["data_transferred"] == 200
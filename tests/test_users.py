@@ -0,0 +1,55 @@
+import json
+from datetime import datetime, timedelta
+
+from tests.conftest import login, run
+from vpn.db import mongo
+
+
+def add_users(client, count):
+    """Insert users two to a created_at, so pages have to break ties on id"""
+    start = datetime.utcnow() - timedelta(days=1)
+
+    async def insert():
+        await mongo.collection("users").insert_many([{
+            "id": f"member-{i:02d}", "email": f"member-{i:02d}@example.com", "name": f"Member {i}",
+            "role": "user", "created_at": start + timedelta(minutes=i // 2)
+        } for i in range(count)])
+
+    run(client, insert)
+
+
+def test_user_pages_follow_the_cursor_without_gaps_or_repeats(client):
+    admin = login(client, "admin", role="admin")
+    add_users(client, 7)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"after": cursor} if cursor else {})}
+        page = client.get("/api/admin/users", headers=admin, params=params).json()
+        assert len(page["users"]) <= 3
+        seen.extend(user["id"] for user in page["users"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [f"member-{i:02d}" for i in range(7)] + ["admin"]
+
+
+def test_users_stream_as_ndjson_from_a_cursor(client):
+    admin = login(client, "admin", role="admin")
+    add_users(client, 4)
+    first = client.get("/api/admin/users", headers=admin, params={"limit": 2}).json()
+
+    response = client.get("/api/admin/users", headers=admin, params={"format": "ndjson", "after": first["next_cursor"]})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == ["member-02", "member-03", "admin"]
+    assert "_id" not in rows[0]
+
+
+def test_a_malformed_user_cursor_is_rejected(client):
+    admin = login(client, "admin", role="admin")
+
+    assert client.get("/api/admin/users", headers=admin, params={"after": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/admin/users", headers=admin, params={"format": "csv"}).status_code == 422